@@ -1,54 +1,264 @@
+import sys
 import time
 import json
-import requests
+import random
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+
+import httpx
+
+# Probes the Consumet API mirrors concurrently over pooled keep-alive connections,
+# samples every endpoint several times and ranks the mirrors by latency.
+#
+#   python test_api.py                                   # default mirror
+#   python test_api.py --base https://a.example --base https://b.example --samples 5
+#   python test_api.py --stub                            # offline, against a local stub server
+#   python test_api.py --targets targets.json            # [[name, path_or_url, method?, payload?], ...]
+
+DEFAULT_BASE = "https://consumet-api-yij6.onrender.com"
 
 APIS = [
-    ("Consumet (base)", "https://consumet-api-yij6.onrender.com"),
-    ("Consumet (animekai search naruto)", "https://consumet-api-yij6.onrender.com/anime/animekai/naruto?page=1"),
-    ("Consumet (animekai search one piece)", "https://consumet-api-yij6.onrender.com/anime/animekai/one%20piece?page=1"),
-    ("Consumet (animekai servers ep1)", "https://consumet-api-yij6.onrender.com/anime/animekai/servers/naruto-shippuden-1-episode-1?dub=false"),
+    ("Consumet (base)", "/"),
+    ("Consumet (animekai search naruto)", "/anime/animekai/naruto?page=1"),
+    ("Consumet (animekai search one piece)", "/anime/animekai/one%20piece?page=1"),
+    ("Consumet (animekai servers ep1)", "/anime/animekai/servers/naruto-shippuden-1-episode-1?dub=false"),
 ]
 
-def check_api(name, url, method="GET", payload=None):
-    start = time.time()
-    try:
-        if method == "POST":
-            resp = requests.post(url, json=payload, timeout=10)
-        else:
-            resp = requests.get(url, timeout=10)
-        elapsed = round((time.time() - start) * 1000)
-        ok = 200 <= resp.status_code < 300
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def load_targets(path):
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    targets = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            entry = (entry["name"], entry["url"], entry.get("method", "GET"), entry.get("payload"))
+        targets.append(tuple(entry))
+    return targets
+
+def expand(targets, bases):
+    """(mirror, name, url, method, payload) for every target on every mirror; absolute URLs are kept as-is"""
+    probes = []
+    for base in bases:
+        for entry in targets:
+            name, url = entry[0], entry[1]
+            method = entry[2] if len(entry) > 2 else "GET"
+            payload = entry[3] if len(entry) > 3 else None
+            if not urlsplit(url).scheme:
+                url = base.rstrip("/") + "/" + url.lstrip("/")
+            probes.append((base, name, url, method, payload))
+    return probes
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+async def request_once(client, semaphore, url, method, payload, retries, backoff):
+    """One sample: retried with full-jitter exponential backoff on network errors and 429/5xx.
+
+    A concurrency slot is held per attempt only, never while backing off.
+    """
+    attempt = 0
+    while True:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                if method == "POST":
+                    resp = await client.post(url, json=payload)
+                else:
+                    resp = await client.get(url)
+                elapsed = (time.perf_counter() - start) * 1000
+                if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return resp, elapsed, attempt, None
+            except httpx.HTTPError as e:
+                if attempt >= retries:
+                    return None, None, attempt, f"{type(e).__name__}: {e}"
+        attempt += 1
+        await asyncio.sleep(random.uniform(0, backoff * 2 ** attempt))
+
+async def check_api(client, semaphore, probe, samples, retries, backoff):
+    mirror, name, url, method, payload = probe
+    latencies = []
+    statuses = []
+    errors = []
+    retried = 0
+    sample = None
+    data_ok = False
+
+    samples_done = await asyncio.gather(*(
+        request_once(client, semaphore, url, method, payload, retries, backoff) for _ in range(samples)
+    ))
+    for resp, elapsed, attempts, error in samples_done:
+        retried += attempts
+        if resp is None:
+            errors.append(error)
+            continue
+        statuses.append(resp.status_code)
+        if not 200 <= resp.status_code < 300:
+            errors.append(f"HTTP {resp.status_code}")
+            continue
+        latencies.append(elapsed)
+        if sample is None:
+            try:
+                sample = resp.json()
+                data_ok = True
+            except ValueError:
+                sample = resp.text[:200]
+
+    ok = len(latencies)
+    return {
+        "mirror": mirror,
+        "name": name,
+        "url": url,
+        "status": statuses[-1] if statuses else None,
+        "ok": ok == samples,
+        "json": data_ok,
+        "samples": samples,
+        "succeeded": ok,
+        "retries": retried,
+        "ms": round(percentile(latencies, 50)) if latencies else None,
+        "latency_ms": {
+            "min": round(min(latencies), 1) if latencies else None,
+            "p50": round(percentile(latencies, 50), 1) if latencies else None,
+            "p90": round(percentile(latencies, 90), 1) if latencies else None,
+            "p99": round(percentile(latencies, 99), 1) if latencies else None,
+            "max": round(max(latencies), 1) if latencies else None,
+        },
+        "errors": errors[:5],
+        "sample": sample,
+    }
+
+def rank_mirrors(results):
+    """Mirrors ordered by success rate, then by the median of their endpoints' p50 latency"""
+    by_mirror = {}
+    for res in results:
+        by_mirror.setdefault(res["mirror"], []).append(res)
+
+    ranking = []
+    for mirror, items in by_mirror.items():
+        total = sum(r["samples"] for r in items)
+        succeeded = sum(r["succeeded"] for r in items)
+        p50s = [r["latency_ms"]["p50"] for r in items if r["latency_ms"]["p50"] is not None]
+        ranking.append({
+            "mirror": mirror,
+            "success_rate": round(succeeded / total, 3) if total else 0.0,
+            "median_p50_ms": percentile(p50s, 50),
+        })
+    ranking.sort(key=lambda m: (-m["success_rate"], m["median_p50_ms"] if m["median_p50_ms"] is not None else float("inf")))
+    return ranking
+
+async def probe_all(probes, concurrency, samples, retries, backoff, timeout):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits, follow_redirects=True) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(
+            check_api(client, semaphore, probe, samples, retries, backoff) for probe in probes
+        ))
+
+# --- Offline stub server ---
+
+async def start_stub(delay_ms=20.0, jitter_ms=20.0, fail_rate=0.0):
+    """Minimal HTTP/1.1 keep-alive server answering like Consumet: text on /, JSON elsewhere"""
+    async def handle(reader, writer):
         try:
-            data = resp.json()
-            data_ok = True
-        except Exception:
-            data = resp.text[:200]
-            data_ok = False
-
-        return {
-            "name": name,
-            "status": resp.status_code,
-            "ok": ok,
-            "json": data_ok,
-            "ms": elapsed,
-            "sample": data if data_ok else data
-        }
-    except Exception as e:
-        return {"name": name, "status": None, "ok": False, "json": False, "ms": None, "error": str(e)}
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    if key.strip().lower() == "content-length":
+                        length = int(value.strip())
+                if length:
+                    await reader.readexactly(length)
+
+                path = request_line.decode("latin-1").split(" ")[1]
+                await asyncio.sleep((delay_ms + random.uniform(0, jitter_ms)) / 1000)
+                if random.random() < fail_rate:
+                    status, ctype, body = "503 Service Unavailable", "text/plain", b"busy"
+                elif path == "/":
+                    status, ctype, body = "200 OK", "text/plain", "Welcome to consumet api! 🎉 \n".encode("utf-8")
+                else:
+                    status, ctype = "200 OK", "application/json"
+                    body = json.dumps({"currentPage": 1, "hasNextPage": False, "results": [], "path": path}).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}"
+
+async def run(args):
+    targets = load_targets(args.targets) if args.targets else APIS
+    bases = args.base or [DEFAULT_BASE]
+
+    stub = None
+    if args.stub:
+        stub, stub_base = await start_stub(args.stub_delay, args.stub_jitter, args.stub_fail_rate)
+        bases = [stub_base]
+
+    try:
+        started = time.perf_counter()
+        results = await probe_all(
+            expand(targets, bases), args.concurrency, args.samples, args.retries, args.backoff, args.timeout
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        if stub is not None:
+            stub.close()
+            await stub.wait_closed()
+
+    return list(results), rank_mirrors(results), elapsed
 
 def main():
-    results = []
-    for entry in APIS:
-        if len(entry) == 2:
-            name, url = entry
-            res = check_api(name, url)
-        else:
-            name, url, method, payload = entry
-            res = check_api(name, url, method, payload)
-        results.append(res)
-
-    with open("responses.json", "w", encoding="utf-8") as f:
+    parser = argparse.ArgumentParser(description="Concurrent health/latency prober for the Consumet API mirrors")
+    parser.add_argument("--base", action="append", help="Mirror base URL (repeatable; default: %s)" % DEFAULT_BASE)
+    parser.add_argument("--targets", help="JSON file with [name, path_or_url, method?, payload?] entries")
+    parser.add_argument("--samples", type=int, default=3, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max requests in flight (and pooled connections)")
+    parser.add_argument("--retries", type=int, default=2, help="Retries per request on errors / 429 / 5xx")
+    parser.add_argument("--backoff", type=float, default=0.25, help="Base backoff in seconds (full jitter)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds")
+    parser.add_argument("--out", default="responses.json", help="Where to write the detailed results")
+    parser.add_argument("--stub", action="store_true", help="Probe a local stub server instead (offline)")
+    parser.add_argument("--stub-delay", type=float, default=20.0, help="Stub response delay in ms")
+    parser.add_argument("--stub-jitter", type=float, default=20.0, help="Extra random stub delay in ms")
+    parser.add_argument("--stub-fail-rate", type=float, default=0.0, help="Fraction of stub replies that are 503")
+    args = parser.parse_args()
+
+    results, ranking, elapsed = asyncio.run(run(args))
+
+    with open(args.out, "w", encoding="utf-8") as f:
         f.write(json.dumps(results, indent=2, ensure_ascii=False))
 
+    total = sum(r["samples"] for r in results)
+    print(f"{total} requests to {len(results)} endpoints in {elapsed:.2f}s")
+    for res in results:
+        lat = res["latency_ms"]
+        status = "OK  " if res["ok"] else "FAIL"
+        print(f"  {status} {res['name']} [{res['mirror']}] {res['succeeded']}/{res['samples']} "
+              f"p50={lat['p50']}ms p90={lat['p90']}ms p99={lat['p99']}ms retries={res['retries']}")
+    print("Mirrors (best first):")
+    for m in ranking:
+        print(f"  {m['mirror']}: success={m['success_rate']:.0%} median p50={m['median_p50_ms']}ms")
+
+    if not ranking or ranking[0]["success_rate"] == 0:
+        sys.exit(1)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -26,6 +26,9 @@
         if (DEV) console.log('[ResilientMenu Debug]', ...args);
     }
 
+    // Constructor of async functions (no global name), used to compile tool code
+    const AsyncFunction = Object.getPrototypeOf(async function () {}).constructor;
+
     // UA Spoofer (Must run early)
     const FAKE_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36';
     try {
@@ -553,7 +556,8 @@
                     useCORS: true,
                     logging: false
                 });
-                const screenshot = canvas.toDataURL('image/png');
+                // Binary PNG: no base64 inflation on the wire
+                const screenshot = await new Promise(resolve => canvas.toBlob(resolve, 'image/png'));
 
                 // Capture DOM
                 const html = document.documentElement.outerHTML;
@@ -561,15 +565,17 @@
                 // Restore menu
                 this.container.style.display = 'flex';
 
+                const form = new FormData();
+                form.append('html', new Blob([html], { type: 'text/html' }), 'page.html');
+                if (screenshot) form.append('screenshot', screenshot, 'screenshot.png');
+                form.append('url', location.href);
+                form.append('title', document.title);
+
                 // Send to server
                 GM_xmlhttpRequest({
                     method: "POST",
                     url: "http://127.0.0.1:8080/snapshot",
-                    headers: { "Content-Type": "application/json" },
-                    data: JSON.stringify({
-                        html: html,
-                        screenshot: screenshot
-                    }),
+                    data: form,
                     onload: (res) => {
                         if (res.status === 200) {
                             this.showToast('Snapshot Saved!', 'success');
@@ -591,6 +597,154 @@
         }
     }
 
+    // Tool results that travel as a raw binary frame instead of JSON
+    class BinaryResult {
+        constructor(blob, meta) {
+            this.blob = blob;
+            this.meta = meta;
+        }
+    }
+
+    // Opt-in replica of the page on the server: one full serialization (MIRROR_INIT), then
+    // MutationObserver changes coalesced into numbered MIRROR_DIFF frames
+    class DomMirror {
+        constructor(engine) {
+            this.engine = engine;
+            this.active = false;
+            this.observer = null;
+            this.gen = 0;
+            this.seq = 0;
+            this.flushDelay = 50;
+            this.timer = null;
+            // Frames are sent strictly in order (compressing a large one must not let a later diff overtake it)
+            this.outbox = Promise.resolve();
+            this.reset();
+        }
+
+        reset() {
+            this.ids = new WeakMap();     // node -> mirror id
+            this.parents = new WeakMap(); // node -> id of the parent it was last sent under
+            this.nextId = 1;
+            this.dirtyParents = new Set();
+            this.dirtyAttrs = new Map();  // element -> Set of attribute names
+            this.dirtyText = new Set();
+            this.removed = new Set();
+        }
+
+        async start() {
+            this.stop();
+            this.active = true;
+            this.gen = Math.max(this.gen + 1, Date.now());
+            this.seq = 0;
+            this.observer = new MutationObserver(records => this.collect(records));
+            this.observer.observe(document.documentElement, {
+                subtree: true,
+                childList: true,
+                attributes: true,
+                characterData: true
+            });
+            const root = this.serialize(document.documentElement, 0);
+            debugLog(`[DomMirror] Sending snapshot (${this.nextId - 1} nodes)`);
+            await this.post({ type: 'MIRROR_INIT', gen: this.gen, seq: 0, url: location.href, root: root });
+        }
+
+        post(frame) {
+            const sent = this.outbox.then(() => this.engine.send(frame));
+            this.outbox = sent.catch(e => console.error('[DomMirror] Send failed:', e));
+            return this.outbox;
+        }
+
+        stop() {
+            this.active = false;
+            if (this.observer) this.observer.disconnect();
+            this.observer = null;
+            clearTimeout(this.timer);
+            this.timer = null;
+            this.reset();
+        }
+
+        // Script/style sources are not mirrored, and neither is our own UI
+        children(el) {
+            if (['script', 'style', 'noscript', 'template'].includes(el.localName)) return [];
+            return Array.from(el.childNodes).filter(node =>
+                node.nodeType === 3 || (node.nodeType === 1 && node.id !== 'resilient-menu-container' && !node.classList.contains('toastify')));
+        }
+
+        serialize(node, parentId) {
+            let id = this.ids.get(node);
+            if (!id) {
+                id = this.nextId++;
+                this.ids.set(node, id);
+            }
+            this.parents.set(node, parentId);
+            if (node.nodeType === 3) return { i: id, x: node.data };
+            const attrs = {};
+            for (const attr of node.attributes) attrs[attr.name] = attr.value;
+            return { i: id, t: node.localName, a: attrs, c: this.children(node).map(child => this.serialize(child, id)) };
+        }
+
+        collect(records) {
+            for (const record of records) {
+                if (this.engine.isOwnMutation(record)) continue;
+                if (record.type === 'childList') {
+                    this.dirtyParents.add(record.target);
+                    record.removedNodes.forEach(node => this.removed.add(node));
+                } else if (record.type === 'attributes') {
+                    if (!this.dirtyAttrs.has(record.target)) this.dirtyAttrs.set(record.target, new Set());
+                    this.dirtyAttrs.get(record.target).add(record.attributeName);
+                } else {
+                    this.dirtyText.add(record.target);
+                }
+            }
+            if (!this.timer) this.timer = setTimeout(() => this.flush(), this.flushDelay);
+        }
+
+        // Also called before every reply and PONG, so the server never sees a result
+        // before the DOM changes that led to it
+        async flush() {
+            clearTimeout(this.timer);
+            this.timer = null;
+            if (!this.active) return;
+            this.collect(this.observer.takeRecords());
+            clearTimeout(this.timer);
+            this.timer = null;
+
+            const parents = this.dirtyParents, attrs = this.dirtyAttrs, texts = this.dirtyText;
+            // Removed nodes lose their place: if they come back they are sent in full
+            this.removed.forEach(node => this.parents.delete(node));
+            this.dirtyParents = new Set();
+            this.dirtyAttrs = new Map();
+            this.dirtyText = new Set();
+            this.removed = new Set();
+
+            const ops = [];
+            parents.forEach(el => {
+                const id = this.ids.get(el);
+                // Parents never sent (or gone) are covered by an ancestor's child list
+                if (!id || !el.isConnected) return;
+                ops.push({
+                    o: 'c',
+                    i: id,
+                    c: this.children(el).map(child => this.parents.get(child) === id ? { r: this.ids.get(child) } : this.serialize(child, id))
+                });
+            });
+            attrs.forEach((names, el) => {
+                const id = this.ids.get(el);
+                if (!id || !el.isConnected) return;
+                names.forEach(name => ops.push({ o: 'a', i: id, n: name, v: el.getAttribute(name) }));
+            });
+            texts.forEach(node => {
+                const id = this.ids.get(node);
+                if (!id || !node.isConnected) return;
+                ops.push({ o: 't', i: id, x: node.data });
+            });
+            if (!ops.length) return;
+
+            this.seq++;
+            await this.post({ type: 'MIRROR_DIFF', gen: this.gen, seq: this.seq, ops: ops });
+        }
+    }
+
     class BridgeEngine {
         constructor() {
             this.ws = null;
@@ -601,19 +755,172 @@
             this.token = GM_getValue('ws_token', this.defaultToken);
             this.wsUrl = GM_getValue('ws_url', this.defaultUrl);
             this.reconnectInterval = 3000;
-            this.tools = {}; // Dynamic Tool Registry { name: { fn, def } }
+            this.tools = {}; // Dynamic Tool Registry { name: { fn, def, key } }
+            this.manifestVersion = null; // Last tools manifest version acknowledged to the server
+            // Compiled tool functions by name + version + code hash, reused across manifest updates
+            this.compiled = new Map();
+            this.compiledLimit = 200;
+            // Large frames travel as zlib-compressed binary when the browser supports it
+            this.encoding = typeof CompressionStream !== 'undefined' ? 'deflate' : 'json';
+            this.compressThreshold = 4096;
+            // Results larger than this are streamed as sequenced CHUNK frames
+            this.chunkSize = 256 * 1024;
+            // Session resumption: reconnect as the same tab (sessionStorage is per tab and survives reloads)
+            this.tabId = sessionStorage.getItem('rm_bridge_tab_id');
+            this.resumeToken = sessionStorage.getItem('rm_bridge_resume_token');
+            // Recent replies, so requests replayed after a reconnect are not run twice.
+            // Bounded by count and serialized size; replies too large to keep are
+            // replayed as an error asking the caller to re-run the request.
+            this.completed = new Map(); // id -> { result, size }
+            this.completedLimit = 50;
+            this.completedBytes = 0;
+            this.completedMaxBytes = 8 * 1024 * 1024;
+            this.completedEntryMaxBytes = 1024 * 1024;
+            this.running = new Set();
+            // AbortControllers of running requests, for CANCEL frames and deadlines
+            this.controllers = new Map();
+            // Requests that were running when the previous page unloaded (replays must not rerun them)
+            this.interrupted = new Set(this.loadInflight());
+            // Page-change signal for the server's result cache (one DIRTY per change burst)
+            this.dirty = false;
+            this.lastHref = location.href;
+            // Heartbeat: worst timer drift since the last PONG, and when the server last pinged us
+            this.loopLag = 0;
+            this.lagProbeMs = 500;
+            this.heartbeatMs = 0;
+            this.lastPing = 0;
+            // Server-side DOM replica, started when the server asks for it in WELCOME
+            this.mirror = new DomMirror(this);
         }
 
         init() {
+            this.restoreTools();
+            this.watchDirty();
+            this.watchLag();
             this.connect();
         }
 
+        // Event-loop lag: how late a fixed-interval timer fires. Long tasks and background
+        // throttling both show up here and let the server prefer responsive tabs.
+        watchLag() {
+            let expected = performance.now() + this.lagProbeMs;
+            setInterval(() => {
+                const now = performance.now();
+                this.loopLag = Math.max(this.loopLag, now - expected);
+                expected = now + this.lagProbeMs;
+                this.checkServer();
+            }, this.lagProbeMs);
+        }
+
+        // The server pings every heartbeatMs; if it goes quiet the socket is probably half-open
+        checkServer() {
+            if (!this.heartbeatMs || !this.ws || this.ws.readyState !== 1) return;
+            if (Date.now() - this.lastPing < this.heartbeatMs * 4) return;
+            console.warn('[BridgeEngine] No heartbeat from server, reconnecting...');
+            const ws = this.ws;
+            ws.onclose = null;
+            ws.close();
+            this.heartbeatMs = 0;
+            this.connect();
+        }
+
+        async pong(seq) {
+            this.lastPing = Date.now();
+            // Pending mirror changes go first: the PONG confirms the mirror is current
+            await this.mirror.flush();
+            this.ws.send(JSON.stringify({
+                type: 'PONG',
+                seq: seq,
+                lag_ms: Math.round(this.loopLag),
+                hidden: document.hidden,
+                running: this.running.size,
+                mirror_gen: this.mirror.active ? this.mirror.gen : null,
+                mirror_seq: this.mirror.active ? this.mirror.seq : null
+            }));
+            this.loopLag = 0;
+        }
+
+        // Tools from the last manifest any tab received (GM storage is shared by all pages),
+        // so they are ready before the socket opens and the server only needs to send a delta
+        restoreTools() {
+            const stored = GM_getValue('tool_cache', null);
+            if (!stored || !Array.isArray(stored.tools)) return;
+            let restored = 0;
+            stored.tools.forEach(def => {
+                try {
+                    this.compileTool(def);
+                    restored++;
+                } catch (e) {
+                    console.error(`[BridgeEngine] Failed to restore tool ${def.name}:`, e);
+                }
+            });
+            this.manifestVersion = stored.version || null;
+            debugLog(`[BridgeEngine] Restored ${restored} cached tools (manifest ${this.manifestVersion})`);
+        }
+
+        persistTools() {
+            GM_setValue('tool_cache', {
+                version: this.manifestVersion,
+                tools: Object.values(this.tools).map(tool => tool.def)
+            });
+        }
+
+        // Report DOM mutations and navigations so the server drops cached read-only results.
+        // After one DIRTY the flag stays set until the next request, which may repopulate the cache.
+        watchDirty() {
+            const observer = new MutationObserver(records => {
+                if (this.dirty && location.href === this.lastHref) return;
+                if (records.every(record => this.isOwnMutation(record))) return;
+                this.markDirty('mutation');
+            });
+            observer.observe(document.documentElement, {
+                subtree: true,
+                childList: true,
+                attributes: true,
+                characterData: true
+            });
+            window.addEventListener('popstate', () => this.markDirty('navigation'));
+            window.addEventListener('hashchange', () => this.markDirty('navigation'));
+        }
+
+        // Changes to our own menu and toasts say nothing about the page
+        isOwnMutation(record) {
+            const own = node => {
+                const el = node && (node.nodeType === 1 ? node : node.parentElement);
+                return !!(el && el.closest('#resilient-menu-container, .toastify'));
+            };
+            if (record.type !== 'childList') return own(record.target);
+            const nodes = [...record.addedNodes, ...record.removedNodes];
+            return own(record.target) || (nodes.length > 0 && nodes.every(own));
+        }
+
+        markDirty(reason) {
+            const href = location.href;
+            if (href !== this.lastHref) {
+                reason = 'navigation';
+                this.lastHref = href;
+            } else if (this.dirty) {
+                return;
+            }
+            this.dirty = true;
+            if (this.ws && this.ws.readyState === 1) {
+                this.ws.send(JSON.stringify({ type: 'DIRTY', reason: reason, url: href }));
+            }
+        }
+
         connect() {
             const encodedUrl = encodeURIComponent(location.href);
-            const fullUrl = `${this.wsUrl}?token=${this.token}&url=${encodedUrl}`;
+            let fullUrl = `${this.wsUrl}?token=${this.token}&url=${encodedUrl}`;
+            // Let the server send only a delta if we still hold a recent manifest
+            if (this.manifestVersion) fullUrl += `&tools_version=${encodeURIComponent(this.manifestVersion)}`;
+            fullUrl += `&encoding=${this.encoding}`;
+            if (this.tabId && this.resumeToken) {
+                fullUrl += `&resume=${encodeURIComponent(this.tabId)}&resume_token=${encodeURIComponent(this.resumeToken)}`;
+            }
 
             debugLog(`[BridgeEngine] Connecting to ${this.wsUrl}...`);
             this.ws = new WebSocket(fullUrl);
+            this.ws.binaryType = 'arraybuffer';
 
             this.ws.onopen = () => {
                 console.log('[BridgeEngine] Connected to MCP Bridge');
@@ -628,18 +935,40 @@
             };
 
             this.ws.onmessage = async (event) => {
-                const request = JSON.parse(event.data);
+                const receivedAt = this.now();
+                const request = await this.decode(event.data);
+
+                // Answered first and kept out of the debug log (one every few seconds)
+                if (request.type === 'PING') {
+                    await this.pong(request.seq);
+                    return;
+                }
                 debugLog('[BridgeEngine] Request:', request);
 
                 // Handle Tool Manifest Sync
                 if (request.type === 'TOOLS_MANIFEST') {
-                    this.registerTools(request.tools);
+                    this.registerTools(request.tools, request.version);
+                    return;
+                }
+
+                // Handle incremental Tool Manifest updates
+                if (request.type === 'TOOLS_DELTA') {
+                    this.applyToolsDelta(request);
                     return;
                 }
 
                 // Handle Welcome Message (Tab ID)
                 if (request.type === 'WELCOME') {
-                    debugLog(`[BridgeEngine] Connected with ID: ${request.id}`);
+                    debugLog(`[BridgeEngine] Connected with ID: ${request.id}${request.resumed ? ' (resumed)' : ''}`);
+                    this.tabId = request.id;
+                    this.resumeToken = request.resume_token;
+                    sessionStorage.setItem('rm_bridge_tab_id', this.tabId);
+                    sessionStorage.setItem('rm_bridge_resume_token', this.resumeToken);
+                    if (!request.resumed) this.forgetCompleted();
+                    this.heartbeatMs = request.heartbeat_ms || 0;
+                    this.lastPing = Date.now();
+                    if (request.mirror) this.mirror.start().catch(e => console.error('[DomMirror] Start failed:', e));
+                    else this.mirror.stop();
                     if (window.menu) {
                         window.menu.updateStatus(`Connected (ID: ${request.id})`, 'success');
                         window.menu.showToast(`Tab ID: ${request.id}`, 'success');
@@ -647,27 +976,33 @@
                     return;
                 }
 
-                let result = { error: "Tool not found" };
+                // The server's DOM mirror missed a diff; send the whole page again
+                if (request.type === 'MIRROR_RESYNC') {
+                    if (this.mirror.active) this.mirror.start().catch(e => console.error('[DomMirror] Start failed:', e));
+                    return;
+                }
 
-                // Execute Dynamic Tool
-                if (this.tools[request.method]) {
-                    try {
-                        const toolFn = this.tools[request.method].fn;
-                        result = await toolFn(request.params || {});
-                    } catch (e) {
-                        result = { error: e.message, stack: e.stack };
-                    }
+                // Server gave up on these requests (deadline passed or client cancelled)
+                if (request.type === 'CANCEL') {
+                    (request.ids || [request.id]).forEach(id => {
+                        const controller = this.controllers.get(id);
+                        if (controller) controller.abort(new DOMException(`Cancelled by server (${request.reason})`, 'AbortError'));
+                    });
+                    return;
                 }
-                // Fallback: Basic DOM Tool (Built-in)
-                else if (request.method === 'get_dom') {
-                    const el = document.querySelector(request.params.selector || 'body');
-                    result = { html: el?.innerHTML, text: el?.innerText };
+
+                // Results produced from here on may be cached until the page changes again
+                this.dirty = false;
+
+                // Handle Batched Tool Calls (one frame, many replies)
+                if (request.type === 'BATCH') {
+                    await this.runBatch(request, receivedAt);
+                    return;
                 }
 
-                this.ws.send(JSON.stringify({
-                    id: request.id,
-                    result: result
-                }));
+                await this.handleRequest(
+                    request.id, request.method, request.params, request.timeout_ms, request.trace ? { received: receivedAt } : null
+                );
             };
 
             this.ws.onclose = () => {
@@ -680,6 +1015,339 @@
             };
         }
 
+        async runTool(method, params, signal) {
+            let result = { error: "Tool not found" };
+
+            // Execute Dynamic Tool
+            if (this.tools[method]) {
+                try {
+                    const toolFn = this.tools[method].fn;
+                    result = await this.abortable(toolFn(params || {}, signal), signal);
+                } catch (e) {
+                    result = { error: e.message, stack: e.stack };
+                }
+            }
+            // Fallback: Basic DOM Tool (Built-in)
+            else if (method === 'get_dom') {
+                const el = document.querySelector((params && params.selector) || 'body');
+                result = { html: el?.innerHTML, text: el?.innerText };
+            }
+            // Built-in element search (answered by the server's DOM mirror when it is fresh)
+            else if (method === 'query_dom') {
+                try {
+                    result = this.queryDom(params || {});
+                } catch (e) {
+                    result = { error: e.message };
+                }
+            }
+            // Built-in Screenshot (binary reply)
+            else if (method === 'screenshot') {
+                try {
+                    result = await this.captureScreenshot(params || {});
+                } catch (e) {
+                    result = { error: e.message, stack: e.stack };
+                }
+            }
+
+            return result;
+        }
+
+        // Settle as soon as the signal aborts, even if the tool ignores it
+        abortable(promise, signal) {
+            if (!signal) return promise;
+            if (signal.aborted) return Promise.reject(signal.reason);
+            return new Promise((resolve, reject) => {
+                const onAbort = () => reject(signal.reason);
+                signal.addEventListener('abort', onAbort, { once: true });
+                Promise.resolve(promise).then(resolve, reject).finally(() => signal.removeEventListener('abort', onAbort));
+            });
+        }
+
+        viewKey() {
+            return `${location.href}|${Math.round(window.scrollX)}|${Math.round(window.scrollY)}|${window.innerWidth}x${window.innerHeight}`;
+        }
+
+        async captureScreenshot(params) {
+            const view = this.viewKey();
+            // Server still holds a fresh frame of this exact view
+            if (params.if_view && params.if_view === view) return { unchanged: true, view: view };
+
+            const format = ['png', 'jpeg', 'webp'].includes(params.format) ? params.format : 'png';
+            const width = params.full_page ? document.documentElement.scrollWidth : window.innerWidth;
+            const options = { useCORS: true, logging: false };
+            if (!params.full_page) {
+                Object.assign(options, {
+                    x: window.scrollX,
+                    y: window.scrollY,
+                    width: window.innerWidth,
+                    height: window.innerHeight
+                });
+            }
+            if (params.max_width && width * window.devicePixelRatio > params.max_width) {
+                options.scale = params.max_width / width;
+            }
+
+            // Keep the menu out of the picture
+            const menuEl = window.menu && window.menu.container;
+            const display = menuEl ? menuEl.style.display : '';
+            if (menuEl) menuEl.style.display = 'none';
+            let canvas;
+            try {
+                canvas = await html2canvas(document.body, options);
+            } finally {
+                if (menuEl) menuEl.style.display = display;
+            }
+
+            const blob = await new Promise(resolve => canvas.toBlob(resolve, `image/${format}`, params.quality));
+            if (!blob) throw new Error('Failed to encode screenshot');
+
+            return new BinaryResult(blob, {
+                mime: blob.type, // Browsers fall back to PNG for unsupported formats
+                view: view,
+                width: canvas.width,
+                height: canvas.height
+            });
+        }
+
+        async decode(data) {
+            if (typeof data === 'string') return JSON.parse(data);
+            const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'));
+            return JSON.parse(await new Response(stream).text());
+        }
+
+        async send(message) {
+            if (!this.ws || this.ws.readyState !== 1) return;
+            const text = JSON.stringify(message);
+            if (this.encoding === 'deflate' && text.length >= this.compressThreshold) {
+                const stream = new Blob([text]).stream().pipeThrough(new CompressionStream('deflate'));
+                const buffer = await new Response(stream).arrayBuffer();
+                if (this.ws.readyState === 1) this.ws.send(buffer);
+                return;
+            }
+            this.ws.send(text);
+        }
+
+        sendBinary(id, binary, timing) {
+            if (!this.ws || this.ws.readyState !== 1) return;
+            // Frame layout: "RMB1" | uint32 header length | JSON header | raw payload
+            const header = new TextEncoder().encode(JSON.stringify({ id: id, result: binary.meta, timing: timing || undefined }));
+            const prefix = new Uint8Array(8);
+            prefix.set(new TextEncoder().encode('RMB1'));
+            new DataView(prefix.buffer).setUint32(4, header.length);
+            this.ws.send(new Blob([prefix, header, binary.blob]));
+        }
+
+        // Same result shape as the server's DomMirror.query
+        queryDom(params) {
+            const needle = params.text ? String(params.text).toLowerCase() : null;
+            const textOf = el => el.innerText || el.textContent || '';
+            let matches;
+            if (params.selector) {
+                matches = Array.from(document.querySelectorAll(params.selector));
+                if (needle) {
+                    matches = matches.filter(el => textOf(el).toLowerCase().includes(needle));
+                    // Innermost matches only
+                    const hasInner = new Set();
+                    matches.forEach(el => {
+                        for (let p = el.parentElement; p && !hasInner.has(p); p = p.parentElement) hasInner.add(p);
+                    });
+                    matches = matches.filter(el => !hasInner.has(el));
+                }
+            } else if (needle) {
+                const found = new Set();
+                const walker = document.createTreeWalker(document.documentElement, NodeFilter.SHOW_TEXT);
+                while (walker.nextNode()) {
+                    const el = walker.currentNode.parentElement;
+                    if (!el || found.has(el) || el.closest('script, style, noscript, template, head')) continue;
+                    if (walker.currentNode.data.toLowerCase().includes(needle)) found.add(el);
+                }
+                matches = [...found];
+            } else {
+                return { error: "'selector' or 'text' is required" };
+            }
+
+            const limit = params.limit === undefined ? 20 : params.limit;
+            return {
+                count: matches.length,
+                matches: matches.slice(0, Math.max(0, limit)).map(el => {
+                    const attrs = {};
+                    for (const attr of el.attributes) attrs[attr.name] = attr.value;
+                    const item = { tag: el.localName, attrs: attrs, text: textOf(el).trim().slice(0, 200) };
+                    if (params.html) item.html = el.outerHTML;
+                    return item;
+                })
+            };
+        }
+
+        // Epoch milliseconds with sub-millisecond precision, for tracing timestamps
+        now() {
+            return performance.timeOrigin + performance.now();
+        }
+
+        // `timing` ({received, started, finished}) is only passed for requests the server traces.
+        // Resolves to the size of what was sent (serialized length, or bytes for binary results).
+        async reply(id, result, timing) {
+            // The server must see the DOM changes a tool made before its result
+            await this.mirror.flush();
+            if (timing) timing.sent = this.now();
+            if (result instanceof BinaryResult) {
+                this.sendBinary(id, result, timing);
+                return result.blob.size;
+            }
+
+            let serialized;
+            try {
+                serialized = JSON.stringify(result === undefined ? null : result);
+            } catch (e) {
+                await this.send({ id: id, result: { error: `Unserializable result: ${e.message}` } });
+                return 0;
+            }
+
+            if (serialized.length <= this.chunkSize) {
+                await this.send({
+                    id: id,
+                    result: result,
+                    timing: timing || undefined
+                });
+                return serialized.length;
+            }
+
+            // Stream oversized results so the server can reassemble/spool them incrementally
+            let seq = 0;
+            for (const [start, end] of this.chunkBounds(serialized)) {
+                const final = end === serialized.length;
+                await this.send({
+                    type: 'CHUNK',
+                    id: id,
+                    seq: seq++,
+                    data: serialized.slice(start, end),
+                    final: final,
+                    timing: final && timing ? timing : undefined
+                });
+            }
+            return serialized.length;
+        }
+
+        // [start, end) slices of at most chunkSize code units that never split a surrogate
+        // pair (emoji, CJK extensions), which would leave each frame with an unencodable half
+        *chunkBounds(text) {
+            for (let start = 0; start < text.length;) {
+                let end = Math.min(start + this.chunkSize, text.length);
+                const last = text.charCodeAt(end - 1);
+                if (end < text.length && end - start > 1 && last >= 0xD800 && last <= 0xDBFF) end--;
+                yield [start, end];
+                start = end;
+            }
+        }
+
+        // Run a request at most once: a replayed request that already finished gets its stored
+        // reply again, one that is still running is ignored (its reply uses the new socket)
+        async handleRequest(id, method, params, timeoutMs, timing) {
+            if (this.completed.has(id)) {
+                const result = this.completed.get(id).result;
+                await this.reply(id, result);
+                return result;
+            }
+            if (this.running.has(id)) return undefined;
+
+            // Started before the page unloaded (e.g. reloadPage): never run it twice
+            if (this.interrupted.delete(id)) {
+                const result = { error: 'Interrupted by page unload' };
+                await this.reply(id, result);
+                return result;
+            }
+
+            const controller = new AbortController();
+            const timer = timeoutMs > 0
+                ? setTimeout(() => controller.abort(new DOMException('Deadline exceeded', 'TimeoutError')), timeoutMs)
+                : null;
+            this.controllers.set(id, controller);
+            this.running.add(id);
+            this.saveInflight([...this.running]);
+            let result;
+            if (timing) timing.started = this.now();
+            try {
+                result = await this.runTool(method, params, controller.signal);
+            } finally {
+                if (timing) timing.finished = this.now();
+                clearTimeout(timer);
+                this.controllers.delete(id);
+                this.running.delete(id);
+                this.saveInflight([...this.running]);
+            }
+            // Nobody is waiting for a cancelled request; don't spend a frame on it
+            if (controller.signal.aborted) {
+                debugLog(`[BridgeEngine] ${method} (${id}) aborted: ${controller.signal.reason?.message}`);
+                return result;
+            }
+            // Kept in full while it is being sent (a replay may arrive meanwhile), then bounded
+            this.completed.set(id, { result: result, size: 0 });
+            const size = await this.reply(id, result, timing);
+            this.remember(id, result, size);
+            return result;
+        }
+
+        remember(id, result, size) {
+            const previous = this.completed.get(id);
+            if (previous) {
+                this.completedBytes -= previous.size;
+                this.completed.delete(id);
+            }
+            const entry = size <= this.completedEntryMaxBytes
+                ? { result: result, size: size }
+                : { result: { error: 'Result expired, re-run the request' }, size: 0 };
+            this.completed.set(id, entry);
+            this.completedBytes += entry.size;
+            while (this.completed.size > this.completedLimit || this.completedBytes > this.completedMaxBytes) {
+                const [oldest, evicted] = this.completed.entries().next().value;
+                this.completed.delete(oldest);
+                this.completedBytes -= evicted.size;
+            }
+        }
+
+        forgetCompleted() {
+            this.completed.clear();
+            this.completedBytes = 0;
+        }
+
+        loadInflight() {
+            try {
+                return JSON.parse(sessionStorage.getItem('rm_bridge_inflight') || '[]');
+            } catch (e) {
+                return [];
+            }
+        }
+
+        saveInflight(ids) {
+            sessionStorage.setItem('rm_bridge_inflight', JSON.stringify(ids));
+        }
+
+        async runBatch(batch, receivedAt) {
+            const calls = batch.calls || [];
+            // Traced calls report queueing from the moment the batch frame arrived
+            const timing = () => batch.trace ? { received: receivedAt } : null;
+            debugLog(`[BridgeEngine] Batch of ${calls.length} (${batch.mode})`);
+
+            // Each call is answered as soon as it finishes so the server can stream results
+            if (batch.mode === 'concurrent') {
+                await Promise.all(calls.map(call => this.handleRequest(call.id, call.method, call.params, batch.timeout_ms, timing())));
+                return;
+            }
+
+            // Sequential calls share the batch deadline
+            const deadline = batch.timeout_ms > 0 ? Date.now() + batch.timeout_ms : null;
+            const remainingMs = () => deadline ? Math.max(1, deadline - Date.now()) : undefined;
+            let failed = false;
+            for (const call of calls) {
+                if (failed) {
+                    await this.reply(call.id, { error: 'Skipped after earlier failure' });
+                    continue;
+                }
+                const result = await this.handleRequest(call.id, call.method, call.params, remainingMs(), timing());
+                if (batch.stop_on_error && result && result.error) failed = true;
+            }
+        }
+
         requestTools() {
             if (this.ws && this.ws.readyState === 1) {
                 this.ws.send(JSON.stringify({ type: 'GET_TOOLS' }));
@@ -689,29 +1357,102 @@
             }
         }
 
-        registerTools(toolDefinitions) {
-            let count = 0;
-            this.tools = {}; // Reset registry
+        // 32-bit FNV-1a: a short, stable identity for a tool's code
+        hashCode(text) {
+            let hash = 0x811c9dc5;
+            for (let i = 0; i < text.length; i++) {
+                hash ^= text.charCodeAt(i);
+                hash = Math.imul(hash, 0x01000193);
+            }
+            return (hash >>> 0).toString(16);
+        }
+
+        toolKey(def) {
+            // Recompile only when the name, version or the code itself changes
+            return `${def.name}|${def.version || '?'}|${this.hashCode(def.code || '')}|${(def.code || '').length}`;
+        }
+
+        compileTool(def) {
+            const key = this.toolKey(def);
+            const existing = this.tools[def.name];
+            if (existing && existing.key === key) {
+                existing.def = def;
+                return false;
+            }
+
+            let fn = this.compiled.get(key);
+            const fresh = !fn;
+            if (fresh) {
+                // Create function from code string; async so tool bodies may use await
+                // params and signal (AbortSignal, fires on CANCEL or deadline) are the arguments
+                fn = new AsyncFunction('params', 'signal', def.code);
+                this.compiled.set(key, fn);
+                if (this.compiled.size > this.compiledLimit) {
+                    this.compiled.delete(this.compiled.keys().next().value);
+                }
+            }
+            this.tools[def.name] = { fn: fn, def: def, key: key };
+            debugLog(`[BridgeEngine] Registered tool: ${def.name} (v${def.version || '?'}${fresh ? '' : ', cached'})`);
+            return fresh;
+        }
+
+        ackTools(version) {
+            this.manifestVersion = version || null;
+            this.persistTools();
+            if (this.ws && this.ws.readyState === 1) {
+                this.ws.send(JSON.stringify({ type: 'TOOLS_ACK', version: this.manifestVersion }));
+            }
+        }
+
+        registerTools(toolDefinitions, version) {
+            let compiled = 0;
+            const previous = this.tools;
+            const names = new Set();
 
             toolDefinitions.forEach(def => {
+                names.add(def.name);
                 try {
-                    // Create function from code string
-                    // params is the argument name
-                    const fn = new Function('params', def.code);
-                    this.tools[def.name] = { fn: fn, def: def };
-                    count++;
-                    debugLog(`[BridgeEngine] Registered tool: ${def.name} (v${def.version || '?'})`);
+                    if (this.compileTool(def)) compiled++;
                 } catch (e) {
                     console.error(`[BridgeEngine] Failed to register tool ${def.name}:`, e);
                 }
             });
 
-            console.log(`[BridgeEngine] Registered ${count} dynamic tools.`);
+            // Drop tools that are no longer part of the manifest
+            Object.keys(previous).forEach(name => {
+                if (!names.has(name)) delete this.tools[name];
+            });
+
+            console.log(`[BridgeEngine] Registered ${names.size} dynamic tools (${compiled} compiled).`);
+            this.ackTools(version);
             if (window.menu) {
-                window.menu.showToast(`Synced ${count} Tools`, 'info');
+                window.menu.showToast(`Synced ${names.size} Tools`, 'info');
                 window.menu.renderToolsList(this.tools);
             }
         }
+
+        applyToolsDelta(delta) {
+            if (delta.base !== this.manifestVersion) {
+                // We missed an update; fall back to a full manifest
+                debugLog(`[BridgeEngine] Manifest base mismatch (${delta.base} != ${this.manifestVersion}), resyncing`);
+                this.ws.send(JSON.stringify({ type: 'GET_TOOLS' }));
+                return;
+            }
+
+            let compiled = 0;
+            (delta.upsert || []).forEach(def => {
+                try {
+                    if (this.compileTool(def)) compiled++;
+                } catch (e) {
+                    console.error(`[BridgeEngine] Failed to register tool ${def.name}:`, e);
+                }
+            });
+            (delta.remove || []).forEach(name => delete this.tools[name]);
+
+            console.log(`[BridgeEngine] Tools delta applied: ${compiled} compiled, ${(delta.remove || []).length} removed.`);
+            this.ackTools(delta.version);
+            if (window.menu) window.menu.renderToolsList(this.tools);
+        }
     }
 
     class LogEngine {
@@ -725,10 +1466,16 @@
                 info: console.info
             };
             this.listeners = [];
+            // Remote shipping is batched: flush every N entries or every T ms
+            this.outbox = [];
+            this.flushSize = 50;
+            this.flushInterval = 1000;
+            this.flushTimer = null;
         }
 
         init() {
             this.intercept();
+            window.addEventListener('pagehide', () => this.flush());
         }
 
         intercept() {
@@ -768,31 +1515,50 @@
 
             this.notifyListeners(logEntry);
 
-            if (DEV && window.menu && window.menu.bridge && window.menu.bridge.ws && window.menu.bridge.ws.readyState === 1) {
+            if (DEV) this.enqueueRemote(logEntry);
+        }
+
+        enqueueRemote(logEntry) {
+            this.outbox.push({
+                timestamp: logEntry.timestamp,
+                level: logEntry.type,
+                message: logEntry.message,
+                url: logEntry.url
+            });
+
+            if (this.outbox.length >= this.flushSize) {
+                this.flush();
+            } else if (!this.flushTimer) {
+                this.flushTimer = setTimeout(() => this.flush(), this.flushInterval);
+            }
+        }
+
+        flush() {
+            if (this.flushTimer) {
+                clearTimeout(this.flushTimer);
+                this.flushTimer = null;
+            }
+            if (this.outbox.length === 0) return;
+
+            const entries = this.outbox;
+            this.outbox = [];
+
+            const bridge = window.menu && window.menu.bridge;
+            if (bridge && bridge.ws && bridge.ws.readyState === 1) {
                 // Send via WebSocket if connected
-                window.menu.bridge.ws.send(JSON.stringify({
-                    type: 'LOG',
-                    level: type,
-                    message: message,
-                    url: location.href
-                }));
-            } else if (DEV) {
+                bridge.ws.send(JSON.stringify({ type: 'LOG_BATCH', entries: entries }));
+            } else {
                 // Fallback to HTTP
-                this.sendRemoteLog(logEntry);
+                this.sendRemoteLogs(entries);
             }
         }
 
-        sendRemoteLog(logEntry) {
+        sendRemoteLogs(entries) {
             GM_xmlhttpRequest({
                 method: "POST",
                 url: "http://127.0.0.1:8080/log",
                 headers: { "Content-Type": "application/json" },
-                data: JSON.stringify({
-                    type: logEntry.type.toUpperCase(),
-                    message: logEntry.message,
-                    level: logEntry.type,
-                    url: location.href
-                }),
+                data: JSON.stringify({ entries: entries }),
                 onload: () => { },
                 onerror: () => { }
             });
@@ -810,6 +1576,9 @@
     class AutomationUtils {
         constructor() {
             this.debug = true;
+            // Pending waitForElement calls: { selector, resolve, timer }
+            this.waiters = new Set();
+            this.observer = null;
         }
 
         log(msg) {
@@ -818,35 +1587,66 @@
 
         // --- Level 2 Helpers ---
 
-        async waitForElement(selector, timeout = 5000) {
+        async waitForElement(selector, timeout = 5000, signal = null) {
             this.log(`Waiting for: ${selector}`);
+            const el = this.smartFind(selector, signal);
+            if (el) return el;
+
             return new Promise((resolve, reject) => {
-                const el = this.smartFind(selector);
-                if (el) return resolve(el);
+                const waiter = { selector: selector, resolve: resolve, signal: signal };
+                const fail = error => {
+                    this.removeWaiter(waiter);
+                    reject(error);
+                };
+                waiter.timer = setTimeout(() => fail(new Error(`Timeout waiting for element: ${selector}`)), timeout);
+                if (signal) {
+                    if (signal.aborted) return fail(signal.reason);
+                    waiter.onAbort = () => fail(signal.reason);
+                    signal.addEventListener('abort', waiter.onAbort, { once: true });
+                }
+                this.waiters.add(waiter);
+                this.ensureObserver();
+            });
+        }
 
-                const observer = new MutationObserver(() => {
-                    const el = this.smartFind(selector);
-                    if (el) {
-                        observer.disconnect();
-                        resolve(el);
-                    }
-                });
+        // One MutationObserver serves every pending waitForElement; it only runs while someone waits
+        ensureObserver() {
+            if (this.observer) return;
+            this.observer = new MutationObserver(() => this.checkWaiters());
+            this.observer.observe(document.documentElement, {
+                childList: true,
+                subtree: true,
+                attributes: true,
+                characterData: true
+            });
+        }
 
-                observer.observe(document.body, {
-                    childList: true,
-                    subtree: true,
-                    attributes: true
-                });
+        checkWaiters() {
+            // Waiters on the same selector share one lookup per mutation batch
+            const found = new Map();
+            for (const waiter of [...this.waiters]) {
+                if (!found.has(waiter.selector)) found.set(waiter.selector, this.smartFind(waiter.selector));
+                const el = found.get(waiter.selector);
+                if (el) {
+                    this.removeWaiter(waiter);
+                    waiter.resolve(el);
+                }
+            }
+        }
 
-                setTimeout(() => {
-                    observer.disconnect();
-                    reject(new Error(`Timeout waiting for element: ${selector}`));
-                }, timeout);
-            });
+        removeWaiter(waiter) {
+            clearTimeout(waiter.timer);
+            if (waiter.onAbort) waiter.signal.removeEventListener('abort', waiter.onAbort);
+            this.waiters.delete(waiter);
+            if (this.waiters.size === 0 && this.observer) {
+                this.observer.disconnect();
+                this.observer = null;
+            }
         }
 
-        smartFind(selector) {
+        smartFind(selector, signal = null) {
             if (!selector) return null;
+            if (signal) signal.throwIfAborted();
             // XPath
             if (selector.startsWith('//') || selector.startsWith('xpath:')) {
                 const xpath = selector.replace(/^xpath:/, '');
@@ -857,7 +1657,10 @@
             if (selector.startsWith('text:')) {
                 const text = selector.replace(/^text:/, '');
                 const elements = document.querySelectorAll('*'); // Inefficient but simple for now
-                for (let el of elements) {
+                for (let i = 0; i < elements.length; i++) {
+                    // Long walks stop as soon as the call is cancelled
+                    if (signal && i % 500 === 0) signal.throwIfAborted();
+                    const el = elements[i];
                     if (el.textContent.includes(text) && el.children.length === 0) { // Leaf nodes preferred
                         return el;
                     }
@@ -888,8 +1691,8 @@
             return true;
         }
 
-        async simulateType(selector, text, delay = 50) {
-            const el = typeof selector === 'string' ? this.smartFind(selector) : selector;
+        async simulateType(selector, text, delay = 50, signal = null) {
+            const el = typeof selector === 'string' ? this.smartFind(selector, signal) : selector;
             if (!el) throw new Error(`Element not found for typing: ${selector}`);
 
             this.log(`Typing "${text}" into ${selector}`);
@@ -900,6 +1703,7 @@
             // el.value = ''; 
 
             for (const char of text) {
+                if (signal) signal.throwIfAborted();
                 const keyEvent = new KeyboardEvent('keydown', { key: char, bubbles: true });
                 el.dispatchEvent(keyEvent);
 
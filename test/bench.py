@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the MCP bridge.
+
+Starts server.py in-process on a free local port, connects N simulated browser
+tabs to /mcp-bridge (WELCOME / TOOLS_MANIFEST / {id, result} protocol, with a
+configurable reply delay and payload size) and drives M concurrent MCP sessions
+through /sse + /messages. Reports throughput, latency percentiles and memory.
+
+No browser and no network access needed:
+
+    python bench.py --tabs 20 --sessions 8 --calls 200 --delay 5 --size 2048
+    python bench.py --json > bench_result.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import resource
+import tracemalloc
+import contextlib
+from typing import List, Optional
+
+import uvicorn
+import websockets
+from mcp.client.sse import sse_client
+from mcp.client.session import ClientSession
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import server  # noqa: E402
+
+ERROR_PREFIXES = ("Error:", "Timeout:", "Execution Failed:")
+
+class FakeTab:
+    """Speaks the BridgeEngine side of the /mcp-bridge protocol"""
+    def __init__(self, index: int, base_ws: str, delay: float, size: int, jitter: float):
+        self.url = f"https://bench.local/tab/{index}"
+        self.base_ws = base_ws
+        self.delay = delay
+        self.size = size
+        self.jitter = jitter
+        self.id: Optional[str] = None
+        self.ready = asyncio.Event()
+        self.handled = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _reply(self, ws, req_id: str, method: str):
+        delay = self.delay + random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.handled += 1
+        await ws.send(json.dumps({"id": req_id, "result": {"method": method, "data": "x" * self.size}}))
+
+    async def _run(self):
+        uri = f"{self.base_ws}/mcp-bridge?token={server.BRIDGE_TOKEN}&url={self.url}"
+        async with websockets.connect(uri, max_size=None) as ws:
+            async for raw in ws:
+                msg = json.loads(raw)
+                kind = msg.get("type")
+                if kind == "WELCOME":
+                    self.id = msg["id"]
+                    self.ready.set()
+                elif kind in ("TOOLS_MANIFEST", "TOOLS_DELTA"):
+                    await ws.send(json.dumps({"type": "TOOLS_ACK", "version": msg.get("version")}))
+                elif kind == "PING":
+                    await ws.send(json.dumps({"type": "PONG", "seq": msg.get("seq"), "lag_ms": 0}))
+                elif kind == "BATCH":
+                    for call in msg.get("calls", []):
+                        asyncio.create_task(self._reply(ws, call["id"], call["method"]))
+                elif "method" in msg:
+                    asyncio.create_task(self._reply(ws, msg["id"], msg["method"]))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(BaseException):
+                await self._task
+
+async def run_session(
+    base_http: str,
+    tab_ids: List[str],
+    calls: int,
+    concurrency: int,
+    tool: str,
+    spread: bool,
+    latencies: List[float],
+    errors: List[str]
+):
+    async with sse_client(f"{base_http}/sse") as streams:
+        async with ClientSession(streams[0], streams[1]) as session:
+            await session.initialize()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(i: int):
+                tab_id = tab_ids[i % len(tab_ids)] if spread else "latest"
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        result = await session.call_tool(tool, {"tab_id": tab_id})
+                    except Exception as e:
+                        errors.append(repr(e))
+                        return
+                    latencies.append(time.perf_counter() - started)
+                    text = result.content[0].text if result.content else ""
+                    if result.isError or text.startswith(ERROR_PREFIXES):
+                        errors.append(text[:200])
+
+            await asyncio.gather(*(one(i) for i in range(calls)))
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+async def bench(args) -> dict:
+    config = uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning", lifespan="on")
+    srv = uvicorn.Server(config)
+    serve_task = asyncio.create_task(srv.serve())
+    while not srv.started:
+        if serve_task.done():
+            serve_task.result()
+        await asyncio.sleep(0.01)
+
+    port = srv.servers[0].sockets[0].getsockname()[1]
+    base_http = f"http://127.0.0.1:{port}"
+    base_ws = f"ws://127.0.0.1:{port}"
+
+    tabs = [FakeTab(i, base_ws, args.delay / 1000, args.size, args.jitter / 1000) for i in range(args.tabs)]
+    for tab in tabs:
+        tab.start()
+    await asyncio.wait_for(asyncio.gather(*(t.ready.wait() for t in tabs)), timeout=10)
+    tab_ids = [t.id for t in tabs]
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            run_session(base_http, tab_ids, args.calls, args.concurrency, args.tool, args.spread, latencies, errors)
+            for _ in range(args.sessions)
+        ))
+    finally:
+        elapsed = time.perf_counter() - started
+        for tab in tabs:
+            await tab.stop()
+        srv.should_exit = True
+        await serve_task
+
+    total = args.sessions * args.calls
+    return {
+        "tabs": args.tabs,
+        "sessions": args.sessions,
+        "calls": total,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p90": round(percentile(latencies, 90) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies, default=0.0) * 1000, 2),
+        },
+        "handled_by_tabs": sum(t.handled for t in tabs),
+        "handled_per_tab": {t.id: t.handled for t in tabs},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the MCP bridge")
+    parser.add_argument("--tabs", type=int, default=10, help="Simulated browser tabs")
+    parser.add_argument("--sessions", type=int, default=5, help="Concurrent MCP SSE sessions")
+    parser.add_argument("--calls", type=int, default=100, help="Tool calls per session")
+    parser.add_argument("--concurrency", type=int, default=4, help="In-flight calls per session")
+    parser.add_argument(
+        "--tool", default="waitForElement",
+        help="Tool name to call, from tools.json (simulated tabs answer any name; cacheable "
+             "tools such as getCookies are mostly served by the result cache, not the tabs)"
+    )
+    parser.add_argument("--delay", type=float, default=0.0, help="Tab reply delay in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random reply delay in ms")
+    parser.add_argument("--size", type=int, default=256, help="Reply payload size in bytes")
+    parser.add_argument("--spread", action="store_true", help="Round-robin calls across tabs instead of 'latest'")
+    parser.add_argument("--port", type=int, default=0, help="Port for the in-process server (0 = any free port)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Track Python heap peak (slower)")
+    parser.add_argument("--verbose", action="store_true", help="Keep server banner and INFO logs")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    if not args.verbose:
+        logging.getLogger("mcp_bridge").setLevel(logging.WARNING)
+
+    with open(os.devnull, "w") as devnull:
+        redirect = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+        with redirect:
+            report = asyncio.run(bench(args))
+
+    # ru_maxrss is in KiB on Linux
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    if args.tracemalloc:
+        report["heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print("=" * 60)
+    print(f"📊 {report['calls']} calls | {report['tabs']} tabs | {report['sessions']} sessions")
+    print(f"   Throughput: {report['throughput_rps']} calls/s in {report['elapsed_s']}s")
+    lat = report["latency_ms"]
+    print(f"   Latency: p50={lat['p50']}ms p90={lat['p90']}ms p99={lat['p99']}ms max={lat['max']}ms")
+    print(f"   Errors: {report['errors']}")
+    print(f"   Answered by tabs: {report['handled_by_tabs']} of {report['calls']}")
+    for sample in report["error_samples"]:
+        print(f"      - {sample}")
+    print(f"   Peak RSS: {report['peak_rss_mb']} MB")
+    if "heap_peak_mb" in report:
+        print(f"   Heap peak: {report['heap_peak_mb']} MB")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+import json
+import time
+import uuid
+import asyncio
+import fnmatch
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis is optional: only needed for multi-process deployments
+    aioredis = None
+
+# Multi-worker routing
+#
+# Each worker owns the tabs and SSE sessions whose sockets it accepted. Workers share
+# a broker that provides:
+#
+#   - a tab directory (tab id -> {id, worker, url, host, ua, connected_at})
+#   - pub/sub channels:
+#       mcp:worker:<id>   requests addressed to one worker
+#       mcp:reply:<id>    replies to requests that worker sent
+#       mcp:tabs          tab up/down events, mirrored into every worker's directory
+#   - an SSE session directory (session id -> worker), so a POST /messages that lands
+#     on another worker is sent straight to the session's owner
+#   - worker heartbeats, so tabs and sessions of a crashed worker drop out
+#
+# InProcessBroker serves tests and single-process runs; RedisBroker works with any
+# Redis-compatible server, over TCP (redis://) or a local Unix socket (unix://).
+
+log = logging.getLogger("mcp_bridge.cluster")
+
+HEARTBEAT_INTERVAL = 5.0
+HEARTBEAT_TTL = 3 * HEARTBEAT_INTERVAL
+# Errors that cross workers with their type intact (ClusterRouter.register_error adds more)
+REMOTE_ERROR_TYPES = (TimeoutError, ValueError, ConnectionError, LookupError, PermissionError)
+
+Handler = Callable[[dict], Awaitable[Any]]
+
+def _dumps(message: dict) -> str:
+    return json.dumps(message, separators=(",", ":"))
+
+class Broker:
+    """Transport shared by all workers"""
+    async def publish(self, channel: str, message: dict):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str, handler: Handler):
+        raise NotImplementedError
+
+    async def register_tab(self, info: dict):
+        raise NotImplementedError
+
+    async def unregister_tab(self, tab_id: str):
+        raise NotImplementedError
+
+    async def list_tabs(self) -> List[dict]:
+        """Every registered tab, oldest first"""
+        raise NotImplementedError
+
+    async def register_session(self, session_id: str, worker_id: str):
+        raise NotImplementedError
+
+    async def unregister_session(self, session_id: str):
+        raise NotImplementedError
+
+    async def session_owner(self, session_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def heartbeat(self, worker_id: str, ttl: float):
+        raise NotImplementedError
+
+    async def alive_workers(self) -> set:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class InProcessBroker(Broker):
+    """Broker for workers living in one process (tests, single worker)"""
+    def __init__(self):
+        self._subscribers: Dict[str, List[Handler]] = {}
+        self._tabs: "OrderedDict[str, dict]" = OrderedDict()
+        self._sessions: Dict[str, str] = {}
+        self._alive: Dict[str, float] = {}
+        self._tasks: set = set()
+
+    async def publish(self, channel: str, message: dict):
+        # Deliver asynchronously and as a copy, like a real pub/sub hop
+        for handler in self._subscribers.get(channel, []):
+            task = asyncio.create_task(handler(json.loads(_dumps(message))))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self._subscribers.setdefault(channel, []).append(handler)
+
+    async def register_tab(self, info: dict):
+        self._tabs[info["id"]] = dict(info)
+
+    async def unregister_tab(self, tab_id: str):
+        self._tabs.pop(tab_id, None)
+
+    async def list_tabs(self) -> List[dict]:
+        return sorted((dict(t) for t in self._tabs.values()), key=lambda t: t["connected_at"])
+
+    async def register_session(self, session_id: str, worker_id: str):
+        self._sessions[session_id] = worker_id
+
+    async def unregister_session(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    async def session_owner(self, session_id: str) -> Optional[str]:
+        return self._sessions.get(session_id)
+
+    async def heartbeat(self, worker_id: str, ttl: float):
+        self._alive[worker_id] = time.time() + ttl
+
+    async def alive_workers(self) -> set:
+        now = time.time()
+        return {w for w, expires in self._alive.items() if expires > now}
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+class RedisBroker(Broker):
+    """Broker backed by a Redis-compatible server (redis://, rediss:// or unix://)"""
+    TABS_KEY = "mcp:tabs"
+    ORDER_KEY = "mcp:tabs:order"
+    SESSIONS_KEY = "mcp:sessions"
+    WORKERS_KEY = "mcp:workers"
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("MCP_BROKER_URL needs the 'redis' package (pip install redis)")
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self.pubsub = self.redis.pubsub()
+        self._handlers: Dict[str, Handler] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+
+    async def publish(self, channel: str, message: dict):
+        await self.redis.publish(channel, _dumps(message))
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self._handlers[channel] = handler
+        await self.pubsub.subscribe(channel)
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        async for message in self.pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            handler = self._handlers.get(message["channel"])
+            if handler is None:
+                continue
+            try:
+                payload = json.loads(message["data"])
+            except ValueError:
+                log.warning("Dropping malformed broker message on %s", message["channel"])
+                continue
+            task = asyncio.create_task(handler(payload))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def register_tab(self, info: dict):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.TABS_KEY, info["id"], _dumps(info))
+            pipe.zadd(self.ORDER_KEY, {info["id"]: info["connected_at"]})
+            await pipe.execute()
+
+    async def unregister_tab(self, tab_id: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(self.TABS_KEY, tab_id)
+            pipe.zrem(self.ORDER_KEY, tab_id)
+            await pipe.execute()
+
+    async def list_tabs(self) -> List[dict]:
+        ids = await self.redis.zrange(self.ORDER_KEY, 0, -1)
+        if not ids:
+            return []
+        raw = await self.redis.hmget(self.TABS_KEY, ids)
+        return [json.loads(item) for item in raw if item]
+
+    async def register_session(self, session_id: str, worker_id: str):
+        await self.redis.hset(self.SESSIONS_KEY, session_id, worker_id)
+
+    async def unregister_session(self, session_id: str):
+        await self.redis.hdel(self.SESSIONS_KEY, session_id)
+
+    async def session_owner(self, session_id: str) -> Optional[str]:
+        return await self.redis.hget(self.SESSIONS_KEY, session_id)
+
+    async def heartbeat(self, worker_id: str, ttl: float):
+        await self.redis.zadd(self.WORKERS_KEY, {worker_id: time.time() + ttl})
+
+    async def alive_workers(self) -> set:
+        return set(await self.redis.zrangebyscore(self.WORKERS_KEY, time.time(), "+inf"))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await self.pubsub.aclose()
+        await self.redis.aclose()
+
+def make_broker(url: Optional[str]) -> Optional[Broker]:
+    """Broker for MCP_BROKER_URL: None (single worker), memory://, redis://..., unix://..."""
+    if not url:
+        return None
+    if url.startswith("memory:"):
+        return InProcessBroker()
+    return RedisBroker(url)
+
+class ClusterRouter:
+    """Forwards requests between workers and mirrors the shared tab directory.
+
+    The directory is kept locally (insertion-ordered, newest last) and updated from
+    mcp:tabs events, so resolving a selector never needs a broker round trip.
+    """
+    def __init__(self, broker: Broker, worker_id: str):
+        self.broker = broker
+        self.worker_id = worker_id
+        self.directory: Dict[str, dict] = {}
+        # IDs (hex) of the SSE sessions open on this worker
+        self.sessions: set = set()
+        self._handlers: Dict[str, Handler] = {}
+        self._replies: Dict[str, asyncio.Future] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        # Exception classes a remote error is raised as again, by name (others become Exception)
+        self._error_types: Dict[str, type] = {cls.__name__: cls for cls in REMOTE_ERROR_TYPES}
+
+    def register_error(self, cls: type):
+        """Let errors of this class raised by remote handlers keep their type"""
+        self._error_types[cls.__name__] = cls
+
+    def on(self, op: str, handler: Handler):
+        """Handle requests whose "op" is `op`"""
+        self._handlers[op] = handler
+
+    async def start(self):
+        await self.broker.subscribe(f"mcp:worker:{self.worker_id}", self._on_request)
+        await self.broker.subscribe(f"mcp:reply:{self.worker_id}", self._on_reply)
+        await self.broker.subscribe("mcp:tabs", self._on_tab_event)
+        await self.broker.heartbeat(self.worker_id, HEARTBEAT_TTL)
+        for info in await self.broker.list_tabs():
+            self.directory[info["id"]] = info
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        log.info("🔗 Worker %s joined the cluster (%d tabs known)", self.worker_id, len(self.directory))
+
+    async def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        for tab_id in [t for t, info in self.directory.items() if info["worker"] == self.worker_id]:
+            await self.unregister_tab(tab_id)
+        for session_id in list(self.sessions):
+            await self.unregister_session(session_id)
+        for future in self._replies.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Worker shutting down"))
+        await self.broker.close()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await self.broker.heartbeat(self.worker_id, HEARTBEAT_TTL)
+                alive = await self.broker.alive_workers()
+                for tab_id in [t for t, info in self.directory.items() if info["worker"] not in alive]:
+                    log.warning("🧹 Dropping tab %s of unresponsive worker %s", tab_id, self.directory[tab_id]["worker"])
+                    await self.unregister_tab(tab_id)
+            except Exception as e:
+                log.error("❌ Cluster heartbeat failed: %s", e)
+
+    # --- Tab directory ---
+
+    async def register_tab(self, info: dict):
+        info = {**info, "worker": self.worker_id}
+        self.directory[info["id"]] = info
+        await self.broker.register_tab(info)
+        await self.broker.publish("mcp:tabs", {"event": "up", "tab": info})
+
+    async def unregister_tab(self, tab_id: str):
+        self.directory.pop(tab_id, None)
+        await self.broker.unregister_tab(tab_id)
+        await self.broker.publish("mcp:tabs", {"event": "down", "id": tab_id})
+
+    async def _on_tab_event(self, message: dict):
+        if message.get("event") == "up":
+            info = message["tab"]
+            # Updates (navigation, resumption) keep the tab's place: insertion order is
+            # connection order, so "latest" stays the most recently connected tab
+            self.directory[info["id"]] = info
+        elif message.get("event") == "down":
+            self.directory.pop(message.get("id"), None)
+
+    # --- SSE sessions ---
+
+    async def register_session(self, session_id: str):
+        self.sessions.add(session_id)
+        await self.broker.register_session(session_id, self.worker_id)
+
+    async def unregister_session(self, session_id: str):
+        self.sessions.discard(session_id)
+        await self.broker.unregister_session(session_id)
+
+    async def session_owner(self, session_id: str) -> Optional[str]:
+        """Worker holding an SSE session, or None when no live worker does"""
+        if session_id in self.sessions:
+            return self.worker_id
+        owner = await self.broker.session_owner(session_id)
+        if owner is not None and owner not in await self.broker.alive_workers():
+            # Its worker died without closing it
+            await self.broker.unregister_session(session_id)
+            return None
+        return owner
+
+    @staticmethod
+    def _matches(info: dict, selector: str) -> bool:
+        kind, _, value = selector.partition(":")
+        if kind == "host":
+            return info.get("host") == value.lower()
+        if kind == "ua":
+            return info.get("ua") == value
+        if kind == "url":
+            return fnmatch.fnmatchcase(info.get("url", ""), value)
+        raise ValueError(f"Tab ID {selector} not found")
+
+    def resolve(self, selector: Optional[str]) -> dict:
+        """Cluster-wide equivalent of MCPBridge.resolve_tab, returning directory entries"""
+        if not self.directory:
+            raise ValueError("No browser tabs connected")
+        if not selector or selector == "latest":
+            return next(reversed(self.directory.values()))
+        info = self.directory.get(selector)
+        if info is not None:
+            return info
+        info = next((i for i in reversed(self.directory.values()) if self._matches(i, selector)), None)
+        if info is None:
+            raise ValueError(f"No tab matches {selector}")
+        return info
+
+    def select(self, target) -> List[dict]:
+        """Cluster-wide equivalent of MCPBridge.select_tabs"""
+        if not target or target == "all":
+            return list(self.directory.values())
+        if isinstance(target, list):
+            return [self.directory[t] for t in target if t in self.directory]
+        if target in self.directory:
+            return [self.directory[target]]
+        if target == "latest":
+            return [self.resolve(target)]
+        return [i for i in self.directory.values() if self._matches(i, target)]
+
+    # --- Requests ---
+
+    async def request(self, worker_id: str, payload: dict, timeout: float) -> Any:
+        """Send `payload` to another worker's handler for payload["op"] and await its result"""
+        call_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._replies[call_id] = future
+        try:
+            await self.broker.publish(
+                f"mcp:worker:{worker_id}",
+                {**payload, "call_id": call_id, "reply_to": self.worker_id}
+            )
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # The remote handler's own TimeoutError, passed on as is
+                raise
+            raise TimeoutError(f"Worker {worker_id} did not answer within {timeout}s")
+        finally:
+            self._replies.pop(call_id, None)
+
+    async def _on_request(self, message: dict):
+        reply = {"call_id": message.get("call_id")}
+        handler = self._handlers.get(message.get("op"))
+        try:
+            if handler is None:
+                raise ValueError(f"Unsupported cluster op: {message.get('op')}")
+            reply["result"] = await handler(message)
+        except Exception as e:
+            reply["error"] = str(e)
+            reply["error_type"] = type(e).__name__
+        await self.broker.publish(f"mcp:reply:{message.get('reply_to')}", reply)
+
+    async def _on_reply(self, message: dict):
+        future = self._replies.get(message.get("call_id"))
+        if future is None or future.done():
+            return
+        if "error" in message:
+            # A remote timeout must still read as a timeout to the caller
+            cls = self._error_types.get(message.get("error_type"), Exception)
+            future.set_exception(cls(message["error"]))
+        else:
+            future.set_result(message.get("result"))
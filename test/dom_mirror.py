@@ -0,0 +1,516 @@
+import re
+import time
+import itertools
+from html import escape
+from typing import Dict, Any, List, Optional, Tuple
+
+# Server-side replica of a tab's DOM
+#
+# BridgeEngine serializes the page once (MIRROR_INIT) and then streams coalesced
+# MutationObserver changes (MIRROR_DIFF). Read-only DOM queries are answered from
+# the replica instead of a round-trip to the tab.
+#
+#   element    {"i": id, "t": tag, "a": {name: value}, "c": [children]}
+#   text       {"i": id, "x": text}
+#   reference  {"r": id}   an already-mirrored node that stays under the same parent
+#
+#   MIRROR_INIT  {"gen", "seq": 0, "url", "root": element}
+#   MIRROR_DIFF  {"gen", "seq", "ops": [...]}
+#       {"o": "c", "i": parent, "c": [node | reference, ...]}   new child list
+#       {"o": "a", "i": element, "n": name, "v": value | null}   attribute set / removed
+#       {"o": "t", "i": text node, "x": text}                     character data
+#
+# Diffs are numbered per generation; a gap or an op on an unknown node raises
+# MirrorDesync and the server asks the tab for a fresh INIT. Script, style, noscript
+# and template contents and form field values are not mirrored, and inner_text only
+# approximates the browser's layout-aware innerText.
+
+VOID_TAGS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"
+))
+HIDDEN_TAGS = frozenset(("script", "style", "noscript", "template", "head"))
+BLOCK_TAGS = frozenset((
+    "address", "article", "aside", "blockquote", "body", "dd", "details", "dialog", "div", "dl", "dt",
+    "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+    "hr", "html", "li", "main", "nav", "ol", "p", "pre", "section", "summary", "table", "tr", "ul"
+))
+PREFORMATTED_TAGS = frozenset(("pre", "textarea"))
+TEXT_PREVIEW_CHARS = 200
+
+class MirrorDesync(Exception):
+    """A diff does not apply to the current replica; the tab has to send a fresh INIT"""
+
+class UnsupportedSelector(ValueError):
+    """The selector uses CSS the mirror cannot evaluate; the tab has to answer instead"""
+
+class Node:
+    __slots__ = ("id", "tag", "attrs", "text", "children", "parent")
+
+    def __init__(self, node_id: int, parent: Optional["Node"], tag: Optional[str] = None, text: str = ""):
+        self.id = node_id
+        self.parent = parent
+        self.tag = tag
+        self.attrs: Dict[str, str] = {}
+        self.text = text
+        self.children: List["Node"] = []
+
+    @property
+    def is_element(self) -> bool:
+        return self.tag is not None
+
+    def element_siblings(self) -> List["Node"]:
+        if self.parent is None:
+            return [self]
+        return [c for c in self.parent.children if c.tag is not None]
+
+    def iter_elements(self):
+        """Descendant elements in document order (excluding self)"""
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            if node.tag is not None:
+                yield node
+                stack.extend(reversed(node.children))
+
+def _build(data: dict, parent: Optional[Node], index: Dict[int, Node]) -> Node:
+    """Build a serialized subtree iteratively (pages can be deeper than the recursion limit)"""
+    root = None
+    stack: List[Tuple[dict, Optional[Node], int]] = [(data, parent, -1)]
+    while stack:
+        item, owner, pos = stack.pop()
+        if "x" in item:
+            node = Node(item["i"], owner, text=item["x"])
+        else:
+            node = Node(item["i"], owner, tag=item["t"].lower())
+            node.attrs = dict(item.get("a") or {})
+            children = item.get("c") or ()
+            node.children = [None] * len(children)
+            stack.extend((children[k], node, k) for k in range(len(children)))
+        index[node.id] = node
+        if pos < 0:
+            root = node
+        else:
+            owner.children[pos] = node
+    return root
+
+class DomMirror:
+    def __init__(self, gen: Any, url: Optional[str], root: Node, index: Dict[int, Node]):
+        self.gen = gen
+        self.seq = 0
+        self.url = url
+        self.root = root
+        self.index = index
+        # Last time the tab confirmed the replica is current (a diff, or a PONG with our seq)
+        self.confirmed_at = time.monotonic()
+
+    @classmethod
+    def from_init(cls, frame: dict) -> "DomMirror":
+        index: Dict[int, Node] = {}
+        root = _build(frame["root"], None, index)
+        return cls(frame.get("gen"), frame.get("url"), root, index)
+
+    @property
+    def size(self) -> int:
+        return len(self.index)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.confirmed_at
+
+    def confirm(self, gen: Any, seq: Any):
+        if gen == self.gen and seq == self.seq:
+            self.confirmed_at = time.monotonic()
+
+    def apply(self, frame: dict) -> bool:
+        """Apply one MIRROR_DIFF; False if it belongs to an older generation"""
+        if frame.get("gen") != self.gen:
+            return False
+        if frame.get("seq") != self.seq + 1:
+            raise MirrorDesync(f"expected diff {self.seq + 1}, got {frame.get('seq')}")
+
+        detached: List[Node] = []
+        for op in frame.get("ops") or ():
+            node = self.index.get(op.get("i"))
+            if node is None:
+                raise MirrorDesync(f"unknown node {op.get('i')}")
+            kind = op.get("o")
+            if kind == "c":
+                detached.extend(self._set_children(node, op.get("c") or ()))
+            elif kind == "a":
+                if op.get("v") is None:
+                    node.attrs.pop(op.get("n"), None)
+                else:
+                    node.attrs[op["n"]] = op["v"]
+            elif kind == "t":
+                node.text = op.get("x") or ""
+            else:
+                raise MirrorDesync(f"unknown op {kind!r}")
+
+        # Nodes that were moved elsewhere in this diff have been re-indexed already
+        for node in detached:
+            if node.parent is None:
+                self._unindex(node)
+        self.seq += 1
+        self.confirmed_at = time.monotonic()
+        return True
+
+    def _set_children(self, parent: Node, items) -> List[Node]:
+        children = []
+        for item in items:
+            ref = item.get("r")
+            if ref is None:
+                children.append(_build(item, parent, self.index))
+                continue
+            child = self.index.get(ref)
+            if child is None or child.parent is not parent:
+                raise MirrorDesync(f"node {ref} is not a child of {parent.id}")
+            children.append(child)
+
+        kept = set(map(id, children))
+        removed = [c for c in parent.children if id(c) not in kept]
+        for child in removed:
+            child.parent = None
+        parent.children = children
+        return removed
+
+    def _unindex(self, node: Node):
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if self.index.get(current.id) is current:
+                del self.index[current.id]
+            stack.extend(current.children)
+
+    # --- Queries ---
+
+    def select(self, selector: str, limit: Optional[int] = None) -> List[Node]:
+        """document.querySelectorAll for the supported CSS subset, in document order"""
+        groups = compile_selector(selector)
+        matches = []
+        if not self.root.is_element:
+            return matches
+        for node in itertools.chain((self.root,), self.root.iter_elements()):
+            if any(_match_complex(node, parts, len(parts) - 1) for parts in groups):
+                matches.append(node)
+                if limit is not None and len(matches) >= limit:
+                    break
+        return matches
+
+    def get_dom(self, selector: str = "body") -> dict:
+        """Same shape as the tab's get_dom built-in"""
+        found = self.select(selector, limit=1)
+        if not found:
+            return {}
+        return {"html": inner_html(found[0]), "text": inner_text(found[0])}
+
+    def query(self, selector: Optional[str] = None, text: Optional[str] = None, limit: int = 20, html: bool = False) -> dict:
+        """Elements matching a selector and/or containing some text (deepest matches only)"""
+        needle = text.lower() if text else None
+        if selector:
+            matches = self.select(selector)
+            if needle:
+                matches = _deepest([el for el in matches if needle in inner_text(el).lower()])
+        elif needle:
+            matches = []
+            seen = set()
+            for node in _iter_text_nodes(self.root):
+                el = node.parent
+                if id(el) not in seen and needle in node.text.lower():
+                    seen.add(id(el))
+                    matches.append(el)
+        else:
+            return {"error": "'selector' or 'text' is required"}
+
+        items = []
+        for el in matches[:max(0, limit)]:
+            item = {"tag": el.tag, "attrs": dict(el.attrs), "text": inner_text(el)[:TEXT_PREVIEW_CHARS]}
+            if html:
+                item["html"] = outer_html(el)
+            items.append(item)
+        return {"count": len(matches), "matches": items}
+
+def _deepest(matches: List[Node]) -> List[Node]:
+    """Drop matches that contain another match"""
+    has_inner = set()
+    for el in matches:
+        parent = el.parent
+        while parent is not None and id(parent) not in has_inner:
+            has_inner.add(id(parent))
+            parent = parent.parent
+    return [el for el in matches if id(el) not in has_inner]
+
+def _iter_text_nodes(root: Node):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.tag is None:
+            yield node
+        elif node.tag not in HIDDEN_TAGS:
+            stack.extend(reversed(node.children))
+
+# --- Serialization ---
+
+def outer_html(node: Node) -> str:
+    parts: List[str] = []
+    _serialize(node, parts)
+    return "".join(parts)
+
+def inner_html(node: Node) -> str:
+    parts: List[str] = []
+    for child in node.children:
+        _serialize(child, parts)
+    return "".join(parts)
+
+def _serialize(node: Node, parts: List[str]):
+    stack: List[Any] = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        if item.tag is None:
+            parent = item.parent.tag if item.parent is not None else None
+            parts.append(item.text if parent in HIDDEN_TAGS else escape(item.text, quote=False).replace("\xa0", "&nbsp;"))
+            continue
+        attrs = "".join(
+            f' {name}="{value.replace("&", "&amp;").replace(chr(34), "&quot;").replace(chr(160), "&nbsp;")}"'
+            for name, value in item.attrs.items()
+        )
+        parts.append(f"<{item.tag}{attrs}>")
+        if item.tag in VOID_TAGS:
+            continue
+        stack.append(f"</{item.tag}>")
+        stack.extend(reversed(item.children))
+
+def _is_hidden(node: Node) -> bool:
+    if node.tag in HIDDEN_TAGS or "hidden" in node.attrs:
+        return True
+    style = node.attrs.get("style")
+    return bool(style) and re.search(r"display\s*:\s*none", style) is not None
+
+def inner_text(node: Node) -> str:
+    """Rough innerText: hidden subtrees skipped, whitespace collapsed, blocks on their own lines"""
+    parts: List[str] = []
+    stack: List[Tuple[Any, bool]] = [(node, False)]
+    while stack:
+        item, pre = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        if item.tag is None:
+            parts.append(item.text if pre else re.sub(r"\s+", " ", item.text))
+            continue
+        if item is not node and _is_hidden(item):
+            continue
+        if item.tag == "br":
+            parts.append("\n")
+            continue
+        pre = pre or item.tag in PREFORMATTED_TAGS
+        if item.tag in BLOCK_TAGS:
+            parts.append("\n")
+            stack.append(("\n", pre))
+        elif item.tag in ("td", "th"):
+            stack.append(("\t", pre))
+        stack.extend((child, pre) for child in reversed(item.children))
+
+    lines = (line.strip(" ") for line in "".join(parts).split("\n"))
+    return "\n".join(line for line in lines if line.strip())
+
+# --- CSS selectors (querySelectorAll subset) ---
+
+_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comb>[>+~])
+  | (?P<comma>,)
+  | (?P<tag>\*|[a-zA-Z][\w-]*)
+  | (?P<id>\#[\w-]+)
+  | (?P<cls>\.[\w-]+)
+  | (?P<attr>\[\s*(?P<name>[\w:-]+)\s*(?:(?P<op>[~|^$*]?=)\s*(?P<value>"[^"]*"|'[^']*'|[^\]\s"']+)\s*(?P<flag>[iI])?\s*)?\])
+  | (?P<pseudo>:(?P<pname>[\w-]+)(?:\((?P<parg>[^()]*)\))?)
+""", re.X)
+
+class Compound:
+    __slots__ = ("tag", "ids", "classes", "attrs", "pseudos")
+
+    def __init__(self):
+        self.tag: Optional[str] = None
+        self.ids: List[str] = []
+        self.classes: List[str] = []
+        self.attrs: List[Tuple[str, Optional[str], Optional[str], bool]] = []
+        self.pseudos: List[Tuple[str, Any]] = []
+
+_compiled: Dict[str, List[List[Tuple[Optional[str], Compound]]]] = {}
+
+def compile_selector(selector: str) -> List[List[Tuple[Optional[str], Compound]]]:
+    """Parse a selector list into [[(combinator, compound), ...], ...]; results are memoized"""
+    groups = _compiled.get(selector)
+    if groups is not None:
+        return groups
+
+    groups = []
+    parts: List[Tuple[Optional[str], Compound]] = []
+    compound: Optional[Compound] = None
+    combinator: Optional[str] = None
+    pos = 0
+    text = selector.strip()
+
+    def close():
+        nonlocal compound, combinator
+        if compound is not None:
+            parts.append((combinator if parts else None, compound))
+            compound = None
+            combinator = None
+
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None:
+            raise UnsupportedSelector(f"Unsupported selector: {selector!r}")
+        pos = m.end()
+        kind = next(k for k in ("ws", "comb", "comma", "tag", "id", "cls", "attr", "pseudo") if m.group(k) is not None)
+
+        if kind == "ws":
+            if compound is not None:
+                close()
+                combinator = " "
+            continue
+        if kind == "comb":
+            if compound is not None:
+                close()
+            if not parts:
+                raise UnsupportedSelector(f"Unsupported selector: {selector!r}")
+            combinator = m.group("comb")
+            continue
+        if kind == "comma":
+            close()
+            if not parts:
+                raise UnsupportedSelector(f"Unsupported selector: {selector!r}")
+            groups.append(parts)
+            parts = []
+            combinator = None
+            continue
+
+        if compound is None:
+            compound = Compound()
+        if kind == "tag":
+            if compound.tag is not None or compound.ids or compound.classes or compound.attrs or compound.pseudos:
+                raise UnsupportedSelector(f"Unsupported selector: {selector!r}")
+            compound.tag = m.group("tag").lower()
+        elif kind == "id":
+            compound.ids.append(m.group("id")[1:])
+        elif kind == "cls":
+            compound.classes.append(m.group("cls")[1:])
+        elif kind == "attr":
+            value = m.group("value")
+            if value is not None and value[:1] in ("'", '"'):
+                value = value[1:-1]
+            compound.attrs.append((m.group("name").lower(), m.group("op"), value, m.group("flag") is not None))
+        else:
+            compound.pseudos.append(_compile_pseudo(m.group("pname").lower(), m.group("parg"), selector))
+
+    close()
+    if not parts or (combinator is not None and combinator != " "):
+        raise UnsupportedSelector(f"Unsupported selector: {selector!r}")
+    groups.append(parts)
+
+    if len(_compiled) > 256:
+        _compiled.clear()
+    _compiled[selector] = groups
+    return groups
+
+def _compile_pseudo(name: str, arg: Optional[str], selector: str) -> Tuple[str, Any]:
+    if name in ("first-child", "last-child", "only-child", "empty", "root") and arg is None:
+        return name, None
+    if name == "nth-child" and arg is not None:
+        arg = arg.strip().lower()
+        if arg == "odd":
+            return name, (2, 1)
+        if arg == "even":
+            return name, (2, 0)
+        if arg.isdigit():
+            return name, (0, int(arg))
+    if name == "not" and arg is not None:
+        groups = compile_selector(arg)
+        if any(len(parts) != 1 for parts in groups):
+            raise UnsupportedSelector(f"Unsupported selector: {selector!r}")
+        return name, [parts[0][1] for parts in groups]
+    raise UnsupportedSelector(f"Unsupported selector: {selector!r}")
+
+def _match_attr(node: Node, name: str, op: Optional[str], value: Optional[str], fold: bool) -> bool:
+    actual = node.attrs.get(name)
+    if actual is None:
+        return False
+    if op is None:
+        return True
+    if fold:
+        actual, value = actual.lower(), value.lower()
+    if op == "=":
+        return actual == value
+    if op == "~=":
+        return value in actual.split()
+    if op == "|=":
+        return actual == value or actual.startswith(value + "-")
+    if not value:
+        return False
+    if op == "^=":
+        return actual.startswith(value)
+    if op == "$=":
+        return actual.endswith(value)
+    return value in actual
+
+def _match_compound(node: Node, compound: Compound) -> bool:
+    if compound.tag is not None and compound.tag != "*" and node.tag != compound.tag:
+        return False
+    if compound.ids and any(node.attrs.get("id") != i for i in compound.ids):
+        return False
+    if compound.classes:
+        classes = node.attrs.get("class", "").split()
+        if any(c not in classes for c in compound.classes):
+            return False
+    for name, op, value, fold in compound.attrs:
+        if not _match_attr(node, name, op, value, fold):
+            return False
+    for name, arg in compound.pseudos:
+        if name == "not":
+            if any(_match_compound(node, c) for c in arg):
+                return False
+        elif name == "root":
+            if node.parent is not None:
+                return False
+        elif name == "empty":
+            if any(c.tag is not None or c.text for c in node.children):
+                return False
+        else:
+            siblings = node.element_siblings()
+            if name == "first-child" and siblings[0] is not node:
+                return False
+            if name == "last-child" and siblings[-1] is not node:
+                return False
+            if name == "only-child" and len(siblings) != 1:
+                return False
+            if name == "nth-child":
+                step, offset = arg
+                position = next(i for i, s in enumerate(siblings, 1) if s is node)
+                if (step == 0 and position != offset) or (step and (position - offset) % step):
+                    return False
+    return True
+
+def _match_complex(node: Node, parts: List[Tuple[Optional[str], Compound]], i: int) -> bool:
+    combinator, compound = parts[i]
+    if not _match_compound(node, compound):
+        return False
+    if i == 0:
+        return True
+    if combinator == ">":
+        return node.parent is not None and _match_complex(node.parent, parts, i - 1)
+    if combinator == " ":
+        ancestor = node.parent
+        while ancestor is not None:
+            if _match_complex(ancestor, parts, i - 1):
+                return True
+            ancestor = ancestor.parent
+        return False
+    siblings = node.element_siblings()
+    before = siblings[:next(k for k, s in enumerate(siblings) if s is node)]
+    if combinator == "+":
+        return bool(before) and _match_complex(before[-1], parts, i - 1)
+    return any(_match_complex(s, parts, i - 1) for s in before)
@@ -1,15 +1,46 @@
 import os
+import io
+import sys
+import atexit
+import logging
+import logging.handlers
+import queue
+import secrets
+import socket
 import json
+import base64
+import copy
 import asyncio
+import hashlib
+import tempfile
+import time
 import uuid
-from typing import Dict, Any, List, Optional
-from contextlib import asynccontextmanager
+import zlib
+import fnmatch
+import sqlite3
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from contextlib import asynccontextmanager, suppress
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 import uvicorn
 
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it screenshots are returned as captured
+    Image = None
+
+from snapshot_store import SnapshotStore, iter_file, iter_text, iter_base64
+from snapshot_archive import SnapshotArchive
+from metrics import Registry
+from cluster import ClusterRouter, make_broker
+from dom_mirror import DomMirror, MirrorDesync, UnsupportedSelector
+from tracing import Tracer, SPAN_KIND_SERVER, SPAN_KIND_CLIENT
+
 # MCP Imports
 from mcp.server import Server
 from mcp.server.sse import SseServerTransport
@@ -17,116 +48,1929 @@ from mcp.types import Tool, TextContent, ImageContent, EmbeddedResource
 
 # Configuration
 BRIDGE_TOKEN = os.getenv("MCP_BRIDGE_TOKEN", "RODION_DEV_SECRET_2026")
+TOOLS_PATH = os.path.join(os.path.dirname(__file__), "tools.json")
+TOOLS_POLL_INTERVAL = float(os.getenv("MCP_TOOLS_POLL_INTERVAL", "1.0"))
+TOOLS_HISTORY_SIZE = 16
+LOG_DIR = os.getenv("MCP_LOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs"))
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+LOG_QUEUE_SIZE = 10000
+LOG_WRITE_BATCH = 500
+SNAPSHOT_DIR = os.getenv(
+    "MCP_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "snapshots")
+)
+# Full-text index of the snapshots directory (legacy snapshot_*.html files and the store),
+# refreshed incrementally in the background at startup, after each /snapshot and when
+# searched (searches themselves never wait for it)
+SNAPSHOT_INDEX = os.getenv("MCP_SNAPSHOT_INDEX", os.path.join(SNAPSHOT_DIR, "store", "archive.sqlite3"))
+# GET /snapshots/search streams up to SNAPSHOT_STREAM_LIMIT hits unless asked for more,
+# fetching SNAPSHOT_PAGE_SIZE at a time
+SNAPSHOT_STREAM_LIMIT = 100
+SNAPSHOT_STREAM_MAX = 10000
+SNAPSHOT_PAGE_SIZE = 100
+FANOUT_CONCURRENCY = int(os.getenv("MCP_FANOUT_CONCURRENCY", "16"))
+# Per-tab backpressure: concurrent requests in the tab, and requests allowed to wait for a slot
+TAB_MAX_INFLIGHT = int(os.getenv("MCP_TAB_MAX_INFLIGHT", "4"))
+TAB_MAX_QUEUE = int(os.getenv("MCP_TAB_MAX_QUEUE", "32"))
+# Default deadline for a tool call in seconds; tools.json entries may set "timeout" and
+# callers may pass a "deadline" argument. The tab is told to abort work past its deadline.
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("MCP_TOOL_TIMEOUT", "30"))
+# Seconds a dropped tab may take to resume its session (same ID, pending requests kept); 0 disables
+RESUME_GRACE = float(os.getenv("MCP_RESUME_GRACE", "30"))
+# Seconds a call addressed to a suspended tab waits for it to resume before failing
+RESUME_WAIT = float(os.getenv("MCP_RESUME_WAIT", "5"))
+# Tabs are pinged every HEARTBEAT_INTERVAL seconds; one silent for HEARTBEAT_TIMEOUT is evicted
+HEARTBEAT_INTERVAL = float(os.getenv("MCP_HEARTBEAT_INTERVAL", "5"))
+HEARTBEAT_TIMEOUT = float(os.getenv("MCP_HEARTBEAT_TIMEOUT", "20"))
+# Opt-in DOM mirror: tabs stream their DOM and get_dom / query_dom are answered here.
+# A mirror the tab has not confirmed (by a diff or a PONG) for MIRROR_MAX_AGE seconds
+# is considered stale and the tab is asked instead; keep it above the heartbeat interval.
+DOM_MIRROR = os.getenv("MCP_DOM_MIRROR") == "1"
+MIRROR_MAX_AGE = float(os.getenv("MCP_MIRROR_MAX_AGE", "15"))
+# Weight of the newest sample in the smoothed round-trip time
+RTT_SMOOTHING = 0.2
+# Assumed round-trip time of a tab that has not answered a ping yet
+DEFAULT_RTT = 0.05
+# Wire encoding: tabs may opt into zlib-compressed binary frames with ?encoding=deflate
+WS_ENCODINGS = ("json", "deflate")
+COMPRESS_THRESHOLD = int(os.getenv("MCP_COMPRESS_THRESHOLD", "4096"))
+COMPRESS_LEVEL = 6
+DECOMPRESS_OFFLOAD_SIZE = 1024 * 1024
+# Binary frames starting with this magic carry a JSON header plus a raw payload (e.g. images)
+BINARY_FRAME_MAGIC = b"RMB1"
+SCREENSHOT_CACHE_TTL = float(os.getenv("MCP_SCREENSHOT_CACHE_TTL", "2.0"))
+SCREENSHOT_FORMATS = ("png", "jpeg", "webp")
+IMAGE_WORKERS = 2
+# Streamed results: tabs split large results into CHUNK frames. Anything larger than
+# RESULT_INLINE_LIMIT is spooled to disk and exposed through a read_result handle.
+RESULT_INLINE_LIMIT = int(os.getenv("MCP_RESULT_INLINE_LIMIT", str(1024 * 1024)))
+RESULT_PREVIEW_CHARS = 4000
+RESULT_TTL = 600.0
+RESULT_STORE_SIZE = 64
+# Results of read-only tools marked {"cache": {"ttl": seconds}} in tools.json are reused
+# until the TTL expires or the tab reports a change; the cache is bounded in bytes
+RESULT_CACHE_BYTES = int(os.getenv("MCP_RESULT_CACHE_BYTES", str(16 * 1024 * 1024)))
+# Results returned to MCP clients are compact JSON unless MCP_PRETTY_JSON=1
+RESULT_INDENT = 2 if os.getenv("MCP_PRETTY_JSON") == "1" else None
+# Multi-worker mode: with MCP_WORKERS > 1 every worker process shares tab ownership
+# through MCP_BROKER_URL (memory:// for one process, redis://host:6379/0 or
+# unix:///path/to/redis.sock across processes) and forwards calls to the owning worker
+BROKER_URL = os.getenv("MCP_BROKER_URL")
+WORKERS = int(os.getenv("MCP_WORKERS", "1"))
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+# Extra time a forwarding worker waits beyond the call's own timeout
+CLUSTER_FORWARD_MARGIN = 5.0
+# Request tracing (OTLP/JSON): MCP_TRACE_FILE appends spans to a local file, MCP_TRACE_ENDPOINT
+# posts them to an OTLP/HTTP collector (e.g. http://localhost:4318/v1/traces); off when neither is set
+TRACE_FILE = os.getenv("MCP_TRACE_FILE")
+TRACE_ENDPOINT = os.getenv("MCP_TRACE_ENDPOINT")
+TRACE_SAMPLE_RATE = float(os.getenv("MCP_TRACE_SAMPLE_RATE", "1.0"))
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dump_result(result: Any) -> str:
+    if RESULT_INDENT is not None:
+        return json.dumps(result, indent=RESULT_INDENT, ensure_ascii=False, default=_json_default)
+    return json.dumps(result, separators=(",", ":"), ensure_ascii=False, default=_json_default)
+
+# --- Logging ---
+#
+# Everything goes through stdlib logging: disabled levels cost a single level check
+# (messages use lazy %-formatting), records are handed to a QueueHandler and written
+# to stderr by a background QueueListener thread, so the event loop never blocks on
+# output. Per-call events use the "mcp_bridge.calls" logger, which can be sampled.
+
+LOG_LEVEL = os.getenv("MCP_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("MCP_LOG_FORMAT", "text")  # text | json
+LOG_SAMPLE_EVERY = int(os.getenv("MCP_LOG_SAMPLE_EVERY", "1"))
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class SamplingFilter(logging.Filter):
+    """Lets through one of every `every` records per message template; WARNING and above always pass"""
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._counts: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.every == 1:
+            return True
+        seen = self._counts.get(record.msg, 0)
+        self._counts[record.msg] = seen + 1
+        return seen % self.every == 0
+
+def setup_logging() -> logging.handlers.QueueListener:
+    root = logging.getLogger("mcp_bridge")
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+    stream = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonLogFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(name)s] %(message)s"))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logging.getLogger("mcp_bridge.calls").addFilter(SamplingFilter(LOG_SAMPLE_EVERY))
+    return listener
+
+log_listener = setup_logging()
+tools_log = logging.getLogger("mcp_bridge.tools")
+bridge_log = logging.getLogger("mcp_bridge.bridge")
+calls_log = logging.getLogger("mcp_bridge.calls")
+mcp_log = logging.getLogger("mcp_bridge.mcp")
+sse_log = logging.getLogger("mcp_bridge.sse")
+store_log = logging.getLogger("mcp_bridge.store")
+server_log = logging.getLogger("mcp_bridge.server")
+
+# --- Metrics ---
+
+metrics = Registry()
+TOOL_CALLS = metrics.counter(
+    "bridge_tool_calls_total", "Tool calls by tool, tab and outcome (ok/error/timeout/disconnected/busy)",
+    ("tool", "tab", "outcome")
+)
+TOOL_LATENCY = metrics.histogram(
+    "bridge_tool_latency_seconds", "Round-trip time from sending a request to the tab until its reply", ("tool",)
+)
+QUEUE_WAIT = metrics.histogram("bridge_queue_wait_seconds", "Time spent waiting for a free slot on the tab")
+DISCONNECT_FAILURES = metrics.counter(
+    "bridge_disconnect_failures_total", "Pending requests failed because their tab disconnected"
+)
+PENDING_REQUESTS = metrics.gauge("bridge_pending_requests", "Requests awaiting a reply, per tab", ("tab",))
+QUEUED_REQUESTS = metrics.gauge("bridge_queued_requests", "Requests waiting for a free slot, per tab", ("tab",))
+TAB_RTT = metrics.gauge("bridge_tab_rtt_seconds", "Smoothed ping round-trip time, per tab", ("tab",))
+TAB_LOOP_LAG = metrics.gauge("bridge_tab_loop_lag_seconds", "Event-loop lag reported by the tab", ("tab",))
+HEARTBEAT_EVICTIONS = metrics.counter("bridge_heartbeat_evictions_total", "Tabs dropped for not answering pings")
+TAB_RESUMES = metrics.counter("bridge_tab_resumes_total", "Tabs that resumed their session after a dropped socket")
+RESULT_CACHE_LOOKUPS = metrics.counter(
+    "bridge_result_cache_lookups_total", "Result cache lookups for cacheable tools", ("outcome",)
+)
+RESULT_CACHE_SIZE = metrics.gauge("bridge_result_cache_bytes", "Approximate size of cached tool results")
+MIRROR_QUERIES = metrics.counter(
+    "bridge_mirror_queries_total", "DOM reads answered from the mirror or passed on to the tab", ("tool", "outcome")
+)
+MIRROR_RESYNCS = metrics.counter("bridge_mirror_resyncs_total", "DOM mirrors rebuilt after a missed or inconsistent diff")
+MIRROR_NODES = metrics.gauge("bridge_mirror_nodes", "Nodes in the DOM mirror, per tab", ("tab",))
+SNAPSHOT_SEARCH_LATENCY = metrics.histogram(
+    "bridge_snapshot_search_seconds", "Time to fetch one page of snapshot search results"
+)
+ARCHIVED_SNAPSHOTS = metrics.gauge("bridge_archived_snapshots", "Snapshots in the full-text index")
+CONNECTED_TABS = metrics.gauge("bridge_connected_tabs", "Currently connected browser tabs")
+SSE_SESSIONS = metrics.gauge("mcp_sse_sessions", "Open MCP SSE sessions")
+WS_BYTES = metrics.counter(
+    "bridge_ws_bytes_total", "WebSocket payload bytes (text frames counted as UTF-8)",
+    ("direction",)
+)
+
+# --- Tracing ---
+
+tracer = Tracer("mcp-bridge", TRACE_FILE, TRACE_ENDPOINT, TRACE_SAMPLE_RATE, {"service.instance.id": WORKER_ID})
+
+# --- Tool Registry (tools.json cache) ---
+
+BUILTIN_TOOLS = [
+    Tool(
+        name="list_tabs",
+        description="Returns a list of all connected browser tabs with their IDs and URLs.",
+        inputSchema={
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    ),
+    Tool(
+        name="screenshot",
+        description="Takes a screenshot of a browser tab",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "tab_id": {
+                    "type": "string",
+                    "description": "Tab ID or 'latest'",
+                    "default": "latest"
+                },
+                "format": {
+                    "type": "string",
+                    "enum": list(SCREENSHOT_FORMATS),
+                    "default": "png"
+                },
+                "quality": {
+                    "type": "number",
+                    "description": "Encoder quality for jpeg/webp, 0..1",
+                    "default": 0.8
+                },
+                "max_width": {
+                    "type": "integer",
+                    "description": "Downscale the image to at most this many pixels wide"
+                },
+                "full_page": {
+                    "type": "boolean",
+                    "description": "Capture the whole page instead of the visible viewport",
+                    "default": False
+                }
+            },
+            "required": []
+        }
+    ),
+    Tool(
+        name="query_dom",
+        description="Finds elements by CSS selector and/or contained text and returns their tag, attributes "
+                    "and text. Answered from the server-side DOM mirror when it is enabled and fresh.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "tab_id": {
+                    "type": "string",
+                    "description": "Tab ID or 'latest'",
+                    "default": "latest"
+                },
+                "selector": {
+                    "type": "string",
+                    "description": "CSS selector, e.g. 'form input[name=q]'"
+                },
+                "text": {
+                    "type": "string",
+                    "description": "Case-insensitive text the elements must contain (innermost matches only)"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Maximum number of elements returned",
+                    "default": 20
+                },
+                "html": {
+                    "type": "boolean",
+                    "description": "Include each element's outer HTML",
+                    "default": False
+                },
+                "max_age": {
+                    "type": "number",
+                    "description": "Oldest acceptable mirror state in seconds; older mirrors are bypassed"
+                }
+            },
+            "required": []
+        }
+    ),
+    Tool(
+        name="batch_execute",
+        description="Runs several browser tools on one tab in a single round-trip. "
+                    "Results are returned in call order; failed calls report an error instead of a result.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "tab_id": {
+                    "type": "string",
+                    "description": "Tab ID or 'latest'",
+                    "default": "latest"
+                },
+                "calls": {
+                    "type": "array",
+                    "description": "Tool calls to run, e.g. [{\"name\": \"getCookies\", \"arguments\": {}}]",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {"type": "string"},
+                            "arguments": {"type": "object"}
+                        },
+                        "required": ["name"]
+                    }
+                },
+                "concurrent": {
+                    "type": "boolean",
+                    "description": "Run calls concurrently in the tab instead of one after another",
+                    "default": False
+                },
+                "stop_on_error": {
+                    "type": "boolean",
+                    "description": "In sequential mode, skip remaining calls after the first failure",
+                    "default": False
+                }
+            },
+            "required": ["calls"]
+        }
+    ),
+    Tool(
+        name="fanout_execute",
+        description="Runs one browser tool on many tabs concurrently and reports successes and failures per tab.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "name": {
+                    "type": "string",
+                    "description": "Tool to run in every selected tab"
+                },
+                "arguments": {
+                    "type": "object",
+                    "description": "Arguments passed to the tool"
+                },
+                "tabs": {
+                    "description": "'all', a list of tab IDs, or a selector: 'host:<hostname>', 'ua:<user agent>', 'url:<glob>'",
+                    "anyOf": [
+                        {"type": "string"},
+                        {"type": "array", "items": {"type": "string"}}
+                    ],
+                    "default": "all"
+                },
+                "concurrency": {
+                    "type": "integer",
+                    "description": "Maximum number of tabs running the tool at once"
+                },
+                "timeout": {
+                    "type": "number",
+                    "description": "Per-tab timeout in seconds (defaults to the tool's own timeout)"
+                }
+            },
+            "required": ["name"]
+        }
+    ),
+    Tool(
+        name="search_snapshots",
+        description="Full-text search over saved page snapshots (URL, title and visible text). "
+                    "Returns one page of hits with a cursor for the next; a hit's HTML is served at "
+                    "GET /snapshots/<id> and its screenshot at GET /snapshots/<id>?image=true.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "Words to find, or SQLite FTS5 syntax (\"exact phrase\", OR, NOT, prefix*, title:word)"
+                },
+                "url": {
+                    "type": "string",
+                    "description": "Only snapshots whose URL contains this text (or matches this glob)"
+                },
+                "since": {
+                    "type": "string",
+                    "description": "Only snapshots taken at or after this ISO 8601 time"
+                },
+                "until": {
+                    "type": "string",
+                    "description": "Only snapshots taken before this ISO 8601 time"
+                },
+                "order": {
+                    "type": "string",
+                    "enum": ["rank", "newest", "oldest"],
+                    "default": "rank"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Hits per page",
+                    "default": 10
+                },
+                "cursor": {
+                    "type": "string",
+                    "description": "next_cursor of the previous page"
+                }
+            },
+            "required": []
+        }
+    ),
+    Tool(
+        name="read_result",
+        description="Reads part of a large tool result that was returned as a truncated preview with a handle.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "handle": {
+                    "type": "string",
+                    "description": "Handle from the truncated result"
+                },
+                "offset": {
+                    "type": "integer",
+                    "description": "Byte offset into the serialized result",
+                    "default": 0
+                },
+                "length": {
+                    "type": "integer",
+                    "description": "Number of bytes to read",
+                    "default": 65536
+                }
+            },
+            "required": ["handle"]
+        }
+    ),
+]
+
+# Tab built-ins that are safe to cache (tools.json entries opt in with "cache")
+BUILTIN_CACHE_TTLS = {"get_dom": 2.0}
+# Read-only built-ins that are not cached here but must not invalidate the cache either
+# (screenshots have their own view-keyed cache, DOM queries the mirror)
+READ_ONLY_BUILTINS = ("screenshot", "query_dom")
+# Tab built-ins the DOM mirror can answer
+MIRROR_TOOLS = ("get_dom", "query_dom")
+
+class ToolRegistry:
+    """Parses tools.json once and re-parses it only when the file changes on disk"""
+    def __init__(self, path: str, poll_interval: float = TOOLS_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.definitions: List[dict] = []
+        self.tools: List[Tool] = list(BUILTIN_TOOLS)
+        self.by_name: Dict[str, dict] = {}
+        self.fingerprints: Dict[str, str] = {}
+        # Read-only tools whose results may be cached: name -> TTL in seconds
+        self.cache_ttls: Dict[str, float] = dict(BUILTIN_CACHE_TTLS)
+        # Per-tool deadlines from tools.json ("timeout", seconds)
+        self.timeouts: Dict[str, float] = {}
+        self.manifest: str = json.dumps({"type": "TOOLS_MANIFEST", "version": None, "tools": []})
+        self.content_hash: Optional[str] = None
+        self.version: Optional[str] = None
+        # Recent manifest versions -> per-tool fingerprints, used to compute deltas
+        self._history: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._stat_key: Optional[tuple] = None
+        self._watcher: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[], Awaitable[None]]] = []
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _build_tool(dt: dict) -> Tool:
+        schema = copy.deepcopy(dt.get("parameters", dt.get("input_schema", {"type": "object", "properties": {}})))
+        if "properties" not in schema:
+            schema["properties"] = {}
+
+        if "tab_id" not in schema["properties"]:
+            schema["properties"]["tab_id"] = {
+                "type": "string",
+                "description": "Target Browser Tab ID, 'latest', 'host:<hostname>', 'ua:<user agent>', 'url:<glob>', "
+                               "or 'any' / 'any:<selector>' for the least busy, most responsive match",
+                "default": "latest"
+            }
+        if "deadline" not in schema["properties"]:
+            schema["properties"]["deadline"] = {
+                "type": "number",
+                "description": "Seconds to wait for the tab before the call is cancelled there"
+            }
+
+        return Tool(
+            name=dt["name"],
+            description=dt.get("explain_for_ai", dt.get("description", "")),
+            inputSchema=schema
+        )
+
+    @staticmethod
+    def fingerprint(dt: dict) -> str:
+        """Per-tool identity: declared version plus a hash of the whole definition"""
+        digest = hashlib.sha1(json.dumps(dt, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        return f"{dt.get('version', '0')}:{digest}"
+
+    def reload(self) -> bool:
+        """Re-read tools.json. Returns True only if its content actually changed."""
+        stat_key = self._stat()
+        if stat_key is None:
+            tools_log.warning("⚠️  %s not found", self.path)
+            self._stat_key = None
+            return False
+
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        self._stat_key = stat_key
+
+        content_hash = hashlib.sha256(raw).hexdigest()
+        if content_hash == self.content_hash:
+            return False
+
+        definitions = json.loads(raw)
+        tools = list(BUILTIN_TOOLS)
+        for dt in definitions:
+            try:
+                tools.append(self._build_tool(dt))
+            except Exception as e:
+                tools_log.warning("⚠️  Skipping invalid tool %s: %s", dt.get("name"), e)
+
+        version = content_hash[:12]
+        self.definitions = definitions
+        self.by_name = {dt["name"]: dt for dt in definitions if "name" in dt}
+        self.fingerprints = {name: self.fingerprint(dt) for name, dt in self.by_name.items()}
+        self.cache_ttls = dict(BUILTIN_CACHE_TTLS)
+        for name, dt in self.by_name.items():
+            cache = dt.get("cache")
+            if isinstance(cache, dict) and float(cache.get("ttl") or 0) > 0:
+                self.cache_ttls[name] = float(cache["ttl"])
+        self.timeouts = {
+            name: float(dt["timeout"]) for name, dt in self.by_name.items()
+            if isinstance(dt.get("timeout"), (int, float)) and dt["timeout"] > 0
+        }
+        self.tools = tools
+        self.manifest = json.dumps({"type": "TOOLS_MANIFEST", "version": version, "tools": definitions})
+        self.content_hash = content_hash
+        self.version = version
+
+        self._history[version] = self.fingerprints
+        self._history.move_to_end(version)
+        while len(self._history) > TOOLS_HISTORY_SIZE:
+            self._history.popitem(last=False)
+
+        tools_log.info("🔄 Loaded %d tools (version %s)", len(definitions), version)
+        return True
+
+    def fingerprints_for(self, version: Optional[str]) -> Optional[Dict[str, str]]:
+        """Tool fingerprints of a recent manifest version, or None if unknown"""
+        if not version:
+            return None
+        return self._history.get(version)
+
+    def delta(self, known: Dict[str, str]) -> Tuple[List[dict], List[str]]:
+        """Tools to upsert and names to remove to bring `known` up to date"""
+        upsert = [
+            self.by_name[name]
+            for name, fp in self.fingerprints.items()
+            if known.get(name) != fp
+        ]
+        remove = [name for name in known if name not in self.fingerprints]
+        return upsert, remove
+
+    def add_listener(self, callback: Callable[[], Awaitable[None]]):
+        """Register a coroutine to be awaited after tools.json content changes"""
+        self._listeners.append(callback)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if self._stat() == self._stat_key:
+                continue
+            try:
+                changed = await asyncio.to_thread(self.reload)
+            except Exception as e:
+                tools_log.error("❌ Error reloading %s: %s", self.path, e)
+                continue
+            if changed:
+                for callback in self._listeners:
+                    try:
+                        await callback()
+                    except Exception as e:
+                        tools_log.warning("⚠️  Listener failed: %s", e)
+
+    def start(self):
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+tool_registry = ToolRegistry(TOOLS_PATH)
+try:
+    tool_registry.reload()
+except Exception as e:
+    tools_log.error("❌ Error loading tools: %s", e)
+
+# --- Streamed Results ---
+
+class ChunkedResult:
+    """Reassembles a result the tab streamed as sequenced CHUNK frames.
+
+    Chunks are appended to a SpooledTemporaryFile, so at most RESULT_INLINE_LIMIT
+    bytes of any single result are held in memory; the rest lives on disk.
+    """
+    def __init__(self):
+        self.spool = tempfile.SpooledTemporaryFile(max_size=RESULT_INLINE_LIMIT, mode="w+b")
+        self.size = 0
+        self.next_seq = 0
+        # High surrogate that ended the previous chunk, waiting for its low half
+        self._carry = ""
+
+    def append(self, seq: int, data: str):
+        if seq != self.next_seq:
+            raise ValueError(f"Out of order chunk {seq}, expected {self.next_seq}")
+        # Older tabs cut chunks on UTF-16 code units, splitting surrogate pairs between frames
+        text, self._carry = self._carry + data, ""
+        if text and "\ud800" <= text[-1] <= "\udbff":
+            text, self._carry = text[:-1], text[-1]
+        try:
+            raw = text.encode("utf-8")
+        except UnicodeEncodeError:
+            # Rejoin the halves of a split pair; anything still unpaired becomes U+FFFD
+            raw = text.encode("utf-16-le", "surrogatepass").decode("utf-16-le", "replace").encode("utf-8")
+        self.spool.write(raw)
+        self.size += len(raw)
+        self.next_seq += 1
+
+    def read(self, offset: int = 0, length: int = -1) -> str:
+        self.spool.seek(offset)
+        return self.spool.read(length).decode("utf-8", errors="ignore")
+
+    def load(self) -> Any:
+        self.spool.seek(0)
+        return json.loads(self.spool.read())
+
+    def close(self):
+        self.spool.close()
+
+class ResultStore:
+    """Keeps oversized results addressable by handle for a limited time"""
+    def __init__(self, ttl: float = RESULT_TTL, max_entries: int = RESULT_STORE_SIZE, prefix: str = ""):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # In multi-worker mode handles start with "<worker id>/" so any worker can route them
+        self.prefix = prefix
+        self._entries: "OrderedDict[str, Tuple[float, ChunkedResult]]" = OrderedDict()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._entries:
+            handle, (created, result) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - created < self.ttl:
+                break
+            del self._entries[handle]
+            result.close()
+
+    def put(self, result: ChunkedResult) -> str:
+        handle = self.prefix + uuid.uuid4().hex[:12]
+        self._entries[handle] = (time.monotonic(), result)
+        self._evict()
+        return handle
+
+    def get(self, handle: str) -> ChunkedResult:
+        self._evict()
+        entry = self._entries.get(handle)
+        if entry is None:
+            raise ValueError(f"Unknown or expired result handle: {handle}")
+        return entry[1]
+
+    def export(self, result: Any) -> Any:
+        """Replace a ChunkedResult with a JSON-friendly preview + handle; pass anything else through"""
+        if not isinstance(result, ChunkedResult):
+            return result
+        return {
+            "truncated": True,
+            "handle": self.put(result),
+            "size": result.size,
+            "preview": result.read(0, RESULT_PREVIEW_CHARS)
+        }
+
+result_store = ResultStore()
+
+# --- Result Cache (read-only tools) ---
+
+class ResultCache:
+    """LRU cache of read-only tool results keyed by tab + tool + params, bounded in bytes.
+
+    Every tab has a generation number that invalidate() bumps; a result is only
+    stored if its tab's generation did not change while the call was in flight,
+    so a page change racing a read never leaves a stale entry behind.
+    """
+    def __init__(self, max_bytes: int = RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[tuple, Tuple[float, int, Any]]" = OrderedDict()
+        self._by_tab: Dict[str, set] = {}
+        self._generations: Dict[str, int] = {}
+
+    @staticmethod
+    def key(tab_id: str, tool_name: str, params: dict) -> tuple:
+        return (tab_id, tool_name, json.dumps(params, sort_keys=True, default=str))
+
+    def generation(self, tab_id: str) -> int:
+        return self._generations.get(tab_id, 0)
+
+    def get(self, key: tuple) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= time.monotonic():
+            self._drop(key)
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[2]
+
+    def put(self, key: tuple, result: Any, ttl: float, generation: int):
+        if generation != self.generation(key[0]) or isinstance(result, ChunkedResult):
+            return
+        if isinstance(result, dict) and "error" in result:
+            return
+        size = len(json.dumps(result, default=_json_default))
+        if size > self.max_bytes // 4:
+            return
+
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl, size, result)
+        self._by_tab.setdefault(key[0], set()).add(key)
+        self.size += size
+        while self.size > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry[1]
+        keys = self._by_tab.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_tab[key[0]]
+
+    def invalidate(self, tab_id: str):
+        """Forget everything cached for a tab (page changed, navigated or was written to)"""
+        self._generations[tab_id] = self.generation(tab_id) + 1
+        for key in list(self._by_tab.get(tab_id, ())):
+            self._drop(key)
+
+    def forget_tab(self, tab_id: str):
+        self.invalidate(tab_id)
+        self._generations.pop(tab_id, None)
+
+result_cache = ResultCache()
+
+# --- Browser Log Ingestion ---
+
+class BrowserLogSink:
+    """Buffers browser log entries in an async queue and appends them to rotating JSONL files.
+
+    Rotation is not coordinated across processes, so every process needs its own file.
+
+    Producers never block: entries are dropped (and counted) when the queue is full.
+    A single writer task drains the queue in batches and does the file I/O in a
+    worker thread, so the event loop never waits on disk or stdout.
+    """
+    def __init__(
+        self,
+        directory: str,
+        filename: str = "browser.jsonl",
+        max_bytes: int = LOG_FILE_MAX_BYTES,
+        backups: int = LOG_FILE_BACKUPS,
+        queue_size: int = LOG_QUEUE_SIZE
+    ):
+        self.path = os.path.join(directory, filename)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def submit(self, entries: List[dict], tab_id: Optional[str] = None):
+        if self._queue is None:
+            self.dropped += len(entries)
+            return
+        received = time.time()
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            record = {
+                "ts": entry.get("timestamp"),
+                "received": received,
+                "tab": tab_id,
+                "level": entry.get("level") or entry.get("type"),
+                "message": entry.get("message"),
+                "url": entry.get("url")
+            }
+            try:
+                self._queue.put_nowait(record)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _write(self, lines: List[str]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    async def _drain(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < LOG_WRITE_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            lines = [json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in batch]
+            try:
+                await asyncio.to_thread(self._write, lines)
+            except Exception as e:
+                store_log.error("❌ Failed to write %d log entries: %s", len(lines), e)
+
+    def start(self):
+        if self._writer is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._writer = asyncio.create_task(self._drain())
+
+    async def stop(self):
+        if self._writer is None:
+            return
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+        # Flush whatever is still queued
+        remaining = []
+        while not self._queue.empty():
+            remaining.append(json.dumps(self._queue.get_nowait(), ensure_ascii=False, separators=(",", ":")) + "\n")
+        if remaining:
+            await asyncio.to_thread(self._write, remaining)
+        self._queue = None
+
+# Each worker process rotates its own file; processes sharing one file would rotate it
+# out from under each other
+log_sink = BrowserLogSink(LOG_DIR, f"browser-{WORKER_ID}.jsonl" if WORKERS > 1 else "browser.jsonl")
 
 # --- Core Bridge Logic (WebSocket Manager) ---
 
+def trace_tab_timing(span: Any, timing: Optional[Tuple[dict, int]], sent_ns: int):
+    """Add the tab's own phases (queue, execute, reply) as children of a tab call span.
+
+    The tab reports epoch milliseconds on the browser's clock. They are shifted so
+    the tab's share sits in the middle of the round-trip, with the rest split evenly
+    between the two transit legs (the same estimate NTP makes).
+    """
+    if timing is None or not span.recording:
+        return
+    stamps, arrived_ns = timing
+    received, started, finished = stamps.get("received"), stamps.get("started"), stamps.get("finished")
+    if received is None or started is None or finished is None:
+        return
+    replied = stamps.get("sent") or finished
+    transit_ns = max(0, (arrived_ns - sent_ns) - int((replied - received) * 1e6)) // 2
+    offset_ns = sent_ns + transit_ns - int(received * 1e6)
+    span.set_attributes({
+        "tab.transit_ms": round(2 * transit_ns / 1e6, 3),
+        "tab.clock_skew_ms": round(offset_ns / 1e6, 1)
+    })
+    for name, start, end in (("tab.queue", received, started), ("tab.execute", started, finished), ("tab.reply", finished, replied)):
+        phase = tracer.start_span(name, parent=span, start_ns=int(start * 1e6) + offset_ns)
+        phase.end(int(end * 1e6) + offset_ns)
+
+class TabBusyError(Exception):
+    """Raised when a tab's wait queue is full and a request is rejected immediately"""
+
+class TabScheduler:
+    """Admission control for one tab.
+
+    At most `max_inflight` requests run in the tab at once. Up to `max_queue` more
+    wait for a slot; waiters are grouped per MCP session and served round-robin so
+    one chatty agent cannot starve the others. Beyond that, requests fail fast.
+    """
+    def __init__(self, max_inflight: int = TAB_MAX_INFLIGHT, max_queue: int = TAB_MAX_QUEUE):
+        self.max_inflight = max(1, max_inflight)
+        self.max_queue = max(0, max_queue)
+        self.inflight = 0
+        self.queued = 0
+        self._waiters: "OrderedDict[Any, deque]" = OrderedDict()
+
+    async def acquire(self, session_key: Any = None, timeout: Optional[float] = None):
+        if self.inflight < self.max_inflight and not self.queued:
+            self.inflight += 1
+            return
+
+        if self.queued >= self.max_queue:
+            raise TabBusyError(f"Tab busy: {self.inflight} running, {self.queued} queued")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(session_key, deque()).append(future)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                self._remove(session_key, future)
+            raise
+
+    def _remove(self, session_key: Any, future: asyncio.Future):
+        waiters = self._waiters.get(session_key)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self._waiters[session_key]
+
+    def release(self):
+        while self._waiters:
+            session_key, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._waiters.move_to_end(session_key)
+            else:
+                del self._waiters[session_key]
+            if not future.done():
+                # Hand the slot straight to the next session in line
+                future.set_result(None)
+                return
+        self.inflight -= 1
+
 class BrowserConnection:
-    def __init__(self, websocket: WebSocket, url: str, ua: str = "Unknown"):
+    def __init__(
+        self,
+        websocket: WebSocket,
+        url: str,
+        ua: str = "Unknown",
+        encoding: str = "json",
+        max_inflight: int = TAB_MAX_INFLIGHT,
+        max_queue: int = TAB_MAX_QUEUE
+    ):
         self.id = str(uuid.uuid4())[:8]
         self.socket = websocket
+        self.encoding = encoding
         self.url = url
+        self.host = urlsplit(url).hostname or ""
         self.ua = ua
         self.connected_at = asyncio.get_event_loop().time()
+        # Wall-clock connect time: orders tabs newest-first in the cluster directory
+        self.connected_since = time.time()
         self.pending_requests: Dict[str, asyncio.Future] = {}
+        self.chunks: Dict[str, ChunkedResult] = {}
+        self.scheduler = TabScheduler(max_inflight, max_queue)
+        # Tool manifest state: what we last sent vs. what the tab acknowledged
+        self.tools_sent: Dict[str, str] = {}
+        self.tools_sent_version: Optional[str] = None
+        self.tools_version: Optional[str] = None
+        # Session resumption: a tab reconnecting with its ID and this token while
+        # suspended takes over this connection, pending requests included
+        self.resume_token = secrets.token_urlsafe(16)
+        self.suspended_at: Optional[float] = None
+        self.expiry: Optional[asyncio.Task] = None
+        # Set while the tab has a socket; calls to a suspended tab wait on it briefly
+        self.attached = asyncio.Event()
+        self.attached.set()
+        # Frame each pending request went out in, replayed when the tab resumes
+        self.sent_frames: Dict[str, dict] = {}
+        # Heartbeat: any frame counts as a sign of life; PONGs also carry responsiveness stats
+        self.last_seen = time.monotonic()
+        self.pings: Dict[int, float] = {}
+        self.rtt: Optional[float] = None
+        self.loop_lag = 0.0
+        self.hidden = False
+        # Server-side replica of the page (MCP_DOM_MIRROR), None until the tab sends MIRROR_INIT
+        self.mirror: Optional[DomMirror] = None
+        # Tab-side timestamps of traced requests, with the time their reply arrived (ns)
+        self.timings: Dict[str, Tuple[dict, int]] = {}
+
+    @property
+    def load(self) -> int:
+        return self.scheduler.inflight + self.scheduler.queued
+
+    def cost(self) -> float:
+        """Rough expected wait for one more call: latency times the work already queued"""
+        latency = (self.rtt if self.rtt is not None else DEFAULT_RTT) + self.loop_lag
+        return latency * (1 + self.load)
+
+    def record_pong(self, data: dict):
+        sent_at = self.pings.pop(data.get("seq"), None)
+        if sent_at is not None:
+            sample = time.monotonic() - sent_at
+            self.rtt = sample if self.rtt is None else (1 - RTT_SMOOTHING) * self.rtt + RTT_SMOOTHING * sample
+        self.loop_lag = max(0.0, float(data.get("lag_ms") or 0) / 1000)
+        self.hidden = bool(data.get("hidden"))
+
+    def forget(self, req_id: str):
+        """Drop all bookkeeping for a finished, failed or abandoned request"""
+        self.pending_requests.pop(req_id, None)
+        self.sent_frames.pop(req_id, None)
+        self.timings.pop(req_id, None)
+        chunked = self.chunks.pop(req_id, None)
+        if chunked is not None:
+            chunked.close()
+
+    async def send_text(self, text: str):
+        """Send a serialized frame, compressing it if the tab negotiated deflate"""
+        if self.socket is None:
+            # Suspended: requests stay in sent_frames and are replayed on resume
+            return
+        if self.encoding == "deflate" and len(text) >= COMPRESS_THRESHOLD:
+            data = zlib.compress(text.encode("utf-8"), COMPRESS_LEVEL)
+            WS_BYTES.inc(len(data), direction="out")
+            await self.socket.send_bytes(data)
+        else:
+            WS_BYTES.inc(len(text.encode("utf-8")), direction="out")
+            await self.socket.send_text(text)
+
+    async def send_json(self, data: dict):
+        await self.send_text(json.dumps(data, separators=(",", ":")))
+
+    async def receive_json(self, websocket: Optional[WebSocket] = None) -> dict:
+        """Receive one frame: JSON text, or zlib-compressed JSON in a binary frame"""
+        message = await (websocket or self.socket).receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+
+        raw = message.get("bytes")
+        if raw is None:
+            WS_BYTES.inc(len(message["text"].encode("utf-8")), direction="in")
+            return json.loads(message["text"])
+        WS_BYTES.inc(len(raw), direction="in")
+
+        if raw[:4] == BINARY_FRAME_MAGIC:
+            header_len = int.from_bytes(raw[4:8], "big")
+            header = json.loads(raw[8:8 + header_len])
+            result = dict(header.get("result") or {})
+            result["data"] = raw[8 + header_len:]
+            return {"id": header.get("id"), "result": result, "timing": header.get("timing")}
+
+        # Large payloads are inflated off the event loop
+        if len(raw) >= DECOMPRESS_OFFLOAD_SIZE:
+            return await asyncio.to_thread(lambda: json.loads(zlib.decompress(raw)))
+        return json.loads(zlib.decompress(raw))
 
 class MCPBridge:
-    def __init__(self):
+    def __init__(
+        self,
+        fanout_concurrency: int = FANOUT_CONCURRENCY,
+        max_inflight_per_tab: int = TAB_MAX_INFLIGHT,
+        max_queue_per_tab: int = TAB_MAX_QUEUE,
+        resume_grace: float = RESUME_GRACE,
+        resume_wait: float = RESUME_WAIT,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL,
+        heartbeat_timeout: float = HEARTBEAT_TIMEOUT,
+        dom_mirror: bool = DOM_MIRROR,
+        mirror_max_age: float = MIRROR_MAX_AGE
+    ):
+        self.fanout_concurrency = fanout_concurrency
+        self.resume_grace = resume_grace
+        self.resume_wait = resume_wait
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.dom_mirror = dom_mirror
+        self.mirror_max_age = mirror_max_age
+        self.max_inflight_per_tab = max_inflight_per_tab
+        self.max_queue_per_tab = max_queue_per_tab
+        # Insertion-ordered: the last entry is always the most recently connected tab
         self.connections: Dict[str, BrowserConnection] = {}
+        # Secondary indexes (also insertion-ordered) for host / user agent lookups
+        self._by_host: Dict[str, Dict[str, BrowserConnection]] = {}
+        self._by_ua: Dict[str, Dict[str, BrowserConnection]] = {}
+        # Set in multi-worker mode: publishes this worker's tabs to the shared directory
+        self.cluster: Optional[ClusterRouter] = None
+        # Fire-and-forget CANCEL frames still being sent
+        self._background: set = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._ping_seq = 0
+
+    def _index(self, conn: BrowserConnection):
+        self.connections[conn.id] = conn
+        self._by_host.setdefault(conn.host, {})[conn.id] = conn
+        self._by_ua.setdefault(conn.ua, {})[conn.id] = conn
+
+    def _unindex(self, conn: BrowserConnection):
+        self.connections.pop(conn.id, None)
+        for index, key in ((self._by_host, conn.host), (self._by_ua, conn.ua)):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(conn.id, None)
+                if not bucket:
+                    del index[key]
+
+    @staticmethod
+    def _newest(conns: Dict[str, BrowserConnection]) -> Optional[BrowserConnection]:
+        """Newest live tab; a suspended one only when no live tab is left"""
+        newest = None
+        for conn in reversed(conns.values()):
+            if conn.socket is not None:
+                return conn
+            newest = newest or conn
+        return newest
+
+    def resolve_tab(self, session_id: Optional[str]) -> BrowserConnection:
+        """Resolve a tab selector to a live connection.
 
-    async def connect(self, websocket: WebSocket, token: str, url: str):
+        Accepted forms: "latest" (or empty), an exact tab ID, "host:<hostname>",
+        "ua:<user agent>" and "url:<glob pattern>". Host/UA selectors are O(1)
+        index lookups; URL patterns scan newest-first and stop at the first match.
+        All forms pick the most recently connected matching tab, except "any" and
+        "any:<selector>", which pick the least busy, most responsive match. Suspended
+        tabs are passed over unless named by ID or nothing live matches.
+        """
+        if not self.connections:
+            raise ValueError("No browser tabs connected")
+
+        if not session_id or session_id == "latest":
+            return self._newest(self.connections)
+
+        if session_id == "any" or session_id.startswith("any:"):
+            return self._best(session_id[4:])
+
+        conn = self.connections.get(session_id)
+        if conn is not None:
+            return conn
+
+        kind, _, value = session_id.partition(":")
+        if kind == "host":
+            conn = self._newest(self._by_host.get(value.lower(), {}))
+        elif kind == "ua":
+            conn = self._newest(self._by_ua.get(value, {}))
+        elif kind == "url":
+            conn = self._newest({
+                c.id: c for c in self.connections.values() if fnmatch.fnmatchcase(c.url, value)
+            })
+        else:
+            raise ValueError(f"Tab ID {session_id} not found")
+
+        if conn is None:
+            raise ValueError(f"No tab matches {session_id}")
+        return conn
+
+    def _best(self, selector: str) -> BrowserConnection:
+        """Cheapest live tab among those matching `selector` (visible tabs first, newest on ties)"""
+        candidates = [c for c in self.select_tabs(selector or "all") if c.socket is not None]
+        if not candidates:
+            raise ValueError(f"No responsive tab matches any:{selector}" if selector else "No responsive tabs connected")
+        return min(reversed(candidates), key=lambda c: (c.hidden, c.cost()))
+
+    def select_tabs(self, target) -> List[BrowserConnection]:
+        """Resolve a fan-out target to every matching live connection.
+
+        Accepts "all" (or empty), a list of tab IDs (unknown IDs are skipped), or a
+        single selector as understood by resolve_tab. Suspended tabs are only
+        included when named by ID.
+        """
+        if not target or target == "all":
+            return [c for c in self.connections.values() if c.socket is not None]
+
+        if isinstance(target, list):
+            return [self.connections[cid] for cid in target if cid in self.connections]
+
+        if target in self.connections:
+            return [self.connections[target]]
+
+        kind, _, value = target.partition(":")
+        if kind == "host":
+            return [c for c in self._by_host.get(value.lower(), {}).values() if c.socket is not None]
+        if kind == "ua":
+            return [c for c in self._by_ua.get(value, {}).values() if c.socket is not None]
+        if kind == "url":
+            return [
+                c for c in self.connections.values()
+                if c.socket is not None and fnmatch.fnmatchcase(c.url, value)
+            ]
+        if target in ("latest", "any") or kind == "any":
+            return [self.resolve_tab(target)]
+        raise ValueError(f"Tab ID {target} not found")
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        token: str,
+        url: str,
+        tools_version: Optional[str] = None,
+        encoding: str = "json",
+        resume: Optional[str] = None,
+        resume_token: Optional[str] = None
+    ):
         if token != BRIDGE_TOKEN:
             await websocket.close(code=4003)
             return None
         
         await websocket.accept()
-        conn = BrowserConnection(websocket, url)
-        self.connections[conn.id] = conn
-        print(f"[Bridge] ✅ Tab Connected: {conn.id} ({url})")
+        if encoding not in WS_ENCODINGS:
+            encoding = "json"
+
+        conn = await self._take_over(resume, resume_token, websocket, url, encoding)
+        resumed = conn is not None
+        if conn is None:
+            conn = BrowserConnection(
+                websocket,
+                url,
+                websocket.headers.get("user-agent", "Unknown"),
+                encoding,
+                self.max_inflight_per_tab,
+                self.max_queue_per_tab
+            )
+            self._index(conn)
+            bridge_log.info("✅ Tab Connected: %s (%s)", conn.id, url)
+            await self._publish(conn)
         
-        await websocket.send_json({
+        await conn.send_json({
             "type": "WELCOME",
             "id": conn.id,
+            "encoding": conn.encoding,
+            "resume_token": conn.resume_token,
+            "resumed": resumed,
+            "heartbeat_ms": int(self.heartbeat_interval * 1000),
+            "mirror": self.dom_mirror,
             "message": "Connected to MCP Bridge"
         })
+
+        # A reconnecting tab that still holds a recent manifest only needs a delta
+        known = tool_registry.fingerprints_for(tools_version)
+        if known is not None:
+            conn.tools_sent = dict(known)
+            conn.tools_sent_version = tools_version
+            conn.tools_version = tools_version
+        await self.send_tools(conn)
+        if resumed:
+            await self._replay(conn)
         
         return conn
 
+    async def _publish(self, conn: BrowserConnection):
+        if self.cluster is not None:
+            await self.cluster.register_tab({
+                "id": conn.id, "url": conn.url, "host": conn.host, "ua": conn.ua, "connected_at": conn.connected_since
+            })
+
+    async def _take_over(
+        self,
+        conn_id: Optional[str],
+        token: Optional[str],
+        websocket: WebSocket,
+        url: str,
+        encoding: str
+    ) -> Optional[BrowserConnection]:
+        """Attach a reconnecting tab to its previous connection if ID and resume token match"""
+        conn = self.connections.get(conn_id or "")
+        if conn is None or not token or not secrets.compare_digest(conn.resume_token, token):
+            return None
+
+        if conn.expiry is not None:
+            conn.expiry.cancel()
+            conn.expiry = None
+        old_socket, conn.socket = conn.socket, websocket
+        if old_socket is not None:
+            # The old socket is half-open; its receive loop ends without suspending the tab
+            with suppress(Exception):
+                await old_socket.close(code=4001)
+        conn.encoding = encoding
+        conn.suspended_at = None
+        conn.attached.set()
+        conn.last_seen = time.monotonic()
+        conn.pings.clear()
+        # The tab sends a fresh MIRROR_INIT after WELCOME
+        conn.mirror = None
+        # Partially streamed results are resent from the first chunk
+        for chunked in conn.chunks.values():
+            chunked.close()
+        conn.chunks.clear()
+        # The page may have reloaded and lost its tools; negotiate the manifest afresh
+        conn.tools_sent = {}
+        conn.tools_sent_version = None
+        conn.tools_version = None
+
+        result_cache.invalidate(conn.id)
+        await self._update_url(conn, url)
+
+        TAB_RESUMES.inc()
+        bridge_log.info("🔁 Tab Resumed: %s (%d pending)", conn.id, len(conn.pending_requests))
+        return conn
+
+    async def _update_url(self, conn: BrowserConnection, url: Optional[str]):
+        """Re-index a tab whose page moved to another URL.
+
+        Only the host index changes: the tab keeps its place in connection order, so
+        navigating a background tab does not make it "latest".
+        """
+        if not url or url == conn.url:
+            return
+        old_host = conn.host
+        conn.url = url
+        conn.host = urlsplit(url).hostname or ""
+        if conn.host != old_host:
+            bucket = self._by_host.get(old_host)
+            if bucket is not None:
+                bucket.pop(conn.id, None)
+                if not bucket:
+                    del self._by_host[old_host]
+            bucket = self._by_host.setdefault(conn.host, {})
+            newest = next(reversed(bucket.values()), None)
+            bucket[conn.id] = conn
+            if newest is not None and newest.connected_at > conn.connected_at:
+                # Not the newest tab on that host: put the bucket back in connection order
+                self._by_host[conn.host] = dict(sorted(bucket.items(), key=lambda item: item[1].connected_at))
+        await self._publish(conn)
+
+    async def _replay(self, conn: BrowserConnection):
+        """Resend every request the tab has not answered yet; batches only with their open calls"""
+        sent = set()
+        for req_id in list(conn.pending_requests):
+            frame = conn.sent_frames.get(req_id)
+            if frame is None or id(frame) in sent:
+                continue
+            sent.add(id(frame))
+            if frame.get("type") == "BATCH":
+                frame = {**frame, "calls": [c for c in frame["calls"] if c["id"] in conn.pending_requests]}
+            await conn.send_json(frame)
+        if sent:
+            bridge_log.info("🔁 Replayed %d frame(s) to %s", len(sent), conn.id)
+
+    async def suspend(self, conn: BrowserConnection, websocket: WebSocket):
+        """The tab's socket dropped: keep its slot and pending requests for resume_grace seconds"""
+        if conn.socket is not websocket or conn.id not in self.connections:
+            # Already taken over by a newer socket, or gone
+            return
+        if self.resume_grace <= 0:
+            await self.disconnect(conn.id)
+            return
+        conn.socket = None
+        conn.attached.clear()
+        conn.suspended_at = time.monotonic()
+        conn.expiry = asyncio.create_task(self._expire(conn))
+        bridge_log.info("⏸️  Tab Suspended: %s (resumable for %ss)", conn.id, self.resume_grace)
+
+    async def _expire(self, conn: BrowserConnection):
+        await asyncio.sleep(self.resume_grace)
+        conn.expiry = None
+        if conn.socket is None:
+            await self.disconnect(conn.id)
+
+    def start_heartbeat(self):
+        if self.heartbeat_interval > 0 and self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop_heartbeat(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._heartbeat
+            self._heartbeat = None
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.ping_all()
+            except Exception as e:
+                bridge_log.warning("⚠️  Heartbeat failed: %s", e)
+
+    async def ping_all(self):
+        """Ping every live tab and evict the ones that went silent.
+
+        A half-open socket (sleeping laptop, killed renderer) can look connected for
+        minutes; evicting it fails its pending requests at once instead of letting
+        them run into their deadlines, and stops selectors from picking it.
+        """
+        now = time.monotonic()
+        self._ping_seq += 1
+        frame = json.dumps({"type": "PING", "seq": self._ping_seq}, separators=(",", ":"))
+        stale = []
+        for conn in list(self.connections.values()):
+            if conn.socket is None:
+                continue
+            if now - conn.last_seen > self.heartbeat_timeout:
+                stale.append(conn)
+                continue
+            # Unanswered pings older than the timeout will never count
+            for seq in [s for s, t in conn.pings.items() if now - t > self.heartbeat_timeout]:
+                del conn.pings[seq]
+            conn.pings[self._ping_seq] = now
+            try:
+                await conn.send_text(frame)
+            except Exception as e:
+                bridge_log.debug("PING to %s failed: %s", conn.id, e)
+
+        for conn in stale:
+            HEARTBEAT_EVICTIONS.inc()
+            bridge_log.warning("💔 Tab %s silent for %.0fs, evicting", conn.id, now - conn.last_seen)
+            websocket, conn.socket = conn.socket, None
+            await self.disconnect(conn.id)
+            with suppress(Exception):
+                await websocket.close(code=4008)
+
     async def disconnect(self, conn_id: str):
         if conn_id in self.connections:
             conn = self.connections[conn_id]
+            if conn.expiry is not None:
+                conn.expiry.cancel()
+                conn.expiry = None
+            # Wakes calls waiting for a resume; they find the tab gone
+            conn.attached.set()
             for future in conn.pending_requests.values():
                 if not future.done():
                     future.set_exception(ConnectionError("Tab disconnected"))
-            del self.connections[conn_id]
-            print(f"[Bridge] ❌ Tab Disconnected: {conn_id}")
+                    DISCONNECT_FAILURES.inc()
+            for chunked in conn.chunks.values():
+                chunked.close()
+            conn.chunks.clear()
+            self._unindex(conn)
+            result_cache.forget_tab(conn_id)
+            metrics.forget("tab", conn_id)
+            bridge_log.info("❌ Tab Disconnected: %s", conn_id)
+            if self.cluster is not None:
+                await self.cluster.unregister_tab(conn_id)
+
+    async def send_tools(self, conn: BrowserConnection, full: bool = False, _cache: Optional[Dict[Any, str]] = None):
+        """Bring one tab's tool manifest up to date with the registry.
+
+        Tabs that have never received a manifest (or ask for one explicitly) get the
+        full TOOLS_MANIFEST; everyone else gets a TOOLS_DELTA with only the tools that
+        were added, changed or removed since the version they were last sent.
+        """
+        if full or conn.tools_sent_version is None:
+            payload = tool_registry.manifest
+        else:
+            if conn.tools_sent_version == tool_registry.version:
+                return
+            key = conn.tools_sent_version
+            payload = _cache.get(key) if _cache is not None else None
+            if payload is None:
+                upsert, remove = tool_registry.delta(conn.tools_sent)
+                payload = json.dumps({
+                    "type": "TOOLS_DELTA",
+                    "version": tool_registry.version,
+                    "base": conn.tools_sent_version,
+                    "upsert": upsert,
+                    "remove": remove
+                })
+                if _cache is not None:
+                    _cache[key] = payload
+
+        await conn.send_text(payload)
+        conn.tools_sent = dict(tool_registry.fingerprints)
+        conn.tools_sent_version = tool_registry.version
 
     async def broadcast_tools(self):
-        """Send tools.json to all connected browsers"""
+        """Push manifest changes to all connected browsers (deltas where possible)"""
+        # Tabs on the same base version share one serialized delta
+        cache: Dict[Any, str] = {}
+        for conn in list(self.connections.values()):
+            try:
+                await self.send_tools(conn, _cache=cache)
+            except Exception as e:
+                bridge_log.warning("⚠️  Failed to send tools to %s: %s", conn.id, e)
+        return tool_registry.definitions
+
+    async def _acquire_slot(self, conn: BrowserConnection, label: str, session_key: Any, timeout: float) -> float:
+        """Wait for a free slot on the tab; returns the time left for the request itself"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + timeout
+        if conn.socket is None:
+            await self._await_resume(conn, min(self.resume_wait, timeout))
+            timeout = max(0.0, deadline - loop.time())
         try:
-            tools_path = os.path.join(os.path.dirname(__file__), "tools.json")
-            if os.path.exists(tools_path):
-                with open(tools_path, "r", encoding="utf-8") as f:
-                    tools = json.load(f)
-                
-                payload = {"type": "TOOLS_MANIFEST", "tools": tools}
-                for conn in self.connections.values():
-                    try:
-                        await conn.socket.send_json(payload)
-                    except Exception as e:
-                        print(f"[Bridge] ⚠️  Failed to send tools to {conn.id}: {e}")
-                return tools
-        except Exception as e:
-            print(f"[Bridge] ❌ Error syncing tools: {e}")
-            return []
+            with tracer.span("bridge.acquire_slot", attributes={"tab.id": conn.id}):
+                await conn.scheduler.acquire(session_key, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{label} timed out after {timeout}s waiting for tab {conn.id}")
+        QUEUE_WAIT.observe(loop.time() - started)
+        return max(0.0, deadline - loop.time())
+
+    async def _await_resume(self, conn: BrowserConnection, wait: float):
+        """Give a suspended tab a moment to come back rather than holding the call for its deadline"""
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(conn.attached.wait(), wait)
+        if conn.socket is None or conn.id not in self.connections:
+            raise ConnectionError(f"Tab {conn.id} is disconnected (not resumed within {wait:g}s)")
+
+    @asynccontextmanager
+    async def _track_call(self, tool_name: str, conn: BrowserConnection):
+        """Count one call in TOOL_CALLS with its outcome"""
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        except TabBusyError:
+            outcome = "busy"
+            raise
+        except TimeoutError:
+            outcome = "timeout"
+            raise
+        except ConnectionError:
+            outcome = "disconnected"
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            TOOL_CALLS.inc(tool=tool_name, tab=conn.id, outcome=outcome)
+
+    def _cancel_remote(self, conn: BrowserConnection, req_ids: List[str], reason: str):
+        """Tell the tab to abort requests nobody waits for any more (fire-and-forget)"""
+        if conn.socket is None or not req_ids:
+            return
+
+        async def send():
+            try:
+                await conn.send_json({"type": "CANCEL", "ids": req_ids, "reason": reason})
+            except Exception as e:
+                calls_log.debug("CANCEL to %s failed: %s", conn.id, e)
 
-    async def execute_tool(self, session_id: str, tool_name: str, params: dict, timeout: float = 30.0):
+        task = asyncio.create_task(send())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        calls_log.info("🛑 Cancelling %d request(s) on %s (%s)", len(req_ids), conn.id, reason)
+
+    async def execute_tool(
+        self,
+        session_id: str,
+        tool_name: str,
+        params: dict,
+        timeout: float = DEFAULT_TOOL_TIMEOUT,
+        session_key: Any = None
+    ):
         """Execute a command in a specific browser tab with async response handling"""
-        if not session_id or session_id == "latest":
-            if not self.connections:
-                raise ValueError("No browser tabs connected")
-            target_conn = sorted(self.connections.values(), key=lambda x: x.connected_at)[-1]
-        else:
-            if session_id not in self.connections:
-                raise ValueError(f"Tab ID {session_id} not found")
-            target_conn = self.connections[session_id]
+        with tracer.span("bridge.execute_tool", attributes={"mcp.tool": tool_name}) as span:
+            target_conn = self.resolve_tab(session_id)
+            span.set_attribute("tab.id", target_conn.id)
+
+            if tool_name in MIRROR_TOOLS:
+                # A freshness bound for the mirror, not an argument of the tab's tool
+                params = dict(params)
+                max_age = params.pop("max_age", None)
+                if self.dom_mirror:
+                    hit, result = self.query_mirror(target_conn, tool_name, params, max_age)
+                    if hit:
+                        span.set_attribute("bridge.source", "mirror")
+                        return result
+
+            ttl = tool_registry.cache_ttls.get(tool_name)
+            if ttl:
+                cache_key = ResultCache.key(target_conn.id, tool_name, params)
+                hit, cached = result_cache.get(cache_key)
+                RESULT_CACHE_LOOKUPS.inc(outcome="hit" if hit else "miss")
+                if hit:
+                    calls_log.debug("💾 Cache hit for '%s' on %s", tool_name, target_conn.id)
+                    span.set_attribute("bridge.source", "cache")
+                    return cached
+            # Anything not known to be read-only may change the page
+            mutating = not ttl and tool_name not in READ_ONLY_BUILTINS
+            if mutating:
+                result_cache.invalidate(target_conn.id)
+            generation = result_cache.generation(target_conn.id)
 
+            span.set_attribute("bridge.source", "tab")
+            async with self._track_call(tool_name, target_conn):
+                remaining = await self._acquire_slot(target_conn, f"Tool '{tool_name}'", session_key, timeout)
+                try:
+                    result = await self._execute_on(target_conn, tool_name, params, timeout, remaining)
+                finally:
+                    target_conn.scheduler.release()
+                    if mutating:
+                        result_cache.invalidate(target_conn.id)
+
+            if ttl:
+                result_cache.put(cache_key, result, ttl, generation)
+            return result
+
+    async def _execute_on(self, target_conn: BrowserConnection, tool_name: str, params: dict, timeout: float, remaining: float):
+        with tracer.span(f"tab {tool_name}", SPAN_KIND_CLIENT) as span:
+            return await self._execute_traced(target_conn, tool_name, params, timeout, remaining, span)
+
+    async def _execute_traced(
+        self,
+        target_conn: BrowserConnection,
+        tool_name: str,
+        params: dict,
+        timeout: float,
+        remaining: float,
+        span: Any
+    ):
         req_id = str(uuid.uuid4())
         
         payload = {
             "method": tool_name,
             "params": params,
-            "id": req_id
+            "id": req_id,
+            # The tab aborts the tool itself once this passes, even if CANCEL is lost
+            "timeout_ms": int(remaining * 1000)
         }
+        if span.recording:
+            # Ask the tab to report when it queued, ran and answered the request
+            payload["trace"] = True
+            span.set_attributes({"tab.id": target_conn.id, "bridge.req_id": req_id})
         
         future = asyncio.Future()
         target_conn.pending_requests[req_id] = future
+        target_conn.sent_frames[req_id] = payload
         
         try:
-            await target_conn.socket.send_json(payload)
-            print(f"[Bridge] 📤 Sent '{tool_name}' to {target_conn.id}, req_id={req_id}")
+            sent_at = asyncio.get_running_loop().time()
+            sent_ns = time.time_ns()
+            await target_conn.send_json(payload)
+            calls_log.debug("📤 Sent '%s' to %s, req_id=%s", tool_name, target_conn.id, req_id)
             
-            result = await asyncio.wait_for(future, timeout=timeout)
-            print(f"[Bridge] 📥 Received response for req_id={req_id}")
+            result = await asyncio.wait_for(future, timeout=remaining)
+            TOOL_LATENCY.observe(asyncio.get_running_loop().time() - sent_at, tool=tool_name)
+            calls_log.debug("📥 Received response for req_id=%s", req_id)
+            trace_tab_timing(span, target_conn.timings.get(req_id), sent_ns)
             return result
             
         except asyncio.TimeoutError:
-            print(f"[Bridge] ⏱️  Timeout for '{tool_name}' after {timeout}s")
+            calls_log.warning("⏱️  Timeout for '%s' after %ss", tool_name, timeout)
+            self._cancel_remote(target_conn, [req_id], "timeout")
             raise TimeoutError(f"Tool '{tool_name}' timed out after {timeout}s")
+        except asyncio.CancelledError:
+            # The MCP client cancelled the request (or the session went away)
+            self._cancel_remote(target_conn, [req_id], "cancelled")
+            raise
         finally:
-            target_conn.pending_requests.pop(req_id, None)
+            target_conn.forget(req_id)
+
+    def query_mirror(
+        self,
+        conn: BrowserConnection,
+        tool_name: str,
+        params: dict,
+        max_age: Optional[float] = None
+    ) -> Tuple[bool, Any]:
+        """Answer a DOM read from the tab's mirror; (False, None) means ask the tab"""
+        mirror = conn.mirror
+        max_age = float(self.mirror_max_age if max_age is None else max_age)
+        if mirror is None or conn.socket is None or mirror.age > max_age:
+            MIRROR_QUERIES.inc(tool=tool_name, outcome="stale")
+            return False, None
+        try:
+            if tool_name == "get_dom":
+                result = mirror.get_dom(params.get("selector") or "body")
+            else:
+                result = mirror.query(
+                    params.get("selector"),
+                    params.get("text"),
+                    int(params.get("limit", 20)),
+                    bool(params.get("html", False))
+                )
+        except UnsupportedSelector:
+            MIRROR_QUERIES.inc(tool=tool_name, outcome="unsupported")
+            return False, None
+        MIRROR_QUERIES.inc(tool=tool_name, outcome="mirror")
+        calls_log.debug("🪞 '%s' on %s answered from the DOM mirror", tool_name, conn.id)
+        return True, result
+
+    async def handle_mirror(self, conn: BrowserConnection, data: dict):
+        """Build or patch a tab's DOM mirror; inconsistent diffs trigger a full resync"""
+        if not self.dom_mirror:
+            return
+        if data.get("type") == "MIRROR_INIT":
+            conn.mirror = None
+            # Serialized pages run to tens of thousands of nodes; build them off the event loop
+            conn.mirror = await asyncio.to_thread(DomMirror.from_init, data)
+            bridge_log.debug("🪞 Mirror of %s built: %d nodes", conn.id, conn.mirror.size)
+            return
+        if conn.mirror is None:
+            # Diffs for a mirror being (re)built or already dropped
+            return
+        try:
+            conn.mirror.apply(data)
+        except MirrorDesync as e:
+            conn.mirror = None
+            MIRROR_RESYNCS.inc()
+            bridge_log.info("🪞 Mirror of %s out of sync (%s), requesting resync", conn.id, e)
+            await conn.send_json({"type": "MIRROR_RESYNC"})
+
+    async def execute_batch(
+        self,
+        session_id: str,
+        calls: List[dict],
+        concurrent: bool = False,
+        stop_on_error: bool = False,
+        timeout: float = DEFAULT_TOOL_TIMEOUT,
+        session_key: Any = None
+    ) -> List[dict]:
+        """Execute several tools in one tab using a single BATCH frame.
+
+        Every call gets its own req_id/Future in pending_requests, and the tab answers
+        each one with the usual {id, result} frame as soon as it finishes, so results
+        stream back and are matched exactly like single calls. Calls still running when
+        the timeout expires are reported as timed out; finished ones are kept.
+        """
+        if not isinstance(calls, list) or not calls:
+            raise ValueError("'calls' must be a non-empty list")
+        for call in calls:
+            if not isinstance(call, dict) or not call.get("name"):
+                raise ValueError("Each call needs a 'name'")
+
+        target_conn = self.resolve_tab(session_id)
+        # A batch is a single frame and occupies a single slot on the tab
+        with tracer.span("bridge.execute_batch", attributes={"tab.id": target_conn.id, "batch.size": len(calls)}):
+            async with self._track_call("batch_execute", target_conn):
+                remaining = await self._acquire_slot(target_conn, "Batch", session_key, timeout)
+                try:
+                    return await self._execute_batch_on(target_conn, calls, concurrent, stop_on_error, timeout, remaining)
+                finally:
+                    target_conn.scheduler.release()
+                    # Batches are not cached and may contain writes
+                    result_cache.invalidate(target_conn.id)
+
+    async def _execute_batch_on(
+        self,
+        target_conn: BrowserConnection,
+        calls: List[dict],
+        concurrent: bool,
+        stop_on_error: bool,
+        timeout: float,
+        remaining: float
+    ) -> List[dict]:
+        loop = asyncio.get_running_loop()
+
+        entries = []
+        futures = []
+        for call in calls:
+            req_id = str(uuid.uuid4())
+            future = loop.create_future()
+            target_conn.pending_requests[req_id] = future
+            entries.append({"method": call["name"], "params": call.get("arguments") or {}, "id": req_id})
+            futures.append(future)
+
+        frame = {
+            "type": "BATCH",
+            "mode": "concurrent" if concurrent else "sequential",
+            "stop_on_error": stop_on_error,
+            "timeout_ms": int(remaining * 1000),
+            "calls": entries
+        }
+        batch_span = tracer.current()
+        if batch_span.recording:
+            frame["trace"] = True
+        for entry in entries:
+            target_conn.sent_frames[entry["id"]] = frame
+
+        try:
+            sent_ns = time.time_ns()
+            await target_conn.send_json(frame)
+            calls_log.debug("📤 Sent batch of %d to %s", len(entries), target_conn.id)
+
+            try:
+                await asyncio.wait(futures, timeout=remaining)
+            except asyncio.CancelledError:
+                self._cancel_remote(
+                    target_conn, [e["id"] for e, f in zip(entries, futures) if not f.done()], "cancelled"
+                )
+                raise
+            self._cancel_remote(target_conn, [e["id"] for e, f in zip(entries, futures) if not f.done()], "timeout")
+
+            results = []
+            for entry, future in zip(entries, futures):
+                item = {"name": entry["method"]}
+                if not future.done():
+                    item["error"] = f"Timed out after {timeout}s"
+                elif future.exception() is not None:
+                    item["error"] = str(future.exception())
+                else:
+                    item["result"] = result_store.export(future.result())
+                results.append(item)
+                if batch_span.recording:
+                    # One span per call, from the batch frame going out to this call's reply
+                    timing = target_conn.timings.get(entry["id"])
+                    span = tracer.start_span(
+                        f"tab {entry['method']}", SPAN_KIND_CLIENT, batch_span,
+                        {"tab.id": target_conn.id, "bridge.req_id": entry["id"]}, sent_ns
+                    )
+                    if "error" in item:
+                        span.set_error(item["error"])
+                    trace_tab_timing(span, timing, sent_ns)
+                    span.end(timing[1] if timing else None)
+            calls_log.debug("📥 Batch of %d finished on %s", len(entries), target_conn.id)
+            return results
+        finally:
+            for entry, future in zip(entries, futures):
+                target_conn.forget(entry["id"])
+                if not future.done():
+                    future.cancel()
+
+    async def execute_fanout(
+        self,
+        target,
+        tool_name: str,
+        params: dict,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        session_key: Any = None
+    ) -> dict:
+        """Run one tool on every tab selected by `target`, at most `concurrency` at a time.
+
+        Each tab gets its own timeout (by default the tool's tools.json timeout); one slow
+        or broken tab never fails the rest.
+        Returns {"succeeded": {tab_id: result}, "failed": {tab_id: error}}.
+        """
+        timeout = fanout_timeout(tool_name, timeout)
+        conns = self.select_tabs(target)
+        succeeded: Dict[str, Any] = {}
+        failed: Dict[str, str] = {}
+
+        if isinstance(target, list):
+            for cid in target:
+                if cid not in self.connections:
+                    failed[cid] = "Tab not found"
+
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.fanout_concurrency))
+
+        async def run(conn: BrowserConnection):
+            async with semaphore:
+                try:
+                    result = await self.execute_tool(
+                        conn.id, tool_name, dict(params), timeout=timeout, session_key=session_key
+                    )
+                    succeeded[conn.id] = result_store.export(result)
+                except Exception as e:
+                    failed[conn.id] = str(e)
+
+        await asyncio.gather(*(run(conn) for conn in conns))
+        calls_log.info("📡 Fan-out '%s': %d ok, %d failed", tool_name, len(succeeded), len(failed))
+        return {"succeeded": succeeded, "failed": failed}
+
+    async def handle_chunk(self, conn: BrowserConnection, data: dict):
+        """Append one CHUNK frame and resolve the request once the final chunk arrives"""
+        req_id = data.get("id")
+        future = conn.pending_requests.get(req_id)
+        chunked = conn.chunks.get(req_id)
+
+        if future is None or future.done():
+            # Request already timed out or was cancelled; drop whatever was buffered
+            if chunked is not None:
+                conn.chunks.pop(req_id).close()
+            return
+
+        if chunked is None:
+            chunked = conn.chunks[req_id] = ChunkedResult()
+
+        try:
+            chunked.append(int(data.get("seq", -1)), data.get("data", ""))
+        except ValueError as e:
+            conn.chunks.pop(req_id).close()
+            future.set_exception(Exception(f"Browser error: {e}"))
+            return
+
+        if not data.get("final"):
+            return
+
+        del conn.chunks[req_id]
+        if data.get("timing"):
+            conn.timings[req_id] = (data["timing"], time.time_ns())
+        if chunked.size <= RESULT_INLINE_LIMIT:
+            try:
+                future.set_result(chunked.load())
+            except ValueError as e:
+                future.set_exception(Exception(f"Browser error: invalid chunked result ({e})"))
+            finally:
+                chunked.close()
+        else:
+            future.set_result(chunked)
 
     async def handle_browser_message(self, conn: BrowserConnection, data: dict):
         """Process incoming messages from browser"""
         msg_type = data.get("type")
+        conn.last_seen = time.monotonic()
+
+        if msg_type == "PONG":
+            conn.record_pong(data)
+            if conn.mirror is not None:
+                conn.mirror.confirm(data.get("mirror_gen"), data.get("mirror_seq"))
+            return
+
+        if msg_type in ("MIRROR_INIT", "MIRROR_DIFF"):
+            await self.handle_mirror(conn, data)
+            return
         
         if msg_type == "LOG":
-            print(f"[Browser-{conn.id}] 📋 {data.get('message')}")
+            log_sink.submit([data], conn.id)
+            return
+
+        if msg_type == "LOG_BATCH":
+            log_sink.submit(data.get("entries") or [], conn.id)
+            return
+
+        if msg_type == "TOOLS_ACK":
+            conn.tools_version = data.get("version")
+            return
+
+        if msg_type == "GET_TOOLS":
+            await self.send_tools(conn, full=True)
+            return
+
+        if msg_type == "CHUNK":
+            await self.handle_chunk(conn, data)
+            return
+
+        if msg_type == "DIRTY":
+            # The page changed (DOM mutation or navigation): cached reads are stale
+            result_cache.invalidate(conn.id)
+            await self._update_url(conn, data.get("url"))
             return
         
         req_id = data.get("id")
         if req_id and req_id in conn.pending_requests:
             future = conn.pending_requests[req_id]
             if not future.done():
+                if data.get("timing"):
+                    conn.timings[req_id] = (data["timing"], time.time_ns())
                 result = data.get("result")
                 error = data.get("error")
                 
@@ -137,6 +1981,138 @@ class MCPBridge:
 
 bridge = MCPBridge()
 
+def _collect_bridge_gauges():
+    CONNECTED_TABS.set(len(bridge.connections))
+    RESULT_CACHE_SIZE.set(result_cache.size)
+    ARCHIVED_SNAPSHOTS.set(snapshot_archive.size)
+    for conn in bridge.connections.values():
+        PENDING_REQUESTS.set(len(conn.pending_requests), tab=conn.id)
+        QUEUED_REQUESTS.set(conn.scheduler.queued, tab=conn.id)
+        if conn.rtt is not None:
+            TAB_RTT.set(conn.rtt, tab=conn.id)
+        TAB_LOOP_LAG.set(conn.loop_lag, tab=conn.id)
+        if conn.mirror is not None:
+            MIRROR_NODES.set(conn.mirror.size, tab=conn.id)
+
+metrics.add_collector(_collect_bridge_gauges)
+
+# --- Screenshots ---
+
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+def encode_image(data: bytes, mime: str, wanted_mime: str, max_width: Optional[int], quality: int) -> Tuple[str, str]:
+    """Optionally downscale / convert with Pillow, then base64-encode (runs in image_executor)"""
+    if Image is not None and (mime != wanted_mime or max_width):
+        img = Image.open(io.BytesIO(data))
+        if max_width and img.width > max_width:
+            img = img.resize((max_width, max(1, round(img.height * max_width / img.width))), Image.LANCZOS)
+        fmt = wanted_mime.split("/")[-1].upper()
+        if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format=fmt, **({"quality": quality} if fmt in ("JPEG", "WEBP") else {}))
+        data, mime = out.getvalue(), wanted_mime
+    return base64.b64encode(data).decode("ascii"), mime
+
+class ScreenshotService:
+    """Captures screenshots in the tab and caches them briefly per tab and view.
+
+    The tab identifies its view by URL + scroll position + viewport size. While a
+    cached frame is fresh, the request carries its view key and the tab answers
+    {"unchanged": true} instead of re-rendering when nothing moved.
+    """
+    def __init__(self, bridge: MCPBridge, ttl: float = SCREENSHOT_CACHE_TTL):
+        self.bridge = bridge
+        self.ttl = ttl
+        # (tab_id, format, quality, max_width, full_page) -> (captured_at, view_key, base64, mime)
+        self._cache: Dict[tuple, Tuple[float, Optional[str], str, str]] = {}
+
+    def _prune(self, now: float):
+        for key in [k for k, v in self._cache.items() if now - v[0] >= self.ttl or k[0] not in self.bridge.connections]:
+            del self._cache[key]
+
+    async def capture(
+        self,
+        tab_id: str,
+        fmt: str = "png",
+        quality: float = 0.8,
+        max_width: Optional[int] = None,
+        full_page: bool = False,
+        timeout: float = DEFAULT_TOOL_TIMEOUT,
+        session_key: Any = None
+    ) -> ImageContent:
+        if fmt not in SCREENSHOT_FORMATS:
+            raise ValueError(f"Unsupported screenshot format: {fmt}")
+
+        conn = self.bridge.resolve_tab(tab_id)
+        now = time.monotonic()
+        self._prune(now)
+
+        key = (conn.id, fmt, quality, max_width, full_page)
+        cached = self._cache.get(key)
+        params = {"format": fmt, "quality": quality, "max_width": max_width, "full_page": full_page}
+        if cached is not None:
+            params["if_view"] = cached[1]
+
+        result = await self.bridge.execute_tool(conn.id, "screenshot", params, timeout=timeout, session_key=session_key)
+        if not isinstance(result, dict):
+            raise Exception("Browser error: unexpected screenshot result")
+        if result.get("unchanged") and cached is not None:
+            return ImageContent(type="image", data=cached[2], mimeType=cached[3])
+        if "data" not in result:
+            raise Exception(f"Browser error: {result.get('error', 'screenshot failed')}")
+
+        loop = asyncio.get_running_loop()
+        data, mime = await loop.run_in_executor(
+            image_executor,
+            encode_image,
+            result["data"],
+            result.get("mime", "image/png"),
+            f"image/{fmt}",
+            max_width if max_width and result.get("width", 0) > max_width else None,
+            int(quality * 100)
+        )
+        self._cache[key] = (time.monotonic(), result.get("view"), data, mime)
+        return ImageContent(type="image", data=data, mimeType=mime)
+
+screenshots = ScreenshotService(bridge)
+
+# --- Snapshot Archive ---
+
+snapshot_store = SnapshotStore(os.path.join(SNAPSHOT_DIR, "store"))
+snapshot_archive = SnapshotArchive(SNAPSHOT_INDEX, SNAPSHOT_DIR, snapshot_store)
+archive_refresh: Optional[asyncio.Task] = None
+
+async def _refresh_archive():
+    try:
+        await asyncio.to_thread(snapshot_archive.refresh)
+    except Exception as e:
+        store_log.error("❌ Snapshot indexing failed: %s", e)
+
+def refresh_archive():
+    """Index new snapshots in the background unless that is already happening"""
+    global archive_refresh
+    if archive_refresh is None or archive_refresh.done():
+        archive_refresh = asyncio.create_task(_refresh_archive())
+
+async def search_archive(options: dict, limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """One page of snapshot search results (see SnapshotArchive.search for the options)"""
+    # Pick up snapshots dropped into the directory by other means for the next search
+    refresh_archive()
+    started = time.perf_counter()
+    hits, next_cursor = await asyncio.to_thread(
+        snapshot_archive.search,
+        query=options.get("query"),
+        url=options.get("url"),
+        since=options.get("since"),
+        until=options.get("until"),
+        order=options.get("order") or "rank",
+        limit=limit,
+        cursor=cursor
+    )
+    SNAPSHOT_SEARCH_LATENCY.observe(time.perf_counter() - started)
+    return hits, next_cursor
+
 # --- MCP Server Definition ---
 
 mcp = Server("ResilientBrowser-MCP")
@@ -146,119 +2122,328 @@ mcp = Server("ResilientBrowser-MCP")
 @mcp.list_tools()
 async def list_tools() -> list[Tool]:
     """Lists all available tools"""
-    tools_list: list[Tool] = []
-
-    tools_list.append(
-        Tool(
-            name="list_tabs",
-            description="Returns a list of all connected browser tabs with their IDs and URLs.",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        )
-    )
+    return list(tool_registry.tools)
 
-    tools_list.append(
-        Tool(
-            name="screenshot",
-            description="Takes a screenshot of a browser tab",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "tab_id": {
-                        "type": "string",
-                        "description": "Tab ID or 'latest'",
-                        "default": "latest"
-                    }
-                },
-                "required": []
-            }
-        )
-    )
-
-    # Dynamic Tools from tools.json
+def current_session_key() -> Any:
+    """Identity of the MCP session making the current request (for fair scheduling)"""
     try:
-        tools_path = os.path.join(os.path.dirname(__file__), "tools.json")
-        if os.path.exists(tools_path):
-            with open(tools_path, "r", encoding="utf-8") as f:
-                dynamic_tools = json.load(f)
-            
-            for dt in dynamic_tools:
-                schema = dt.get("parameters", dt.get("input_schema", {"type": "object", "properties": {}}))
-                if "properties" not in schema:
-                    schema["properties"] = {}
-                
-                if "tab_id" not in schema["properties"]:
-                    schema["properties"]["tab_id"] = {
-                        "type": "string", 
-                        "description": "Target Browser Tab ID or 'latest'",
-                        "default": "latest"
-                    }
+        return id(mcp.request_context.session)
+    except LookupError:
+        return None
 
-                tools_list.append(
-                    Tool(
-                        name=dt["name"],
-                        description=dt.get("explain_for_ai", dt.get("description", "")),
-                        inputSchema=schema
-                    )
-                )
-    except Exception as e:
-        print(f"[MCP] ⚠️  Error loading dynamic tools: {e}")
-
-    return tools_list
+def current_trace_parent() -> Any:
+    """Span of the POST /messages that delivered the current MCP request (or its traceparent)"""
+    try:
+        request = mcp.request_context.request
+    except LookupError:
+        return None
+    if request is None:
+        return None
+    return request.scope.get("state", {}).get("trace_span") or request.headers.get("traceparent")
 
 @mcp.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[TextContent | ImageContent | EmbeddedResource]:
     """Central handler for ALL tool execution"""
-    print(f"[MCP] 🔧 Tool called: {name} with args: {arguments}")
-    
+    calls_log.debug("🔧 Tool called: %s with args: %r", name, arguments)
+    with tracer.span(f"tools/call {name}", SPAN_KIND_SERVER, current_trace_parent()) as span:
+        if span.recording:
+            span.set_attributes({"mcp.tool": name, "mcp.tab_selector": arguments.get("tab_id", "latest")})
+            with suppress(LookupError):
+                span.set_attribute("jsonrpc.request.id", str(mcp.request_context.request_id))
+        return await run_tool(name, arguments, current_session_key())
+
+async def run_tool(
+    name: str,
+    arguments: dict,
+    session_key: Any,
+    forwarded: bool = False
+) -> list[TextContent | ImageContent | EmbeddedResource]:
+    """Execute one tool call on this worker, or forward it to the worker owning its tab"""
     tab_id = arguments.pop("tab_id", "latest")
     
     try:
+        timeout = call_timeout(name, arguments)
+        if bridge.cluster is not None and not forwarded:
+            owner, tab_id = locate_call(name, tab_id, arguments)
+            if owner is not None:
+                return await forward_call(
+                    owner, name, {**arguments, "tab_id": tab_id, "deadline": timeout}, session_key, timeout
+                )
+
         if name == "list_tabs":
-            if not bridge.connections:
+            if bridge.cluster is not None:
+                tabs_info = [
+                    f"ID: {t['id']} | URL: {t['url']} | UA: {t['ua']} | Worker: {t['worker']}"
+                    for t in bridge.cluster.directory.values()
+                ]
+            else:
+                tabs_info = [
+                    f"ID: {cid} | URL: {c.url} | UA: {c.ua}"
+                    for cid, c in bridge.connections.items()
+                ]
+            if not tabs_info:
                 return [TextContent(type="text", text="No tabs connected.")]
             
-            tabs_info = [
-                f"ID: {cid} | URL: {c.url} | UA: {c.ua}"
-                for cid, c in bridge.connections.items()
-            ]
             result = "\n".join(tabs_info)
-            print(f"[MCP] ✅ list_tabs result: {result}")
+            calls_log.debug("✅ list_tabs result: %s", result)
             return [TextContent(type="text", text=result)]
 
+        elif name == "batch_execute":
+            results = await bridge.execute_batch(
+                tab_id,
+                arguments.get("calls"),
+                concurrent=bool(arguments.get("concurrent", False)),
+                stop_on_error=bool(arguments.get("stop_on_error", False)),
+                timeout=timeout,
+                session_key=session_key
+            )
+            return [TextContent(type="text", text=dump_result(results))]
+
+        elif name == "fanout_execute":
+            if not arguments.get("name"):
+                raise ValueError("'name' is required")
+            execute_fanout = cluster_fanout if bridge.cluster is not None and not forwarded else bridge.execute_fanout
+            results = await execute_fanout(
+                arguments.get("tabs", "all"),
+                arguments["name"],
+                arguments.get("arguments") or {},
+                concurrency=arguments.get("concurrency"),
+                timeout=fanout_timeout(arguments["name"], arguments.get("timeout")),
+                session_key=session_key
+            )
+            return [TextContent(type="text", text=dump_result(results))]
+
+        elif name == "read_result":
+            chunked = result_store.get(arguments.get("handle", ""))
+            offset = max(0, int(arguments.get("offset", 0)))
+            length = max(1, int(arguments.get("length", 65536)))
+            text = chunked.read(offset, length)
+            end = min(offset + length, chunked.size)
+            return [
+                TextContent(type="text", text=text),
+                TextContent(type="text", text=f"[Bytes {offset}-{end} of {chunked.size}]")
+            ]
+
+        elif name == "search_snapshots":
+            hits, cursor = await search_archive(
+                arguments, int(arguments.get("limit", 10)), arguments.get("cursor") or None
+            )
+            return [TextContent(type="text", text=dump_result({
+                "results": hits,
+                "next_cursor": cursor,
+                "archived": snapshot_archive.size
+            }))]
+
         elif name == "screenshot":
-            return [TextContent(type="text", text=f"Screenshot functionality requested for tab {tab_id} (not implemented yet).")]
+            max_width = arguments.get("max_width")
+            image = await screenshots.capture(
+                tab_id,
+                fmt=arguments.get("format", "png"),
+                quality=float(arguments.get("quality", 0.8)),
+                max_width=int(max_width) if max_width else None,
+                full_page=bool(arguments.get("full_page", False)),
+                timeout=timeout,
+                session_key=session_key
+            )
+            return [image]
 
         else:
-            result = await bridge.execute_tool(tab_id, name, arguments)
-            return [TextContent(type="text", text=json.dumps(result, indent=2))]
+            result = await bridge.execute_tool(tab_id, name, arguments, timeout=timeout, session_key=session_key)
+            if isinstance(result, ChunkedResult):
+                exported = result_store.export(result)
+                return [
+                    TextContent(type="text", text=exported["preview"]),
+                    TextContent(type="text", text=(
+                        f"[Result truncated: {exported['size']} bytes total. "
+                        f"Call read_result with handle '{exported['handle']}' to fetch the rest.]"
+                    ))
+                ]
+            return [TextContent(type="text", text=dump_result(result))]
 
+    except TabBusyError as be:
+        mcp_log.warning("🚦 %s", be)
+        tracer.current().set_error(str(be))
+        return [TextContent(type="text", text=f"Error: {str(be)}")]
     except TimeoutError as te:
-        print(f"[MCP] ⏱️  {te}")
+        mcp_log.warning("⏱️  %s", te)
+        tracer.current().set_error(str(te))
         return [TextContent(type="text", text=f"Timeout: {str(te)}")]
     except ValueError as ve:
-        print(f"[MCP] ⚠️  {ve}")
+        mcp_log.info("⚠️  %s", ve)
+        tracer.current().set_error(str(ve))
         return [TextContent(type="text", text=f"Error: {str(ve)}")]
     except Exception as e:
-        print(f"[MCP] ❌ Execution failed: {e}")
+        mcp_log.error("❌ Execution failed: %s", e)
+        tracer.current().set_error(str(e))
         return [TextContent(type="text", text=f"Execution Failed: {str(e)}")]
 
+def call_timeout(name: str, arguments: dict) -> float:
+    """Deadline of one call: its "deadline" argument, else the tool's tools.json timeout, else the default"""
+    deadline = arguments.pop("deadline", None)
+    if deadline is not None:
+        return max(0.1, float(deadline))
+    return tool_registry.timeouts.get(name, DEFAULT_TOOL_TIMEOUT)
+
+def fanout_timeout(name: str, timeout: Optional[float]) -> float:
+    """Per-tab timeout of a fan-out: the explicit one, else the tool's tools.json timeout, else the default"""
+    if timeout is not None:
+        return max(0.1, float(timeout))
+    return tool_registry.timeouts.get(name, DEFAULT_TOOL_TIMEOUT)
+
+# --- Cluster Routing (multi-worker mode) ---
+
+def locate_call(name: str, tab_id: str, arguments: dict) -> Tuple[Optional[str], str]:
+    """Find which worker should run a call: (owner worker or None for this one, concrete tab ID).
+
+    Tab selectors are resolved against the cluster-wide directory, so "latest" means
+    the newest tab on any worker; exact IDs of local tabs skip the lookup entirely.
+    """
+    if name == "read_result":
+        worker, sep, _ = arguments.get("handle", "").rpartition("/")
+        return (worker if sep and worker != WORKER_ID else None), tab_id
+    if name in ("list_tabs", "fanout_execute", "search_snapshots"):
+        return None, tab_id
+    if tab_id in bridge.connections:
+        return None, tab_id
+    info = resolve_any(tab_id) if tab_id == "any" or tab_id.startswith("any:") else bridge.cluster.resolve(tab_id)
+    return (None if info["worker"] == WORKER_ID else info["worker"]), info["id"]
+
+def resolve_any(selector: str) -> dict:
+    """Directory entry for an "any" selector: load and latency are only known for local
+    tabs (which also save the forwarding hop), so remote tabs are the newest-match fallback"""
+    try:
+        return {"id": bridge.resolve_tab(selector).id, "worker": WORKER_ID}
+    except ValueError:
+        return bridge.cluster.resolve(selector[4:])
+
+def _content_from_dict(item: dict) -> TextContent | ImageContent | EmbeddedResource:
+    if item.get("type") == "image":
+        return ImageContent(**item)
+    if item.get("type") == "resource":
+        return EmbeddedResource(**item)
+    return TextContent(**item)
+
+async def forward_call(
+    worker: str,
+    name: str,
+    arguments: dict,
+    session_key: Any,
+    timeout: float = DEFAULT_TOOL_TIMEOUT
+) -> list[TextContent | ImageContent | EmbeddedResource]:
+    calls_log.debug("🔀 Forwarding '%s' for tab %s to worker %s", name, arguments.get("tab_id"), worker)
+    items = await bridge.cluster.request(worker, {
+        "op": "call_tool",
+        "name": name,
+        "arguments": arguments,
+        "session_key": repr(session_key),
+        "traceparent": tracer.current().traceparent
+    }, timeout + CLUSTER_FORWARD_MARGIN)
+    return [_content_from_dict(item) for item in items]
+
+async def cluster_fanout(
+    target,
+    tool_name: str,
+    params: dict,
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    session_key: Any = None
+) -> dict:
+    """Fan out across every worker: each owner runs MCPBridge.execute_fanout for its own tabs.
+
+    `concurrency` applies per worker.
+    """
+    timeout = fanout_timeout(tool_name, timeout)
+    if isinstance(target, str) and (target == "any" or target.startswith("any:")):
+        target = [resolve_any(target)["id"]]
+    infos = bridge.cluster.select(target)
+    succeeded: Dict[str, Any] = {}
+    failed: Dict[str, str] = {}
+    if isinstance(target, list):
+        for tab_id in target:
+            if tab_id not in bridge.cluster.directory:
+                failed[tab_id] = "Tab not found"
+
+    groups: Dict[str, List[str]] = {}
+    for info in infos:
+        groups.setdefault(info["worker"], []).append(info["id"])
+
+    async def run(worker: str, tab_ids: List[str]):
+        try:
+            if worker == WORKER_ID:
+                result = await bridge.execute_fanout(tab_ids, tool_name, params, concurrency, timeout, session_key)
+            else:
+                result = await bridge.cluster.request(worker, {
+                    "op": "fanout",
+                    "tabs": tab_ids,
+                    "name": tool_name,
+                    "arguments": params,
+                    "concurrency": concurrency,
+                    "timeout": timeout,
+                    "session_key": repr(session_key),
+                    "traceparent": tracer.current().traceparent
+                }, timeout + CLUSTER_FORWARD_MARGIN)
+            succeeded.update(result["succeeded"])
+            failed.update(result["failed"])
+        except Exception as e:
+            failed.update({tab_id: str(e) for tab_id in tab_ids})
+
+    await asyncio.gather(*(run(worker, tab_ids) for worker, tab_ids in groups.items()))
+    return {"succeeded": succeeded, "failed": failed}
+
+async def _serve_forwarded_call(message: dict) -> List[dict]:
+    # Remote sessions are scheduled fairly alongside local ones, keyed by origin worker
+    session_key = (message.get("reply_to"), message.get("session_key"))
+    with tracer.span(f"cluster.call_tool {message['name']}", SPAN_KIND_SERVER, message.get("traceparent")) as span:
+        span.set_attribute("cluster.origin", message.get("reply_to"))
+        contents = await run_tool(message["name"], dict(message.get("arguments") or {}), session_key, forwarded=True)
+    return [c.model_dump(mode="json", exclude_none=True) for c in contents]
+
+async def _serve_forwarded_fanout(message: dict) -> dict:
+    with tracer.span(f"cluster.fanout {message['name']}", SPAN_KIND_SERVER, message.get("traceparent")):
+        return await bridge.execute_fanout(
+            message.get("tabs") or [],
+            message["name"],
+            message.get("arguments") or {},
+            concurrency=message.get("concurrency"),
+            timeout=fanout_timeout(message["name"], message.get("timeout")),
+            session_key=(message.get("reply_to"), message.get("session_key"))
+        )
+
 
 # --- FastAPI App with Lifespan ---
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("=" * 60)
-    print("🚀 MCP Server Starting")
-    print(f"   Token: {BRIDGE_TOKEN}")
-    print(f"   SSE Endpoint: http://127.0.0.1:8080/sse")
-    print(f"   Messages Endpoint: http://127.0.0.1:8080/messages")
-    print("=" * 60)
+    server_log.info("🚀 MCP Server Starting")
+    server_log.info("   Token: %s", BRIDGE_TOKEN)
+    server_log.info("   SSE Endpoint: http://127.0.0.1:8080/sse")
+    server_log.info("   Messages Endpoint: http://127.0.0.1:8080/messages")
+    tool_registry.add_listener(bridge.broadcast_tools)
+    tool_registry.start()
+    log_sink.start()
+    tracer.start()
+    refresh_archive()
+    bridge.start_heartbeat()
+    broker = make_broker(BROKER_URL)
+    if broker is not None:
+        bridge.cluster = ClusterRouter(broker, WORKER_ID)
+        bridge.cluster.register_error(TabBusyError)
+        bridge.cluster.on("call_tool", _serve_forwarded_call)
+        bridge.cluster.on("fanout", _serve_forwarded_fanout)
+        bridge.cluster.on("sse_message", _serve_forwarded_message)
+        result_store.prefix = f"{WORKER_ID}/"
+        await bridge.cluster.start()
     yield
-    print("\n🛑 MCP Server Shutting Down")
+    if bridge.cluster is not None:
+        await bridge.cluster.stop()
+        bridge.cluster = None
+    await bridge.stop_heartbeat()
+    await tool_registry.stop()
+    await log_sink.stop()
+    await tracer.stop()
+    snapshot_archive.close()
+    image_executor.shutdown(wait=False)
+    server_log.info("🛑 MCP Server Shutting Down")
 
 app = FastAPI(lifespan=lifespan)
 
@@ -273,23 +2458,30 @@ app.add_middleware(
 # --- FastAPI Routes ---
 
 @app.websocket("/mcp-bridge")
-async def websocket_endpoint(websocket: WebSocket, token: str = Query(None), url: str = Query("unknown")):
-    conn = await bridge.connect(websocket, token, url)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    token: str = Query(None),
+    url: str = Query("unknown"),
+    tools_version: Optional[str] = Query(None),
+    encoding: str = Query("json"),
+    resume: Optional[str] = Query(None),
+    resume_token: Optional[str] = Query(None)
+):
+    conn = await bridge.connect(websocket, token, url, tools_version, encoding, resume, resume_token)
     if not conn:
         return
 
-    await bridge.broadcast_tools()
-
     try:
-        while True:
-            data = await websocket.receive_json()
+        # Read from this socket only: a resumed session may already have moved to a newer one
+        while conn.socket is websocket:
+            data = await conn.receive_json(websocket)
             await bridge.handle_browser_message(conn, data)
             
     except WebSocketDisconnect:
-        await bridge.disconnect(conn.id)
+        await bridge.suspend(conn, websocket)
     except Exception as e:
-        print(f"[Bridge] ❌ Error in WebSocket for {conn.id}: {e}")
-        await bridge.disconnect(conn.id)
+        bridge_log.error("❌ Error in WebSocket for %s: %s", conn.id, e)
+        await bridge.suspend(conn, websocket)
 
 @app.get("/update")
 async def update_script():
@@ -298,31 +2490,266 @@ async def update_script():
         return FileResponse(file_path, media_type="application/javascript", filename="ResilientMenu.user.js")
     return {"error": "Script file not found"}
 
+@app.post("/log")
+async def ingest_logs(request: Request):
+    """HTTP fallback for browser logs: a single entry, a list, or {"entries": [...]}"""
+    try:
+        data = json.loads(await request.body())
+    except ValueError:
+        return Response(content="Invalid log payload", status_code=400)
+
+    if isinstance(data, dict):
+        entries = data.get("entries") if isinstance(data.get("entries"), list) else [data]
+    elif isinstance(data, list):
+        entries = data
+    else:
+        return Response(content="Invalid log payload", status_code=400)
+
+    log_sink.submit(entries, request.query_params.get("tab_id"))
+    return {"status": "ok", "accepted": len(entries)}
+
+@app.post("/snapshot")
+async def save_snapshot(request: Request):
+    """Store a page snapshot (HTML + screenshot) in the content-addressed store.
+
+    Preferred format is multipart/form-data (html, screenshot, url, title), which
+    Starlette streams into spooled temp files. The legacy JSON body
+    {html, screenshot: data URL} is still accepted.
+    """
+    content_type = request.headers.get("content-type", "")
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        try:
+            html = form.get("html")
+            screenshot = form.get("screenshot")
+            meta = {"url": form.get("url"), "title": form.get("title"), "tab_id": form.get("tab_id")}
+
+            def html_chunks():
+                if html is None:
+                    return None
+                if isinstance(html, str):
+                    return iter_text(html)
+                return iter_file(html.file)
+
+            entry = await asyncio.to_thread(
+                snapshot_store.add,
+                html_chunks(),
+                iter_file(screenshot.file) if screenshot is not None and not isinstance(screenshot, str) else None,
+                meta
+            )
+        except ValueError as e:
+            return Response(content=str(e), status_code=400)
+        finally:
+            await form.close()
+    else:
+        try:
+            data = json.loads(await request.body())
+        except ValueError:
+            return Response(content="Invalid snapshot payload", status_code=400)
+        if not isinstance(data, dict):
+            return Response(content="Invalid snapshot payload", status_code=400)
+
+        html = data.get("html")
+        screenshot = data.get("screenshot")
+        if not isinstance(html, (str, type(None))) or not isinstance(screenshot, (str, type(None))):
+            return Response(content="Invalid snapshot payload", status_code=400)
+        try:
+            entry = await asyncio.to_thread(
+                snapshot_store.add,
+                iter_text(html) if html else None,
+                iter_base64(screenshot) if screenshot else None,
+                {"url": data.get("url"), "title": data.get("title"), "tab_id": data.get("tab_id")}
+            )
+        except ValueError as e:
+            # Empty snapshot or a screenshot that is not base64
+            return Response(content=str(e), status_code=400)
+
+    store_log.info("📸 Snapshot stored %s (dedup=%s)", entry["id"], entry["deduplicated"])
+    refresh_archive()
+    return {"status": "ok", **entry}
+
+@app.get("/snapshots/search")
+async def search_snapshots(request: Request):
+    """Stream matching snapshots as NDJSON: one hit per line, then {"next_cursor": ...}.
+
+    Takes the search_snapshots tool arguments as query parameters; `limit` caps the
+    whole stream, which is fetched page by page so the first hits arrive at once.
+    Pass the final next_cursor back as `cursor` to continue where the stream stopped.
+    """
+    options = dict(request.query_params)
+    try:
+        remaining = min(max(1, int(options.get("limit", SNAPSHOT_STREAM_LIMIT))), SNAPSHOT_STREAM_MAX)
+        # Fetched up front so bad parameters are a 400 rather than a broken stream
+        hits, cursor = await search_archive(options, min(remaining, SNAPSHOT_PAGE_SIZE), options.get("cursor") or None)
+    except (ValueError, sqlite3.OperationalError) as e:
+        # OperationalError: a query FTS5 rejects even as plain quoted words
+        return Response(content=str(e), status_code=400)
+
+    async def lines():
+        nonlocal hits, cursor, remaining
+        while True:
+            for hit in hits:
+                yield json.dumps(hit, ensure_ascii=False) + "\n"
+            remaining -= len(hits)
+            if cursor is None or remaining <= 0:
+                break
+            hits, cursor = await search_archive(options, min(remaining, SNAPSHOT_PAGE_SIZE), cursor)
+        yield json.dumps({"next_cursor": cursor}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/snapshots/{snapshot_id}")
+async def get_snapshot(snapshot_id: str, image: bool = Query(False)):
+    """HTML of an archived snapshot, or its screenshot with ?image=true"""
+    files = await asyncio.to_thread(snapshot_archive.get, snapshot_id)
+    path = files and (files["image"] if image else files["html"])
+    if not path or not os.path.exists(path):
+        return Response(content="Snapshot not found", status_code=404)
+    if image:
+        return FileResponse(path, media_type="image/png")
+    if files["html_gzip"]:
+        # Stored compressed: send the blob as is
+        return FileResponse(path, media_type="text/html; charset=utf-8", headers={"Content-Encoding": "gzip"})
+    return FileResponse(path, media_type="text/html; charset=utf-8")
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition of bridge metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "ok",
         "connected_tabs": len(bridge.connections),
-        "tabs": [{"id": c.id, "url": c.url} for c in bridge.connections.values()]
+        "tabs": [
+            {
+                "id": c.id,
+                "url": c.url,
+                "inflight": c.scheduler.inflight,
+                "queued": c.scheduler.queued,
+                "suspended": c.socket is None,
+                "rtt_ms": round(c.rtt * 1000, 1) if c.rtt is not None else None,
+                "loop_lag_ms": round(c.loop_lag * 1000, 1),
+                "hidden": c.hidden,
+                "idle_s": round(time.monotonic() - c.last_seen, 1),
+                "mirror": {"nodes": c.mirror.size, "age_s": round(c.mirror.age, 1)} if c.mirror is not None else None
+            }
+            for c in bridge.connections.values()
+        ]
     }
 
 # --- Enhanced SSE Transport with Keep-Alive ---
 
 sse_transport = SseServerTransport("/messages")
 
+def sse_session_key(session_id: Optional[str]) -> Optional[str]:
+    """Canonical (hex) form of a session_id query parameter, None if it is not a UUID"""
+    try:
+        return uuid.UUID(hex=session_id or "").hex
+    except ValueError:
+        return None
+
+def endpoint_session_id(body: bytes) -> Optional[str]:
+    """Session ID announced by an SSE stream's first event, "endpoint", whose data is the
+    URL to POST messages to (".../messages?session_id=<hex>")"""
+    event, data = None, None
+    for line in body.decode("utf-8", errors="replace").splitlines():
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            event = value
+        elif field == "data":
+            data = value
+    if event != "endpoint" or data is None:
+        return None
+    return sse_session_key(parse_qs(urlsplit(data).query).get("session_id", [None])[0])
+
 async def handle_sse(scope, receive, send):
     """Enhanced SSE handler with explicit keep-alive"""
-    print(f"[SSE] 🔌 New client connecting from {scope.get('client', 'unknown')}")
-    
+    sse_log.info("🔌 New client connecting from %s", scope.get("client", "unknown"))
+    session_id: Optional[str] = None
+    announced = False
+
+    async def send_tracked(message):
+        nonlocal session_id, announced
+        if not announced and message["type"] == "http.response.body" and message.get("body"):
+            announced = True
+            session_id = endpoint_session_id(message["body"])
+            if session_id is not None and bridge.cluster is not None:
+                # Registered before the client learns the URL, so its first POST finds the owner
+                await bridge.cluster.register_session(session_id)
+        await send(message)
+
+    SSE_SESSIONS.inc()
     try:
-        async with sse_transport.connect_sse(scope, receive, send) as streams:
-            print("[SSE] ✅ SSE connection established, starting MCP session")
+        async with sse_transport.connect_sse(scope, receive, send_tracked) as streams:
+            sse_log.debug("✅ SSE connection established, starting MCP session")
             await mcp.run(streams[0], streams[1], mcp.create_initialization_options())
-            print("[SSE] 🏁 MCP session completed normally")
+            sse_log.info("🏁 MCP session completed normally")
     except Exception as e:
-        print(f"[SSE] ❌ Error in SSE handler: {e}")
+        sse_log.error("❌ Error in SSE handler: %s", e)
         raise
+    finally:
+        SSE_SESSIONS.dec()
+        if session_id is not None and bridge.cluster is not None:
+            with suppress(Exception):
+                await bridge.cluster.unregister_session(session_id)
+
+async def forward_sse_message(scope, receive, send, session_id: str):
+    """POST /messages for an SSE session held by another worker: relay it to the owner.
+
+    The owner's response (202, or its error) is passed back; the MCP reply itself
+    arrives over that session's SSE stream as usual.
+    """
+    owner = await bridge.cluster.session_owner(session_id)
+    if owner is None:
+        await Response("Could not find session", status_code=404)(scope, receive, send)
+        return
+    request = Request(scope, receive)
+    body = await request.body()
+    try:
+        response = await bridge.cluster.request(owner, {
+            "op": "sse_message",
+            "session_id": session_id,
+            "content_type": request.headers.get("content-type", "application/json"),
+            "traceparent": tracer.current().traceparent,
+            "body": body.decode("utf-8", errors="replace")
+        }, CLUSTER_FORWARD_MARGIN)
+    except (TimeoutError, ConnectionError) as e:
+        sse_log.warning("⚠️  Cannot reach worker %s for session %s: %s", owner, session_id, e)
+        response = {"status": 503, "body": "Session owner unavailable"}
+    await Response(response["body"], status_code=response["status"])(scope, receive, send)
+
+async def _serve_forwarded_message(message: dict) -> dict:
+    session_id = message.get("session_id")
+    body = message.get("body", "").encode("utf-8")
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/messages",
+        "query_string": f"session_id={session_id}".encode(),
+        "headers": [(b"content-type", message.get("content_type", "application/json").encode())],
+    }
+    if message.get("traceparent"):
+        # call_tool continues the trace started by the worker that received the POST
+        scope["headers"].append((b"traceparent", message["traceparent"].encode()))
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    response = {"status": 500, "body": b""}
+
+    async def send(reply):
+        if reply["type"] == "http.response.start":
+            response["status"] = reply["status"]
+        elif reply["type"] == "http.response.body":
+            response["body"] += reply.get("body", b"")
+
+    await sse_transport.handle_post_message(scope, receive, send)
+    return {"status": response["status"], "body": response["body"].decode("utf-8", errors="replace")}
 
 class EnhancedSSEMiddleware:
     """Middleware with explicit SSE lifecycle management"""
@@ -337,13 +2764,25 @@ class EnhancedSSEMiddleware:
             normalized_path = path.rstrip("/")
             
             if normalized_path == "/sse":
-                print(f"[SSE] 📡 Intercepted SSE request: {method} {path}")
+                sse_log.debug("📡 Intercepted SSE request: %s %s", method, path)
                 await handle_sse(scope, receive, send)
                 return
 
             if normalized_path == "/messages" and method == "POST":
-                print(f"[SSE] 📨 Intercepted POST to /messages")
-                await sse_transport.handle_post_message(scope, receive, send)
+                calls_log.debug("📨 Intercepted POST to /messages")
+                # MCP clients may continue their own trace with a W3C traceparent header
+                traceparent = next((v.decode("latin-1") for k, v in scope.get("headers", ()) if k == b"traceparent"), None)
+                with tracer.span("POST /messages", SPAN_KIND_SERVER, traceparent) as span:
+                    if span.recording:
+                        span.set_attribute("mcp.session_id", Request(scope).query_params.get("session_id"))
+                    # Handed to call_tool through the request scope (it runs in the session's task)
+                    scope.setdefault("state", {})["trace_span"] = span
+                    if bridge.cluster is not None:
+                        session_id = sse_session_key(Request(scope).query_params.get("session_id"))
+                        if session_id is not None and session_id not in bridge.cluster.sessions:
+                            await forward_sse_message(scope, receive, send, session_id)
+                            return
+                    await sse_transport.handle_post_message(scope, receive, send)
                 return
 
         await self.app(scope, receive, send)
@@ -351,10 +2790,18 @@ class EnhancedSSEMiddleware:
 app.add_middleware(EnhancedSSEMiddleware)
 
 if __name__ == "__main__":
+    if WORKERS > 1 and (not BROKER_URL or BROKER_URL.startswith("memory:")):
+        sys.exit("MCP_WORKERS > 1 needs a shared MCP_BROKER_URL (e.g. redis://localhost:6379/0) to route tabs")
     uvicorn.run(
-        app, 
+        # Several workers need an import string so each process builds its own app
+        "server:app" if WORKERS > 1 else app,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        workers=WORKERS,
         host="0.0.0.0", 
         port=8080,
         log_level="info",
-        access_log=True
+        # Per-request access lines are synchronous writes; opt in with MCP_ACCESS_LOG=1
+        access_log=os.getenv("MCP_ACCESS_LOG") == "1",
+        # Browsers negotiate permessage-deflate automatically when offered
+        ws_per_message_deflate=True
     )
\ No newline at end of file
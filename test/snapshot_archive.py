@@ -0,0 +1,545 @@
+import os
+import re
+import json
+import base64
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from typing import Dict, Any, List, Optional, Tuple, TextIO
+
+from snapshot_store import SnapshotStore, CHUNK_SIZE
+
+# Full-text index over saved page snapshots
+#
+# One SQLite database (WAL mode, so searches never wait for the indexer) holds a row
+# per snapshot plus an FTS5 table with its title, URL and visible text:
+#
+#   snapshots      id (snapshot time in microseconds), snapshot_id, source, url, title,
+#                  timestamp, html, image
+#   snapshot_text  FTS5(title, url, body), rowid = snapshots.id
+#   sources        byte offset of store/index.jsonl already indexed
+#
+# Two kinds of snapshots are indexed: legacy snapshot_<YYYYmmdd_HHMMSS>.html files in
+# the snapshots directory (a sibling .png is the screenshot) and SnapshotStore entries.
+# Refreshing is incremental: store entries are read from the last indexed offset of
+# index.jsonl, legacy files are re-read only when their mtime changes, and text is
+# extracted once per distinct HTML blob.
+
+log = logging.getLogger("mcp_bridge.archive")
+
+LEGACY_PATTERN = re.compile(r"snapshot_(\d{8}_\d{6})\.html$")
+# Visible text kept per snapshot; pages are rarely searched past their first few hundred KB
+MAX_TEXT_CHARS = 256 * 1024
+# Snapshots indexed per transaction (and per committed index.jsonl offset)
+INDEX_BATCH = 200
+MAX_PAGE_SIZE = 500
+SNIPPET_TOKENS = 16
+# bm25 weights for the title, url and body columns
+RANK_WEIGHTS = (10.0, 4.0, 1.0)
+ORDERS = ("rank", "newest", "oldest")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    snapshot_id TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    url TEXT,
+    title TEXT,
+    timestamp REAL NOT NULL,
+    html TEXT,
+    html_size INTEGER,
+    image TEXT,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS snapshots_html ON snapshots(html);
+CREATE VIRTUAL TABLE IF NOT EXISTS snapshot_text USING fts5(
+    title, url, body, tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+"""
+
+# Elements whose content is not page text
+SKIPPED_TAGS = frozenset(("script", "style", "noscript", "template", "svg", "canvas", "iframe", "object"))
+# Elements that separate words; inline ones (b, a, span...) must not
+BLOCK_TAGS = frozenset((
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "fieldset", "figcaption",
+    "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav",
+    "ol", "option", "p", "pre", "section", "table", "td", "th", "tr", "ul", "button", "input", "label"
+))
+
+class TextExtractor(HTMLParser):
+    """Streaming HTML to (title, canonical URL, visible text) extraction"""
+    def __init__(self, max_chars: int = MAX_TEXT_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.title: Optional[str] = None
+        self.url: Optional[str] = None
+        self._parts: List[str] = []
+        self._chars = 0
+        self._skip = 0
+        self._in_title = False
+        self._title_parts: List[str] = []
+
+    @property
+    def full(self) -> bool:
+        return self._chars >= self.max_chars
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]):
+        if tag in SKIPPED_TAGS:
+            self._skip += 1
+        elif tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag == "link" and self.url is None:
+            values = dict(attrs)
+            if (values.get("rel") or "").lower() == "canonical" and values.get("href"):
+                self.url = values["href"]
+        elif tag == "meta" and self.url is None:
+            values = dict(attrs)
+            if values.get("property") == "og:url" and values.get("content"):
+                self.url = values["content"]
+        elif tag in BLOCK_TAGS:
+            self._parts.append(" ")
+
+    def handle_endtag(self, tag: str):
+        if tag in SKIPPED_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = " ".join("".join(self._title_parts).split())
+        elif tag in BLOCK_TAGS:
+            self._parts.append(" ")
+
+    def handle_data(self, data: str):
+        if self._in_title:
+            self._title_parts.append(data)
+        elif not self._skip and not self.full:
+            self._parts.append(data)
+            self._chars += len(data)
+
+    def close(self):
+        super().close()
+        if self._in_title:
+            # Unterminated <title>: keep what it had
+            self._in_title = False
+            self.title = " ".join("".join(self._title_parts).split())
+
+    @property
+    def text(self) -> str:
+        return " ".join("".join(self._parts).split())[:self.max_chars]
+
+def extract_text(stream: TextIO) -> TextExtractor:
+    """Feed a page through TextExtractor chunk by chunk, stopping once enough text is collected"""
+    extractor = TextExtractor()
+    while not extractor.full:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        extractor.feed(chunk)
+    extractor.close()
+    return extractor
+
+def parse_time(value: Any) -> Optional[float]:
+    """Unix time from a number or an ISO 8601 date/time (naive values are UTC)"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Invalid time: {value!r} (use ISO 8601 or Unix seconds)")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def _time_key(timestamp: float) -> int:
+    """Row id for a snapshot time: Unix microseconds"""
+    return int(timestamp * 1_000_000)
+
+def _encode_cursor(position: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor")
+    return position
+
+def _quote_terms(query: str) -> str:
+    """Plain-words fallback for queries that are not valid FTS5 syntax"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+class SnapshotArchive:
+    """Incremental FTS5 index of the snapshots directory.
+
+    refresh() and search() block; call them from a worker thread. Any number of
+    searches may run concurrently (one SQLite connection per thread); refreshing is
+    serialized and searches never trigger or wait for it, they see what is indexed so far.
+    """
+    def __init__(self, db_path: str, root: str, store: SnapshotStore):
+        self.db_path = db_path
+        self.root = root
+        self.store = store
+        self.size = 0
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+        self._signature: Optional[tuple] = None
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=10.0)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._local.db = db
+        return db
+
+    def close(self):
+        """Stop a running refresh at its next batch boundary"""
+        self._closed = True
+
+    # --- Indexing ---
+
+    def _source_signature(self) -> tuple:
+        # Per legacy file: rewriting one in place leaves the directory's own mtime alone
+        try:
+            legacy = tuple(sorted(
+                (entry.name, st.st_mtime_ns, st.st_size)
+                for entry in os.scandir(self.root) if LEGACY_PATTERN.match(entry.name) and entry.is_file()
+                for st in (entry.stat(),)
+            ))
+        except FileNotFoundError:
+            legacy = None
+        try:
+            st = os.stat(self.store.index_path)
+            store = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            store = None
+        return legacy, store
+
+    def refresh(self) -> int:
+        """Index snapshots added or changed since the last refresh. Returns how many were (re)indexed."""
+        with self._refresh_lock:
+            signature = self._source_signature()
+            if signature == self._signature:
+                return 0
+            db = self._connect()
+            indexed = self._index_legacy(db) + self._index_store(db)
+            self.size = db.execute("SELECT count(*) FROM snapshots").fetchone()[0]
+            if not self._closed:
+                self._signature = signature
+            if indexed:
+                log.info("🗂️  Indexed %d snapshot(s), %d in archive", indexed, self.size)
+            return indexed
+
+    def _put(self, db: sqlite3.Connection, row: Dict[str, Any], body: str):
+        old = db.execute("SELECT id FROM snapshots WHERE snapshot_id = ?", (row["snapshot_id"],)).fetchone()
+        if old is not None:
+            self._delete(db, old["id"])
+        # The row id is the snapshot time in microseconds, moved up past any snapshot taken
+        # in the same microsecond
+        rowid = _time_key(row["timestamp"])
+        while db.execute("SELECT 1 FROM snapshots WHERE id = ?", (rowid,)).fetchone() is not None:
+            rowid += 1
+        db.execute(
+            "INSERT INTO snapshots (id, snapshot_id, source, url, title, timestamp, html, html_size, image, mtime_ns) "
+            "VALUES (:id, :snapshot_id, :source, :url, :title, :timestamp, :html, :html_size, :image, :mtime_ns)",
+            {**row, "id": rowid}
+        )
+        db.execute(
+            "INSERT INTO snapshot_text (rowid, title, url, body) VALUES (?, ?, ?, ?)",
+            (rowid, row["title"] or "", row["url"] or "", body)
+        )
+
+    def _delete(self, db: sqlite3.Connection, rowid: int):
+        db.execute("DELETE FROM snapshot_text WHERE rowid = ?", (rowid,))
+        db.execute("DELETE FROM snapshots WHERE id = ?", (rowid,))
+
+    def _index_legacy(self, db: sqlite3.Connection) -> int:
+        known = {
+            row["snapshot_id"]: (row["id"], row["mtime_ns"])
+            for row in db.execute("SELECT id, snapshot_id, mtime_ns FROM snapshots WHERE source = 'file'")
+        }
+        try:
+            entries = [e for e in os.scandir(self.root) if LEGACY_PATTERN.match(e.name) and e.is_file()]
+        except FileNotFoundError:
+            entries = []
+
+        indexed = 0
+        seen = set()
+        for entry in entries:
+            if self._closed:
+                break
+            snapshot_id = entry.name[:-len(".html")]
+            seen.add(snapshot_id)
+            st = entry.stat()
+            if known.get(snapshot_id, (None, None))[1] == st.st_mtime_ns:
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8", errors="replace") as f:
+                    page = extract_text(f)
+            except OSError as e:
+                log.warning("⚠️  Cannot index %s: %s", entry.name, e)
+                continue
+            try:
+                taken = datetime.strptime(
+                    LEGACY_PATTERN.match(entry.name).group(1), "%Y%m%d_%H%M%S"
+                ).replace(tzinfo=timezone.utc).timestamp()
+            except ValueError:
+                taken = st.st_mtime
+            image = snapshot_id + ".png"
+            self._put(db, {
+                "snapshot_id": snapshot_id,
+                "source": "file",
+                "url": page.url,
+                "title": page.title,
+                "timestamp": taken,
+                "html": entry.name,
+                "html_size": st.st_size,
+                "image": image if os.path.exists(os.path.join(self.root, image)) else None,
+                "mtime_ns": st.st_mtime_ns
+            }, page.text)
+            indexed += 1
+            if indexed % INDEX_BATCH == 0:
+                db.commit()
+
+        if not self._closed:
+            for snapshot_id in known.keys() - seen:
+                self._delete(db, known[snapshot_id][0])
+        db.commit()
+        return indexed
+
+    def _index_store(self, db: sqlite3.Connection) -> int:
+        path = self.store.index_path
+        row = db.execute("SELECT position FROM sources WHERE path = ?", (path,)).fetchone()
+        position = row["position"] if row else 0
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if size < position:
+            # index.jsonl was truncated or replaced: start over
+            log.info("🗂️  %s shrank, re-indexing the store", path)
+            for stale in db.execute("SELECT id FROM snapshots WHERE source = 'store'").fetchall():
+                self._delete(db, stale["id"])
+            position = 0
+        if size == position:
+            db.commit()
+            return 0
+
+        indexed = 0
+        with open(path, "rb") as f:
+            f.seek(position)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # an entry still being appended
+                position += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(entry, dict) or not entry.get("id"):
+                    continue
+                self._index_store_entry(db, entry)
+                indexed += 1
+                if indexed % INDEX_BATCH == 0 or self._closed:
+                    db.execute("INSERT OR REPLACE INTO sources (path, position) VALUES (?, ?)", (path, position))
+                    db.commit()
+                    if self._closed:
+                        break
+        db.execute("INSERT OR REPLACE INTO sources (path, position) VALUES (?, ?)", (path, position))
+        db.commit()
+        return indexed
+
+    def _index_store_entry(self, db: sqlite3.Connection, entry: Dict[str, Any]):
+        digest = entry.get("html")
+        title, url, body = None, None, ""
+        if digest:
+            # Identical pages share one blob: reuse the text extracted for an earlier snapshot
+            known = db.execute(
+                "SELECT t.title, t.url, t.body FROM snapshots s JOIN snapshot_text t ON t.rowid = s.id "
+                "WHERE s.html = ? AND s.source = 'store' LIMIT 1",
+                (digest,)
+            ).fetchone()
+            if known is not None:
+                title, url, body = known["title"] or None, known["url"] or None, known["body"]
+            else:
+                try:
+                    # Pages are not always UTF-8; a bad byte must not stall indexing of everything after it
+                    with self.store.open_html(digest, errors="replace") as f:
+                        page = extract_text(f)
+                    title, url, body = page.title, page.url, page.text
+                except (OSError, EOFError) as e:
+                    log.warning("⚠️  Cannot index snapshot %s: %s", entry["id"], e)
+        try:
+            taken = parse_time(entry.get("timestamp"))
+        except ValueError:
+            taken = None
+        self._put(db, {
+            "snapshot_id": entry["id"],
+            "source": "store",
+            # What the tab reported wins over what the page declares
+            "url": entry.get("url") or url,
+            "title": entry.get("title") or title,
+            "timestamp": taken if taken is not None else 0.0,
+            "html": digest,
+            "html_size": entry.get("html_size"),
+            "image": entry.get("image"),
+            "mtime_ns": None
+        }, body)
+
+    # --- Search ---
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        url: Optional[str] = None,
+        since: Any = None,
+        until: Any = None,
+        order: str = "rank",
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of snapshots matching `query` (FTS5 syntax or plain words) and the filters.
+
+        Returns (hits, next cursor or None). Without a query, "rank" means newest first.
+        """
+        if order not in ORDERS:
+            raise ValueError(f"Invalid order: {order!r} (use {', '.join(ORDERS)})")
+        query = (query or "").strip()
+        if not query and order == "rank":
+            order = "newest"
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        position = _decode_cursor(cursor) if cursor else {}
+        since, until = parse_time(since), parse_time(until)
+
+        db = self._connect()
+        try:
+            rows = self._query(db, query, url, since, until, order, limit + 1, position)
+        except sqlite3.OperationalError:
+            if not query:
+                raise
+            # Not valid FTS5 syntax (e.g. "foo-bar"): search for the words themselves
+            query = _quote_terms(query)
+            rows = self._query(db, query, url, since, until, order, limit + 1, position)
+
+        page = rows[:limit]
+        snippets = self._snippets(db, query, [row["id"] for row in page]) if query else {}
+        hits = [self._hit(row, snippets.get(row["id"])) for row in page]
+        if len(rows) <= limit:
+            return hits, None
+        if order == "rank":
+            following = {"offset": int(position.get("offset", 0)) + limit}
+        else:
+            following = {"id": page[-1]["id"]}
+        return hits, _encode_cursor(following)
+
+    def _query(
+        self,
+        db: sqlite3.Connection,
+        query: str,
+        url: Optional[str],
+        since: Optional[float],
+        until: Optional[float],
+        order: str,
+        limit: int,
+        position: Dict[str, Any]
+    ) -> List[sqlite3.Row]:
+        # Row ids follow snapshot time, so time filters and newest/oldest order are rowid
+        # ranges that FTS5 walks directly; only "rank" has to score every match
+        if query:
+            sql = [
+                "SELECT s.*, bm25(snapshot_text, ?, ?, ?) AS score "
+                "FROM snapshot_text JOIN snapshots s ON s.id = snapshot_text.rowid WHERE snapshot_text MATCH ?"
+            ]
+            params: List[Any] = [*RANK_WEIGHTS, query]
+            rowid = "snapshot_text.rowid"
+        else:
+            sql = ["SELECT s.*, NULL AS score FROM snapshots s WHERE 1"]
+            params = []
+            rowid = "s.id"
+
+        if url:
+            # Globs as in tab selectors; a plain string matches anywhere in the URL
+            sql.append("AND s.url GLOB ?")
+            params.append(url if any(c in url for c in "*?[") else f"*{url}*")
+        if since is not None:
+            sql.append(f"AND {rowid} >= ?")
+            params.append(_time_key(since))
+        if until is not None:
+            sql.append(f"AND {rowid} < ?")
+            params.append(_time_key(until))
+
+        if order == "rank":
+            sql.append("ORDER BY score, s.id LIMIT ? OFFSET ?")
+            params += [limit, int(position.get("offset", 0))]
+        else:
+            descending = order == "newest"
+            if "id" in position:
+                sql.append(f"AND {rowid} {'<' if descending else '>'} ?")
+                params.append(int(position["id"]))
+            sql.append(f"ORDER BY {rowid} {'DESC' if descending else 'ASC'} LIMIT ?")
+            params.append(limit)
+        return db.execute(" ".join(sql), params).fetchall()
+
+    def _snippets(self, db: sqlite3.Connection, query: str, rowids: List[int]) -> Dict[int, str]:
+        # A separate query so snippets are built for the page only, not for every match
+        if not rowids:
+            return {}
+        rows = db.execute(
+            "SELECT rowid, snippet(snapshot_text, 2, '**', '**', ' … ', ?) FROM snapshot_text "
+            f"WHERE snapshot_text MATCH ? AND rowid IN ({', '.join('?' * len(rowids))})",
+            (SNIPPET_TOKENS, query, *rowids)
+        )
+        return dict(rows.fetchall())
+
+    def _hit(self, row: sqlite3.Row, snippet: Optional[str]) -> Dict[str, Any]:
+        hit = {
+            "id": row["snapshot_id"],
+            "url": row["url"],
+            "title": row["title"],
+            "timestamp": datetime.fromtimestamp(row["timestamp"], timezone.utc).isoformat(),
+            "source": row["source"],
+            "html_size": row["html_size"],
+            "has_image": row["image"] is not None
+        }
+        if snippet is not None:
+            hit["snippet"] = snippet
+        if row["score"] is not None:
+            hit["score"] = round(-row["score"], 3)
+        return hit
+
+    def get(self, snapshot_id: str) -> Optional[Dict[str, Any]]:
+        """Where a snapshot's files live: {"html": path, "html_gzip": bool, "image": path or None}"""
+        row = self._connect().execute("SELECT * FROM snapshots WHERE snapshot_id = ?", (snapshot_id,)).fetchone()
+        if row is None:
+            return None
+        if row["source"] == "file":
+            return {
+                "html": os.path.join(self.root, row["html"]),
+                "html_gzip": False,
+                "image": os.path.join(self.root, row["image"]) if row["image"] else None
+            }
+        return {
+            "html": self.store.html_path(row["html"]) if row["html"] else None,
+            "html_gzip": True,
+            "image": self.store.image_path(row["image"]) if row["image"] else None
+        }
@@ -0,0 +1,154 @@
+import os
+import json
+import gzip
+import base64
+import hashlib
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple, BinaryIO, TextIO
+
+# Content-addressed snapshot storage
+#
+#   <root>/objects/<sha[:2]>/<sha>.html.gz   gzip-compressed page HTML
+#   <root>/objects/<sha[:2]>/<sha>.png       screenshot
+#   <root>/index.jsonl                       one line per snapshot taken
+#
+# Blobs are named by the SHA-256 of their uncompressed content, so identical pages
+# across tabs and revisits are written only once; every snapshot still gets its own
+# index entry pointing at the shared blobs.
+
+CHUNK_SIZE = 64 * 1024
+# Base64 is decoded in slices that are a multiple of 4 characters
+B64_SLICE = 4 * 16 * 1024
+
+def iter_file(fileobj: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def iter_text(text: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    for i in range(0, len(text), chunk_size):
+        yield text[i:i + chunk_size].encode("utf-8")
+
+def iter_base64(data: str) -> Iterator[bytes]:
+    """Decode a base64 string (optionally a data: URL) slice by slice, never holding the full decoded copy.
+
+    Whitespace (line-wrapped MIME base64) is skipped; anything else that is not base64
+    raises binascii.Error, a ValueError.
+    """
+    start = data.index(",") + 1 if data.startswith("data:") else 0
+    carry = ""
+    for i in range(start, len(data), B64_SLICE):
+        piece = carry + "".join(data[i:i + B64_SLICE].split())
+        # Decode whole 4-character groups only; the rest waits for the next slice
+        usable = len(piece) - len(piece) % 4
+        carry = piece[usable:]
+        if usable:
+            yield base64.b64decode(piece[:usable], validate=True)
+    if carry:
+        yield base64.b64decode(carry, validate=True)
+
+class SnapshotStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.jsonl")
+        self._lock = threading.Lock()
+
+    def _object_path(self, digest: str, suffix: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest + suffix)
+
+    def put_blob(self, chunks: Iterable[bytes], suffix: str, compress: bool = False) -> Tuple[str, int, bool]:
+        """Stream chunks into the store. Returns (sha256, raw size, newly_written)."""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        sha = hashlib.sha256()
+        size = 0
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw_out:
+                out = gzip.GzipFile(fileobj=raw_out, mode="wb", compresslevel=6, mtime=0) if compress else raw_out
+                try:
+                    for chunk in chunks:
+                        sha.update(chunk)
+                        size += len(chunk)
+                        out.write(chunk)
+                finally:
+                    if compress:
+                        out.close()
+
+            digest = sha.hexdigest()
+            final_path = self._object_path(digest, suffix)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+                return digest, size, False
+
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+            return digest, size, True
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def add(
+        self,
+        html: Optional[Iterable[bytes]],
+        image: Optional[Iterable[bytes]],
+        meta: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Store one snapshot (blocking; run it in a worker thread) and append it to the index.
+
+        Empty parts are ignored; a snapshot with neither HTML nor a screenshot raises ValueError.
+        """
+        entry: Dict[str, Any] = {
+            "id": uuid.uuid4().hex[:12],
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+        entry.update({k: v for k, v in (meta or {}).items() if v is not None})
+
+        stored = {}
+        for kind, chunks, suffix in (("html", html, ".html.gz"), ("image", image, ".png")):
+            if chunks is None:
+                continue
+            digest, size, new = self.put_blob(chunks, suffix, compress=kind == "html")
+            if not size:
+                if new:
+                    os.remove(self._object_path(digest, suffix))
+                continue
+            entry[kind] = digest
+            entry[kind + "_size"] = size
+            stored[kind] = new
+        if not stored:
+            raise ValueError("Empty snapshot: no HTML or screenshot")
+
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+        entry["deduplicated"] = not any(stored.values())
+        return entry
+
+    def open_html(self, digest: str, errors: str = "strict") -> TextIO:
+        return gzip.open(self.html_path(digest), "rt", encoding="utf-8", errors=errors)
+
+    def html_path(self, digest: str) -> str:
+        """Path of the gzip-compressed HTML blob"""
+        return self._object_path(digest, ".html.gz")
+
+    def image_path(self, digest: str) -> str:
+        return self._object_path(digest, ".png")
+
+    def iter_index(self) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
@@ -0,0 +1,70 @@
+import os
+import re
+import json
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from server import ChunkedResult  # noqa: E402
+
+USERSCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ResilientMenu.user.js")
+
+# A payload whose astral characters (surrogate pairs in UTF-16) land on chunk boundaries
+PAYLOAD = {"text": "ab" + "😀𠀀é" * 50, "n": 1}
+
+def utf16_chunks(text: str, size: int):
+    """Cut text the way JavaScript's String.slice does: on UTF-16 code units"""
+    units = text.encode("utf-16-le", "surrogatepass")
+    for i in range(0, len(units), size * 2):
+        yield units[i:i + size * 2].decode("utf-16-le", "surrogatepass")
+
+def reassemble(chunks):
+    chunked = ChunkedResult()
+    try:
+        for seq, chunk in enumerate(chunks):
+            # Each CHUNK frame goes through JSON on its own, lone surrogates included
+            chunked.append(seq, json.loads(json.dumps({"data": chunk}))["data"])
+        return chunked.load(), chunked.size
+    finally:
+        chunked.close()
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_surrogate_pair_split_across_chunks(size):
+    serialized = json.dumps(PAYLOAD, ensure_ascii=False)
+    chunks = list(utf16_chunks(serialized, size))
+    assert any("\ud800" <= c[-1] <= "\udbff" for c in chunks), "no pair straddles a boundary"
+
+    result, size_bytes = reassemble(chunks)
+
+    assert result == PAYLOAD
+    assert size_bytes == len(serialized.encode("utf-8"))
+
+def test_whole_pairs_per_chunk():
+    serialized = json.dumps(PAYLOAD, ensure_ascii=False)
+    chunks = [serialized[i:i + 5] for i in range(0, len(serialized), 5)]
+
+    result, _ = reassemble(chunks)
+
+    assert result == PAYLOAD
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_userscript_chunk_bounds_keep_pairs_together():
+    source = open(USERSCRIPT, encoding="utf-8").read()
+    method = re.search(r"\n        (\*chunkBounds\(text\) \{.*?\n        \})\n", source, re.S).group(1)
+    script = f"""
+        const engine = {{ chunkSize: 3, {method} }};
+        const text = {json.dumps(json.dumps(PAYLOAD, ensure_ascii=False))};
+        const chunks = [...engine.chunkBounds(text)].map(([s, e]) => text.slice(s, e));
+        const lone = chunks.filter(c => /[\\uD800-\\uDBFF]$|^[\\uDC00-\\uDFFF]/.test(c));
+        console.log(JSON.stringify({{ joined: chunks.join('') === text, lone: lone.length, chunks: chunks }}));
+    """
+    out = json.loads(subprocess.run(["node", "-e", script], capture_output=True, text=True, check=True).stdout)
+
+    assert out["joined"] and out["lone"] == 0
+    assert max(len(c.encode("utf-16-le", "surrogatepass")) // 2 for c in out["chunks"]) <= 3
+
+    result, _ = reassemble(out["chunks"])
+    assert result == PAYLOAD
@@ -0,0 +1,111 @@
+import os
+import sys
+import itertools
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dom_mirror import DomMirror, MirrorDesync, UnsupportedSelector  # noqa: E402
+
+_ids = itertools.count(1)
+
+def el(tag, attrs=None, *children):
+    return {"i": next(_ids), "t": tag, "a": attrs or {}, "c": list(children)}
+
+def tx(text):
+    return {"i": next(_ids), "x": text}
+
+def page():
+    return DomMirror.from_init({"gen": 1, "seq": 0, "url": "https://a/", "root": el(
+        "html", {},
+        el("head", {}, el("title", {}, tx("T"))),
+        el("body", {},
+            el("h1", {"id": "top", "class": "title main"}, tx("Hello")),
+            el("ul", {"class": "menu"},
+                el("li", {"data-kind": "link"}, tx("one")),
+                el("li", {"data-kind": "link-external", "lang": "en-US"}, tx("two")),
+                el("li", {"data-kind": "button"}, tx("three")),
+                el("li", {}),
+            ),
+            el("p", {"class": "note"}, tx("after list")),
+            el("div", {}, el("p", {}, tx("nested"))),
+        ),
+    )})
+
+def texts(mirror, selector):
+    return [match["text"] for match in mirror.query(selector, limit=100)["matches"]]
+
+def tags(mirror, selector):
+    return [node.tag for node in mirror.select(selector)]
+
+@pytest.mark.parametrize("selector, expected", [
+    ("li", ["one", "two", "three", ""]),
+    ("ul > li:first-child", ["one"]),
+    ("li:last-child", [""]),
+    ("li:nth-child(2)", ["two"]),
+    ("li:nth-child(odd)", ["one", "three"]),
+    ("li:nth-child(even)", ["two", ""]),
+    ("li:empty", [""]),
+    ("li:not([data-kind])", [""]),
+    ("li:not([data-kind='button'], :first-child)", ["two", ""]),
+    ("[data-kind=link]", ["one"]),
+    ("[data-kind^=link]", ["one", "two"]),
+    ("[data-kind$=ton]", ["three"]),
+    ("[data-kind*=ext]", ["two"]),
+    ("[lang|=en]", ["two"]),
+    ("[DATA-KIND=BUTTON i]", ["three"]),
+    ("li + li + li", ["three", ""]),
+    ("h1 ~ p", ["after list"]),
+    ("body p", ["after list", "nested"]),
+    ("body > p", ["after list"]),
+    ("#top.title.main", ["Hello"]),
+    (".title, .note", ["Hello", "after list"]),
+    ("div:only-child, p:only-child", ["nested"]),
+])
+def test_selectors(selector, expected):
+    assert texts(page(), selector) == expected
+
+def test_document_order_and_root():
+    mirror = page()
+    assert tags(mirror, ":root") == ["html"]
+    assert tags(mirror, "h1, title, p") == ["title", "h1", "p", "p"]
+    assert tags(mirror, "*")[:3] == ["html", "head", "title"]
+    assert len(mirror.select("li", limit=2)) == 2
+
+@pytest.mark.parametrize("selector", [
+    "li:hover", "li::before", "a:nth-child(2n+1)", "> li", "li >", "ul,", "li:has(a)", "p:not(div p)"
+])
+def test_unsupported_selectors_are_refused(selector):
+    with pytest.raises(UnsupportedSelector):
+        page().select(selector)
+
+def test_get_dom_and_text_query():
+    mirror = page()
+    assert mirror.get_dom("h1") == {"html": "Hello", "text": "Hello"}
+    assert mirror.get_dom("table") == {}
+    # Deepest element containing the text only
+    found = mirror.query(text="NESTED")
+    assert found["count"] == 1 and found["matches"][0]["tag"] == "p"
+
+def test_selectors_see_applied_diffs():
+    mirror = page()
+    h1 = mirror.select("h1")[0]
+    ul = mirror.select("ul")[0]
+    first, second = mirror.select("li")[:2]
+
+    assert mirror.apply({"gen": 1, "seq": 1, "ops": [
+        {"o": "a", "i": h1.id, "n": "class", "v": "renamed"},
+        # Keep the second item, drop the rest, append a new one
+        {"o": "c", "i": ul.id, "c": [{"r": second.id}, el("li", {"class": "new"}, tx("four"))]},
+    ]})
+
+    assert texts(mirror, ".title") == []
+    assert texts(mirror, ".renamed") == ["Hello"]
+    assert texts(mirror, "li:first-child") == ["two"]
+    assert texts(mirror, "li.new:last-child") == ["four"]
+    assert first.id not in mirror.index
+
+    with pytest.raises(MirrorDesync):
+        mirror.apply({"gen": 1, "seq": 3, "ops": []})
+    # Diffs of an older generation are ignored
+    assert not mirror.apply({"gen": 0, "seq": 2, "ops": []})
@@ -9,16 +9,127 @@ import json
 import httpx
 import sys
 import re
-from typing import AsyncIterator, Optional
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional
+
+class SSEEvent(NamedTuple):
+    event: str
+    data: str
+    id: Optional[str]
+    retry: Optional[int]
+
+class SSEDecoder:
+    """Incremental text/event-stream decoder (WHATWG HTML "server-sent events" rules).
+
+    Bytes are fed as they arrive; only complete lines are decoded, each byte is
+    scanned once, and the buffer is compacted once per feed, so large events cost
+    linear time. Lines may end in CRLF, LF or CR (also split across chunks);
+    multiple data: lines are joined with "\n"; one space after the colon is dropped.
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pending_cr = False
+        # Length of the buffered partial line already searched for a line ending
+        self._scanned = 0
+        self._bom_checked = False
+        self._event = ""
+        self._data: List[str] = []
+        self._retry: Optional[int] = None
+        self.last_event_id: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        events: List[SSEEvent] = []
+        buf = self._buffer
+        buf += chunk
+        if not self._bom_checked:
+            if len(buf) < 3 and b"\xef\xbb\xbf".startswith(bytes(buf)):
+                return events
+            if buf.startswith(b"\xef\xbb\xbf"):
+                del buf[:3]
+            self._bom_checked = True
+
+        pos = 0
+        size = len(buf)
+        if self._pending_cr and size:
+            if buf[0] == 0x0A:
+                # Second half of a CRLF that was split across chunks
+                pos = 1
+            # Only decided once a byte follows the CR (an empty chunk says nothing)
+            self._pending_cr = False
+        scan = max(pos, self._scanned)
+
+        while pos < size:
+            lf = buf.find(b"\n", scan)
+            cr = buf.find(b"\r", scan, lf if lf != -1 else size)
+            if cr != -1:
+                end, nxt = cr, cr + 1
+                if nxt < size:
+                    if buf[nxt] == 0x0A:
+                        nxt += 1
+                else:
+                    self._pending_cr = True
+            elif lf != -1:
+                end, nxt = lf, lf + 1
+            else:
+                break
+            event = self._line(buf[pos:end].decode("utf-8", errors="replace"))
+            if event is not None:
+                events.append(event)
+            pos = scan = nxt
+
+        del buf[:pos]
+        self._scanned = len(buf)
+        return events
+
+    def _line(self, line: str) -> Optional[SSEEvent]:
+        if not line:
+            return self._dispatch()
+        if line[0] == ":":
+            return None  # comment / keep-alive
+
+        field, sep, value = line.partition(":")
+        if sep and value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            self._data.append(value)
+        elif field == "event":
+            self._event = value
+        elif field == "id":
+            if "\0" not in value:
+                self.last_event_id = value
+        elif field == "retry":
+            if value.isdigit():
+                self._retry = int(value)
+        return None
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        event = None
+        if self._data:
+            event = SSEEvent(self._event or "message", "\n".join(self._data), self.last_event_id, self._retry)
+        self._event = ""
+        self._data = []
+        self._retry = None
+        return event
 
 class MCPDiagnosticClient:
-    def __init__(self, base_url: str = "http://127.0.0.1:8080"):
+    def __init__(self, base_url: str = "http://127.0.0.1:8080", verbose: bool = True):
         self.base_url = base_url
-        self.client = httpx.AsyncClient(timeout=60.0)
+        self.verbose = verbose
+        self.client = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=100)
+        )
         self.message_id = 0
         self.session_id: Optional[str] = None
+        self.session_ready = asyncio.Event()
+        # In-flight requests by JSON-RPC id; responses resolve them straight from the SSE stream
+        self.pending: Dict[int, asyncio.Future] = {}
+        # Everything else the server sends (notifications, server-initiated requests)
         self.responses = asyncio.Queue()
         
+    def log(self, message: str):
+        if self.verbose:
+            print(message)
+        
     async def __aenter__(self):
         return self
         
@@ -29,12 +140,22 @@ class MCPDiagnosticClient:
         self.message_id += 1
         return self.message_id
     
-    async def send_jsonrpc(self, method: str, params: dict = None) -> dict:
-        """Send a JSON-RPC request to /messages with proper session_id"""
+    async def wait_for_session(self, timeout: float = 5.0) -> bool:
+        try:
+            await asyncio.wait_for(self.session_ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def send_jsonrpc(self, method: str, params: dict = None, timeout: float = 10.0) -> dict:
+        """Send a JSON-RPC request to /messages with proper session_id.
+
+        Safe to call concurrently: each request waits on its own Future, resolved by
+        the SSE listener when a response with the same id arrives.
+        """
         if not self.session_id:
-            print("   ⚠️  No session_id yet, waiting for SSE connection...")
-            await asyncio.sleep(1)
-            if not self.session_id:
+            self.log("   ⚠️  No session_id yet, waiting for SSE connection...")
+            if not await self.wait_for_session(1.0):
                 return {"error": "No session established"}
         
         request_id = self.next_id()
@@ -46,37 +167,58 @@ class MCPDiagnosticClient:
             "params": params or {}
         }
         
-        print(f"\n📤 Sending: {method} (id={request_id})")
-        print(f"   Session ID: {self.session_id}")
-        print(f"   Payload: {json.dumps(payload, indent=2)}")
+        self.log(f"\n📤 Sending: {method} (id={request_id})")
+        self.log(f"   Session ID: {self.session_id}")
+        self.log(f"   Payload: {json.dumps(payload, indent=2)}")
         
-        # CRITICAL: Include session_id in the endpoint URL as per MCP SSE spec
-        response = await self.client.post(
-            f"{self.base_url}/messages?session_id={self.session_id}",
-            json=payload,
-            headers={"Content-Type": "application/json"}
-        )
-        
-        print(f"   Response Status: {response.status_code}")
-        
-        if response.status_code == 202:
-            print("   ✅ Message accepted, waiting for SSE response...")
+        # Registered before the POST so a fast response can never be missed
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            # CRITICAL: Include session_id in the endpoint URL as per MCP SSE spec
+            response = await self.client.post(
+                f"{self.base_url}/messages?session_id={self.session_id}",
+                json=payload,
+                headers={"Content-Type": "application/json"}
+            )
             
-            # Wait for response from SSE stream
+            self.log(f"   Response Status: {response.status_code}")
+            
+            if response.status_code != 202:
+                self.log(f"   ❌ Unexpected status: {response.text}")
+                return {"error": response.text}
+
+            self.log("   ✅ Message accepted, waiting for SSE response...")
             try:
-                result = await asyncio.wait_for(self.responses.get(), timeout=10.0)
-                if result.get("id") == request_id:
-                    print(f"   ✅ Got matching response!")
-                    return result
-                else:
-                    print(f"   ⚠️  Response ID mismatch: expected {request_id}, got {result.get('id')}")
-                    return result
+                result = await asyncio.wait_for(future, timeout=timeout)
+                self.log(f"   ✅ Got matching response!")
+                return result
             except asyncio.TimeoutError:
-                print("   ⏱️  Timeout waiting for response")
+                self.log("   ⏱️  Timeout waiting for response")
                 return {"error": "timeout"}
-        else:
-            print(f"   ❌ Unexpected status: {response.text}")
-            return {"error": response.text}
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def notify(self, method: str, params: dict = None):
+        """Send a JSON-RPC notification (no id, no response)"""
+        await self.client.post(
+            f"{self.base_url}/messages?session_id={self.session_id}",
+            json={"jsonrpc": "2.0", "method": method, "params": params or {}},
+            headers={"Content-Type": "application/json"}
+        )
+
+    async def call_tool(self, name: str, arguments: dict = None, timeout: float = 30.0) -> dict:
+        return await self.send_jsonrpc("tools/call", {"name": name, "arguments": arguments or {}}, timeout=timeout)
+
+    def route(self, data: dict) -> bool:
+        """Resolve the Future of the request this message answers; False if it answers none"""
+        if not isinstance(data, dict) or "method" in data:
+            return False
+        future = self.pending.get(data.get("id"))
+        if future is None or future.done():
+            return False
+        future.set_result(data)
+        return True
     
     async def listen_sse(self) -> AsyncIterator[dict]:
         """Listen to SSE stream and yield messages"""
@@ -99,53 +241,37 @@ class MCPDiagnosticClient:
             
             print("   ✅ SSE stream connected, listening for events...")
             
-            buffer = ""
-            async for chunk in response.aiter_text():
-                buffer += chunk
-                
-                # Process complete SSE messages
-                while "\n\n" in buffer:
-                    message, buffer = buffer.split("\n\n", 1)
-                    
-                    if not message.strip():
-                        continue
-                    
-                    # Parse SSE event
-                    event_type = None
-                    event_data = ""
-                    event_id = None
-                    
-                    for line in message.split("\n"):
-                        if line.startswith("event:"):
-                            event_type = line[6:].strip()
-                        elif line.startswith("data:"):
-                            event_data += line[5:].strip()
-                        elif line.startswith("id:"):
-                            event_id = line[3:].strip()
-                    
+            decoder = SSEDecoder()
+            async for chunk in response.aiter_bytes():
+                for event in decoder.feed(chunk):
                     # Extract session_id from first message (endpoint event)
-                    if event_type == "endpoint" and not self.session_id:
+                    if event.event == "endpoint":
                         # SSE sends endpoint URL with session_id
-                        match = re.search(r'session_id=([a-f0-9-]+)', event_data)
-                        if match:
+                        match = re.search(r'session_id=([a-f0-9-]+)', event.data)
+                        if match and not self.session_id:
                             self.session_id = match.group(1)
-                            print(f"\n🔑 Extracted session_id: {self.session_id}")
+                            self.session_ready.set()
+                            self.log(f"\n🔑 Extracted session_id: {self.session_id}")
+                        continue
                     
-                    if event_data:
-                        try:
-                            data = json.loads(event_data)
-                            print(f"\n📥 SSE Event Received:")
-                            print(f"   Type: {event_type or 'message'}")
-                            print(f"   Event ID: {event_id or 'none'}")
-                            print(f"   Data: {json.dumps(data, indent=2)}")
-                            
-                            # Put response in queue for send_jsonrpc
-                            await self.responses.put(data)
-                            
-                            yield data
-                        except json.JSONDecodeError as e:
-                            print(f"   ⚠️  Failed to parse JSON: {e}")
-                            print(f"   Raw data: {event_data}")
+                    try:
+                        data = json.loads(event.data)
+                    except json.JSONDecodeError as e:
+                        self.log(f"   ⚠️  Failed to parse JSON: {e}")
+                        self.log(f"   Raw data: {event.data[:200]}")
+                        continue
+
+                    if self.verbose:
+                        print(f"\n📥 SSE Event Received:")
+                        print(f"   Type: {event.event}")
+                        print(f"   Event ID: {event.id or 'none'}")
+                        print(f"   Data: {json.dumps(data, indent=2)}")
+                    
+                    # Responses go to the waiting request; anything else is queued
+                    if not self.route(data):
+                        await self.responses.put(data)
+                    
+                    yield data
     
     async def test_full_cycle(self):
         """Test the complete MCP cycle: connect → initialize → call tool"""
@@ -157,12 +283,7 @@ class MCPDiagnosticClient:
         sse_task = asyncio.create_task(self._sse_listener())
         
         # Wait for session_id to be extracted
-        for i in range(10):
-            if self.session_id:
-                break
-            await asyncio.sleep(0.5)
-        
-        if not self.session_id:
+        if not await self.wait_for_session(5.0):
             print("\n❌ Failed to establish SSE session")
             sse_task.cancel()
             return
@@ -180,8 +301,7 @@ class MCPDiagnosticClient:
             }
         })
         print(f"Initialize result: {json.dumps(result, indent=2)}")
-        
-        await asyncio.sleep(1)
+        await self.notify("notifications/initialized")
         
         # Step 3: List tools
         print("\n" + "=" * 70)
@@ -195,8 +315,6 @@ class MCPDiagnosticClient:
             for tool in tools:
                 print(f"   - {tool.get('name')}: {tool.get('description')}")
         
-        await asyncio.sleep(1)
-        
         # Step 4: Call list_tabs
         print("\n" + "=" * 70)
         print("STEP 3: Call list_tabs Tool")
@@ -212,9 +330,18 @@ class MCPDiagnosticClient:
             for item in content:
                 if item.get("type") == "text":
                     print(f"{item.get('text')}")
-        
-        # Wait a bit for any remaining messages
-        await asyncio.sleep(2)
+
+        # Step 5: Many requests in flight on one session, matched by id
+        print("\n" + "=" * 70)
+        print("STEP 4: 20 Concurrent list_tabs Calls")
+        print("=" * 70)
+        verbose, self.verbose = self.verbose, False
+        started = asyncio.get_running_loop().time()
+        results = await asyncio.gather(*(self.call_tool("list_tabs") for _ in range(20)))
+        elapsed = asyncio.get_running_loop().time() - started
+        self.verbose = verbose
+        answered = sum(1 for r in results if "result" in r)
+        print(f"\n✅ {answered}/20 answered in {elapsed * 1000:.0f} ms")
         
         # Cancel SSE listener
         sse_task.cancel()
@@ -0,0 +1,70 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from metrics import Registry  # noqa: E402
+
+def samples(text):
+    return [line for line in text.splitlines() if not line.startswith("#")]
+
+def test_counter_and_gauge():
+    registry = Registry()
+    calls = registry.counter("calls_total", "Tool calls", ("tool", "outcome"))
+    sessions = registry.gauge("sessions", "Open sessions")
+    calls.inc(tool="click", outcome="ok")
+    calls.inc(2, tool="click", outcome="ok")
+    calls.inc(tool="scroll", outcome="error")
+    sessions.inc()
+    sessions.inc()
+    sessions.dec()
+
+    assert registry.render() == (
+        "# HELP calls_total Tool calls\n"
+        "# TYPE calls_total counter\n"
+        'calls_total{tool="click",outcome="ok"} 3\n'
+        'calls_total{tool="scroll",outcome="error"} 1\n'
+        "# HELP sessions Open sessions\n"
+        "# TYPE sessions gauge\n"
+        "sessions 1\n"
+    )
+
+def test_unlabelled_series_start_at_zero():
+    registry = Registry()
+    registry.counter("resyncs_total", "Resyncs")
+    registry.counter("by_tab_total", "Per tab", ("tab",))
+
+    assert samples(registry.render()) == ["resyncs_total 0"]
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", ("tool",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, tool="click")
+
+    assert samples(registry.render()) == [
+        'latency_seconds_bucket{tool="click",le="0.1"} 1',
+        'latency_seconds_bucket{tool="click",le="1"} 3',
+        'latency_seconds_bucket{tool="click",le="+Inf"} 4',
+        'latency_seconds_sum{tool="click"} 4.05',
+        'latency_seconds_count{tool="click"} 4',
+    ]
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("hits_total", "Hits", ("url",)).inc(url='a"b\\c\nd')
+
+    assert samples(registry.render()) == ['hits_total{url="a\\"b\\\\c\\nd"} 1']
+
+def test_forget_and_collectors():
+    registry = Registry()
+    inflight = registry.gauge("inflight", "In flight", ("tab",))
+    queued = registry.histogram("wait_seconds", "Wait", ("tab",), buckets=(1.0,))
+    inflight.set(2, tab="a")
+    inflight.set(1, tab="b")
+    queued.observe(0.5, tab="a")
+    registry.forget("tab", "a")
+
+    assert samples(registry.render()) == ['inflight{tab="b"} 1']
+
+    registry.add_collector(lambda: inflight.set(7, tab="b"))
+    assert samples(registry.render()) == ['inflight{tab="b"} 7']
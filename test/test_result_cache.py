@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from server import ResultCache  # noqa: E402
+
+def test_hit_until_ttl_expires(monkeypatch):
+    cache = ResultCache()
+    key = ResultCache.key("tab", "getCookies", {"b": 1, "a": 2})
+    now = time.monotonic()
+    cache.put(key, {"cookies": "x=1"}, 5.0, cache.generation("tab"))
+
+    # Parameter order does not matter
+    assert cache.get(ResultCache.key("tab", "getCookies", {"a": 2, "b": 1})) == (True, {"cookies": "x=1"})
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 6.0)
+    assert cache.get(key) == (False, None)
+    assert cache.size == 0
+
+def test_invalidate_drops_only_that_tab():
+    cache = ResultCache()
+    mine = ResultCache.key("a", "getCookies", {})
+    other = ResultCache.key("b", "getCookies", {})
+    cache.put(mine, 1, 60, cache.generation("a"))
+    cache.put(other, 2, 60, cache.generation("b"))
+
+    cache.invalidate("a")
+
+    assert cache.get(mine) == (False, None)
+    assert cache.get(other) == (True, 2)
+    assert cache.generation("a") == 1 and cache.generation("b") == 0
+
+def test_result_from_before_an_invalidation_is_not_stored():
+    cache = ResultCache()
+    key = ResultCache.key("tab", "getCookies", {})
+    # Read starts, then a navigation invalidates the tab before the reply arrives
+    started = cache.generation("tab")
+    cache.invalidate("tab")
+    cache.put(key, {"cookies": "stale"}, 60, started)
+
+    assert cache.get(key) == (False, None)
+
+    cache.put(key, {"cookies": "fresh"}, 60, cache.generation("tab"))
+    assert cache.get(key) == (True, {"cookies": "fresh"})
+
+def test_errors_are_not_cached():
+    cache = ResultCache()
+    key = ResultCache.key("tab", "getCookies", {})
+    cache.put(key, {"error": "boom"}, 60, 0)
+
+    assert cache.get(key) == (False, None)
+
+def test_bounded_in_bytes_least_recently_used_first():
+    cache = ResultCache(max_bytes=400)
+    keys = [ResultCache.key("tab", "t", {"n": n}) for n in range(5)]
+    for key in keys[:4]:
+        cache.put(key, "x" * 90, 60, 0)
+    cache.get(keys[0])
+    cache.put(keys[4], "x" * 90, 60, 0)
+
+    assert cache.size <= 400
+    assert cache.get(keys[1]) == (False, None)
+    assert all(cache.get(k)[0] for k in (keys[0], keys[2], keys[3], keys[4]))
+    # Too big to be worth caching at all
+    cache.put(ResultCache.key("tab", "t", {"big": 1}), "x" * 200, 60, 0)
+    assert cache.get(ResultCache.key("tab", "t", {"big": 1})) == (False, None)
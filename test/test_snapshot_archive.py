@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from snapshot_store import SnapshotStore, iter_text  # noqa: E402
+from snapshot_archive import SnapshotArchive  # noqa: E402
+
+@pytest.fixture
+def archive(tmp_path):
+    store = SnapshotStore(str(tmp_path / "store"))
+    return SnapshotArchive(str(tmp_path / "store" / "archive.sqlite3"), str(tmp_path), store)
+
+def add(archive, html, day, **meta):
+    return archive.store.add(iter_text(html), None, {"timestamp": f"2026-03-{day:02d}T12:00:00+00:00", **meta})
+
+def ids(hits):
+    return [hit["id"] for hit in hits]
+
+def test_refresh_is_incremental(archive):
+    first = add(archive, "<title>Alpha</title><p>apples</p>", 1)
+    assert archive.refresh() == 1
+    assert archive.refresh() == 0
+
+    second = add(archive, "<title>Beta</title><p>bananas</p>", 2)
+    assert archive.refresh() == 1
+    assert archive.size == 2
+    assert ids(archive.search("apples")[0]) == [first["id"]]
+    assert ids(archive.search("bananas")[0]) == [second["id"]]
+
+def test_visible_text_only(archive):
+    add(archive, "<title>Page</title><script>var hidden = 'zzsecret'</script><p>shown</p><b>W</b>ord", 1)
+    archive.refresh()
+
+    assert archive.search("zzsecret")[0] == []
+    assert archive.search("shown")[0][0]["title"] == "Page"
+    # Inline tags do not split words
+    assert len(archive.search("Word")[0]) == 1
+
+def test_rank_prefers_title_matches_and_snippets(archive):
+    body = add(archive, "<title>Other</title><p>mention of kiwi in the body</p>", 1)
+    title = add(archive, "<title>Kiwi</title><p>nothing here</p>", 2)
+    archive.refresh()
+
+    hits, cursor = archive.search("kiwi")
+    assert ids(hits) == [title["id"], body["id"]] and cursor is None
+    assert "**kiwi**" in hits[1]["snippet"]
+
+def test_newest_order_filters_and_cursor(archive):
+    entries = [add(archive, f"<p>fruit number{day}</p>", day, url=f"https://shop{day % 2}.example/") for day in range(1, 8)]
+    archive.refresh()
+
+    seen, cursor = [], None
+    while True:
+        hits, cursor = archive.search("fruit", order="newest", limit=3, cursor=cursor)
+        seen += ids(hits)
+        if cursor is None:
+            break
+    assert seen == ids(reversed(entries))
+
+    hits, _ = archive.search("fruit", order="oldest", since="2026-03-03", until="2026-03-05")
+    assert ids(hits) == [entries[2]["id"], entries[3]["id"]]
+    hits, _ = archive.search(None, url="shop0", limit=50)
+    assert ids(hits) == [entries[5]["id"], entries[3]["id"], entries[1]["id"]]
+
+def test_invalid_fts_syntax_falls_back_to_words(archive):
+    add(archive, "<p>foo-bar baz</p>", 1)
+    archive.refresh()
+
+    assert len(archive.search("foo-bar")[0]) == 1
+    assert archive.search('"unterminated')[0] == []
+    with pytest.raises(ValueError):
+        archive.search("foo", order="sideways")
+    with pytest.raises(ValueError):
+        archive.search("foo", since="yesterday")
+
+def test_identical_pages_share_extracted_text(archive):
+    first = add(archive, "<title>Same</title><p>shared words</p>", 1, url="https://a/")
+    second = add(archive, "<title>Same</title><p>shared words</p>", 2, url="https://b/")
+    archive.refresh()
+
+    hits, _ = archive.search("shared", order="oldest")
+    assert ids(hits) == [first["id"], second["id"]]
+    assert [hit["url"] for hit in hits] == ["https://a/", "https://b/"]
+
+def test_html_that_is_not_utf8_does_not_block_indexing(archive):
+    archive.store.add(["<title>café</title>".encode("latin-1")], None)
+    archive.refresh()
+    good = add(archive, "<title>good</title>", 2)
+    archive.refresh()
+
+    assert ids(archive.search("good")[0]) == [good["id"]]
+    assert archive.size == 2
+
+def test_legacy_files(archive, tmp_path):
+    page = tmp_path / "snapshot_20260105_193945.html"
+    page.write_text("<title>Legacy</title><p>oldword</p>", encoding="utf-8")
+    (tmp_path / "snapshot_20260105_193945.png").write_bytes(b"png")
+    archive.refresh()
+
+    hit = archive.search("oldword")[0][0]
+    # The name's time is UTC
+    assert hit["timestamp"] == "2026-01-05T19:39:45+00:00"
+    assert hit["source"] == "file" and hit["has_image"]
+    assert archive.get(hit["id"])["html"] == str(page)
+
+    # Rewritten in place: the directory's mtime does not change, the file's does
+    time.sleep(0.01)
+    page.write_text("<title>Legacy</title><p>newword</p>", encoding="utf-8")
+    assert archive.refresh() == 1
+    assert archive.search("oldword")[0] == []
+    assert len(archive.search("newword")[0]) == 1
+
+    page.unlink()
+    archive.refresh()
+    assert archive.size == 0
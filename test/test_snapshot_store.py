@@ -0,0 +1,67 @@
+import os
+import sys
+import base64
+import binascii
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from snapshot_store import SnapshotStore, iter_base64, iter_text, B64_SLICE  # noqa: E402
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 700
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / "store"))
+
+def blobs(store):
+    return sorted(
+        name for _, _, files in os.walk(store.objects_dir) for name in files
+    )
+
+def test_identical_pages_share_one_blob(store):
+    first = store.add(iter_text("<p>same</p>"), [PNG], {"url": "https://a/"})
+    second = store.add(iter_text("<p>same</p>"), [PNG], {"url": "https://b/"})
+
+    assert not first["deduplicated"] and second["deduplicated"]
+    assert first["html"] == second["html"] and first["image"] == second["image"]
+    assert first["id"] != second["id"]
+    assert len(blobs(store)) == 2
+    assert [e["url"] for e in store.iter_index()] == ["https://a/", "https://b/"]
+    with store.open_html(first["html"]) as f:
+        assert f.read() == "<p>same</p>"
+
+def test_different_pages_are_stored_separately(store):
+    first = store.add(iter_text("<p>one</p>"), None)
+    second = store.add(iter_text("<p>two</p>"), None)
+
+    assert first["html"] != second["html"]
+    assert not second["deduplicated"]
+    assert len(blobs(store)) == 2
+
+def test_empty_snapshot_is_rejected(store):
+    with pytest.raises(ValueError):
+        store.add(None, None)
+    with pytest.raises(ValueError):
+        store.add(iter_text(""), [b""])
+
+    assert blobs(store) == []
+    assert list(store.iter_index()) == []
+
+def test_empty_part_is_left_out(store):
+    entry = store.add(iter_text(""), [PNG])
+
+    assert "html" not in entry and entry["image_size"] == len(PNG)
+
+@pytest.mark.parametrize("wrap", [None, 76, 64])
+def test_base64_data_url_decodes_across_slices(wrap):
+    encoded = base64.b64encode(PNG).decode()
+    assert len(encoded) > 2 * B64_SLICE
+    if wrap:
+        encoded = "\r\n".join(encoded[i:i + wrap] for i in range(0, len(encoded), wrap))
+
+    assert b"".join(iter_base64("data:image/png;base64," + encoded)) == PNG
+
+def test_base64_rejects_garbage():
+    with pytest.raises(binascii.Error):
+        b"".join(iter_base64("data:image/png;base64,@@@@"))
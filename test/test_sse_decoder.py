@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from test_mcp_client import SSEDecoder, SSEEvent  # noqa: E402
+
+STREAM = (
+    b"\xef\xbb\xbf: keep-alive\r\n"
+    b"event: endpoint\r\n"
+    b"data: /messages?session_id=abc\r\n"
+    b"\r\n"
+    b"id: 7\n"
+    b"retry: 1500\n"
+    b"data: {\"a\":\n"
+    b"data:1}\n"
+    b"\n"
+    b"data: last\r"
+    b"\r"
+)
+
+EXPECTED = [
+    SSEEvent("endpoint", "/messages?session_id=abc", None, None),
+    SSEEvent("message", '{"a":\n1}', "7", 1500),
+    SSEEvent("message", "last", "7", None),
+]
+
+def feed_all(chunks):
+    decoder = SSEDecoder()
+    events = []
+    for chunk in chunks:
+        events.extend(decoder.feed(chunk))
+    return events
+
+def test_whole_stream():
+    assert feed_all([STREAM]) == EXPECTED
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8])
+def test_any_chunking(size):
+    assert feed_all([STREAM[i:i + size] for i in range(0, len(STREAM), size)]) == EXPECTED
+
+@pytest.mark.parametrize("ending", [b"\n", b"\r", b"\r\n"])
+def test_line_endings(ending):
+    assert feed_all([b"data: x" + ending + ending]) == [SSEEvent("message", "x", None, None)]
+
+def test_crlf_split_across_chunks_is_one_line_ending():
+    # A lone "\n" after the CR would otherwise be an empty line, dispatching early
+    assert feed_all([b"data: a\r", b"\ndata: b\r", b"\n\r\n"]) == [SSEEvent("message", "a\nb", None, None)]
+
+def test_empty_chunk_keeps_pending_cr():
+    assert feed_all([b"data: a\r", b"", b"\ndata: b\n\n"]) == [SSEEvent("message", "a\nb", None, None)]
+
+def test_cr_then_other_line():
+    assert feed_all([b"data: a\r", b"data: b\n\n"]) == [SSEEvent("message", "a\nb", None, None)]
+
+def test_partial_line_waits_for_its_ending():
+    decoder = SSEDecoder()
+    assert decoder.feed(b"data: hel") == []
+    assert decoder.feed(b"lo\n") == []
+    assert decoder.feed(b"\n") == [SSEEvent("message", "hello", None, None)]
+
+def test_events_without_data_are_not_dispatched():
+    assert feed_all([b"event: ping\n\n: comment\n\n"]) == []
+
+def test_multibyte_character_split_across_chunks():
+    data = "data: привет 😀\n\n".encode("utf-8")
+    assert feed_all([data[i:i + 1] for i in range(len(data))]) == [SSEEvent("message", "привет 😀", None, None)]
@@ -0,0 +1,88 @@
+import os
+import sys
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from server import TabScheduler, TabBusyError  # noqa: E402
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_sessions_are_served_round_robin():
+    async def scenario():
+        scheduler = TabScheduler(max_inflight=1, max_queue=16)
+        await scheduler.acquire("hog")
+        order = []
+
+        async def call(session, n):
+            await scheduler.acquire(session)
+            order.append(f"{session}{n}")
+            scheduler.release()
+
+        # One chatty session queues first, two others one call each after it
+        tasks = [asyncio.create_task(call("hog", n)) for n in range(4)]
+        await settle()
+        tasks += [asyncio.create_task(call("a", 0)), asyncio.create_task(call("b", 0))]
+        await settle()
+        assert scheduler.queued == 6
+
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order, scheduler
+
+    order, scheduler = asyncio.run(scenario())
+    assert order == ["hog0", "a0", "b0", "hog1", "hog2", "hog3"]
+    assert scheduler.inflight == 0 and scheduler.queued == 0
+
+def test_inflight_limit_and_full_queue():
+    async def scenario():
+        scheduler = TabScheduler(max_inflight=2, max_queue=1)
+        await scheduler.acquire("s")
+        await scheduler.acquire("s")
+        waiter = asyncio.create_task(scheduler.acquire("s"))
+        await settle()
+        assert scheduler.inflight == 2 and scheduler.queued == 1 and not waiter.done()
+
+        with pytest.raises(TabBusyError):
+            await scheduler.acquire("t")
+
+        scheduler.release()
+        await waiter
+        # The slot was handed over, not freed
+        assert scheduler.inflight == 2 and scheduler.queued == 0
+
+    asyncio.run(scenario())
+
+def test_timed_out_waiter_gives_up_its_place():
+    async def scenario():
+        scheduler = TabScheduler(max_inflight=1, max_queue=4)
+        await scheduler.acquire("a")
+        with pytest.raises(asyncio.TimeoutError):
+            await scheduler.acquire("b", timeout=0.01)
+        assert scheduler.queued == 0
+
+        scheduler.release()
+        assert scheduler.inflight == 0
+        # Free slot, empty queue: no waiting
+        await asyncio.wait_for(scheduler.acquire("b"), 0.1)
+
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_is_skipped():
+    async def scenario():
+        scheduler = TabScheduler(max_inflight=1, max_queue=4)
+        await scheduler.acquire("a")
+        gone = asyncio.create_task(scheduler.acquire("b"))
+        stays = asyncio.create_task(scheduler.acquire("c"))
+        await settle()
+        gone.cancel()
+        await settle()
+
+        scheduler.release()
+        await asyncio.wait_for(stays, 0.1)
+        assert scheduler.inflight == 1 and scheduler.queued == 0
+
+    asyncio.run(scenario())
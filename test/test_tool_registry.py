@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from server import ToolRegistry, BUILTIN_TOOLS  # noqa: E402
+
+CLICK = {"name": "click", "description": "Click", "parameters": {"type": "object", "properties": {}}}
+SCROLL = {"name": "scroll", "description": "Scroll", "timeout": 5, "cache": {"ttl": 2}}
+
+def write(path, definitions):
+    path.write_text(json.dumps(definitions), encoding="utf-8")
+
+@pytest.fixture
+def tools_path(tmp_path):
+    path = tmp_path / "tools.json"
+    write(path, [CLICK, SCROLL])
+    return path
+
+def test_reload_parses_once_per_content(tools_path):
+    registry = ToolRegistry(str(tools_path))
+
+    assert registry.reload()
+    version = registry.version
+    assert [t.name for t in registry.tools][len(BUILTIN_TOOLS):] == ["click", "scroll"]
+
+    # Same bytes, even rewritten: nothing to do
+    assert not registry.reload()
+    write(tools_path, [CLICK, SCROLL])
+    assert not registry.reload()
+    assert registry.version == version
+
+def test_version_follows_content(tools_path):
+    registry = ToolRegistry(str(tools_path))
+    registry.reload()
+    first = registry.version
+
+    write(tools_path, [CLICK])
+    assert registry.reload()
+    assert registry.version != first
+    assert json.loads(registry.manifest) == {"type": "TOOLS_MANIFEST", "version": registry.version, "tools": [CLICK]}
+
+    write(tools_path, [CLICK, SCROLL])
+    assert registry.reload()
+    assert registry.version == first
+
+def test_tool_options(tools_path):
+    registry = ToolRegistry(str(tools_path))
+    registry.reload()
+
+    assert registry.timeouts == {"scroll": 5.0}
+    assert registry.cache_ttls["scroll"] == 2.0 and "click" not in registry.cache_ttls
+    schema = next(t for t in registry.tools if t.name == "click").inputSchema
+    assert {"tab_id", "deadline"} <= set(schema["properties"])
+    # The definition itself is left as written
+    assert "tab_id" not in CLICK["parameters"]["properties"]
+
+def test_missing_file_keeps_last_tools(tools_path):
+    registry = ToolRegistry(str(tools_path))
+    registry.reload()
+    version = registry.version
+
+    os.remove(tools_path)
+    assert not registry.reload()
+    assert registry.version == version
+
+# --- Manifest deltas ---
+
+def test_delta_from_previous_version(tools_path):
+    registry = ToolRegistry(str(tools_path))
+    registry.reload()
+    old_version = registry.version
+
+    changed = {**CLICK, "description": "Click harder"}
+    added = {"name": "type", "description": "Type"}
+    write(tools_path, [changed, added])
+    registry.reload()
+
+    upsert, remove = registry.delta(registry.fingerprints_for(old_version))
+    assert sorted(t["name"] for t in upsert) == ["click", "type"]
+    assert remove == ["scroll"]
+
+def test_delta_up_to_date(tools_path):
+    registry = ToolRegistry(str(tools_path))
+    registry.reload()
+
+    assert registry.delta(dict(registry.fingerprints)) == ([], [])
+    # A tab that knows nothing gets everything
+    assert len(registry.delta({})[0]) == 2
+
+def test_fingerprint_tracks_declared_version_and_definition():
+    assert ToolRegistry.fingerprint(CLICK) == ToolRegistry.fingerprint(json.loads(json.dumps(CLICK)))
+    assert ToolRegistry.fingerprint(CLICK).startswith("0:")
+    assert ToolRegistry.fingerprint({**CLICK, "version": "2"}).startswith("2:")
+    assert ToolRegistry.fingerprint(CLICK) != ToolRegistry.fingerprint({**CLICK, "description": "x"})
+
+def test_unknown_version_has_no_fingerprints(tools_path, monkeypatch):
+    registry = ToolRegistry(str(tools_path))
+    registry.reload()
+
+    assert registry.fingerprints_for(None) is None
+    assert registry.fingerprints_for("not-a-version") is None
+
+    # Only the most recent versions are remembered
+    monkeypatch.setattr("server.TOOLS_HISTORY_SIZE", 2)
+    first = registry.version
+    for i in range(2):
+        write(tools_path, [{**CLICK, "description": str(i)}])
+        registry.reload()
+    assert registry.fingerprints_for(first) is None
+    assert registry.fingerprints_for(registry.version) == registry.fingerprints
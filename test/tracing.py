@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import random
+import secrets
+import asyncio
+import logging
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+# OpenTelemetry-compatible request tracing
+#
+# Finished spans are exported as OTLP/JSON ExportTraceServiceRequest documents, one per
+# line (the format the OpenTelemetry Collector's file exporter writes and its otlpjson
+# receiver reads), to a local file and/or POSTed to an OTLP/HTTP endpoint such as
+# http://localhost:4318/v1/traces. No OpenTelemetry SDK is needed.
+#
+# Within a task the current span lives in a ContextVar (tasks started inside a span
+# inherit it); across tasks, workers and from MCP clients it travels as a W3C
+# `traceparent` string ("00-<trace id>-<span id>-<flags>").
+
+log = logging.getLogger("mcp_bridge.tracing")
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+EXPORT_QUEUE_SIZE = 10000
+EXPORT_BATCH = 512
+EXPORT_INTERVAL = 1.0
+
+Attributes = Dict[str, Any]
+
+def _attributes(attributes: Attributes) -> List[dict]:
+    encoded = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            encoded.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            # OTLP/JSON carries 64-bit integers as strings
+            encoded.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            encoded.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            encoded.append({"key": key, "value": {"stringValue": str(value)}})
+    return encoded
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace id, parent span id, sampled) from a W3C traceparent header, None if malformed"""
+    if not value:
+        return None
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+class Span:
+    __slots__ = (
+        "tracer", "trace_id", "span_id", "parent_id", "name", "kind", "sampled",
+        "start_ns", "end_ns", "attributes", "events", "status", "status_message"
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        sampled: bool,
+        kind: int = SPAN_KIND_INTERNAL,
+        attributes: Optional[Attributes] = None,
+        start_ns: Optional[int] = None
+    ):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Attributes = dict(attributes) if attributes else {}
+        self.events: List[dict] = []
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    @property
+    def recording(self) -> bool:
+        return self.sampled and self.end_ns is None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Attributes):
+        if self.sampled:
+            self.attributes.update(attributes)
+
+    def add_event(self, name: str, attributes: Optional[Attributes] = None, time_ns: Optional[int] = None):
+        if self.sampled:
+            self.events.append({"name": name, "time_ns": time_ns or time.time_ns(), "attributes": attributes or {}})
+
+    def set_error(self, message: str):
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def end(self, end_ns: Optional[int] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if self.sampled:
+            self.tracer._export(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _attributes(self.attributes),
+            "status": {"code": self.status, "message": self.status_message} if self.status else {}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = [
+                {"timeUnixNano": str(e["time_ns"]), "name": e["name"], "attributes": _attributes(e["attributes"])}
+                for e in self.events
+            ]
+        return span
+
+class _NoopSpan:
+    """Stands in for every span while tracing is disabled, so call sites need no checks"""
+    recording = False
+    sampled = False
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Attributes):
+        pass
+
+    def add_event(self, name: str, attributes: Optional[Attributes] = None, time_ns: Optional[int] = None):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def end(self, end_ns: Optional[int] = None):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+AnySpan = Union[Span, _NoopSpan]
+Parent = Union[Span, _NoopSpan, str, None]
+
+_current: ContextVar[Optional[Span]] = ContextVar("mcp_trace_span", default=None)
+
+class Tracer:
+    """Creates spans and exports the sampled ones in batches from a background task.
+
+    Producers never block: spans are dropped (and counted) when the export queue is
+    full or the exporter is not running. Sampling is decided once per trace, at its
+    root span or by the caller's traceparent flags.
+    """
+    def __init__(
+        self,
+        service_name: str,
+        path: Optional[str] = None,
+        endpoint: Optional[str] = None,
+        sample_rate: float = 1.0,
+        resource: Optional[Attributes] = None,
+        queue_size: int = EXPORT_QUEUE_SIZE
+    ):
+        self.path = path
+        self.endpoint = endpoint
+        self.sample_rate = sample_rate
+        self.resource = {"service.name": service_name, **(resource or {})}
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._exporter: Optional[asyncio.Task] = None
+        # Spans taken off the queue but not written yet (flushed by stop()) and the
+        # export of them in progress, if any
+        self._batch: List[Span] = []
+        self._writing: Optional[asyncio.Future] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path or self.endpoint)
+
+    def current(self) -> AnySpan:
+        return _current.get() or NOOP_SPAN
+
+    def start_span(
+        self,
+        name: str,
+        kind: int = SPAN_KIND_INTERNAL,
+        parent: Parent = None,
+        attributes: Optional[Attributes] = None,
+        start_ns: Optional[int] = None
+    ) -> AnySpan:
+        """Start a span under `parent` (a span or traceparent string; default: the current span)"""
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            parent = _current.get()
+
+        if isinstance(parent, Span):
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        else:
+            remote = parse_traceparent(parent) if isinstance(parent, str) else None
+            if remote is not None:
+                trace_id, parent_id, sampled = remote
+            else:
+                trace_id, parent_id = secrets.token_hex(16), None
+                sampled = random.random() < self.sample_rate
+        return Span(self, name, trace_id, parent_id, sampled, kind, attributes, start_ns)
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        kind: int = SPAN_KIND_INTERNAL,
+        parent: Parent = None,
+        attributes: Optional[Attributes] = None
+    ):
+        """Run a block inside a new current span; exceptions mark it as failed"""
+        span = self.start_span(name, kind, parent, attributes)
+        if span is NOOP_SPAN:
+            yield span
+            return
+        token = _current.set(span)
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.set_error("cancelled")
+            raise
+        except BaseException as e:
+            span.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+
+    def _export(self, span: Span):
+        if self._queue is None:
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait(span)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _document(self, spans: List[Span]) -> str:
+        return json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": _attributes(self.resource)},
+                "scopeSpans": [{
+                    "scope": {"name": "mcp_bridge"},
+                    "spans": [s.to_otlp() for s in spans]
+                }]
+            }]
+        }, separators=(",", ":"))
+
+    def _write(self, document: str):
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(document + "\n")
+        if self.endpoint:
+            request = urllib.request.Request(
+                self.endpoint,
+                data=document.encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST"
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+
+    async def _drain(self):
+        while True:
+            self._batch = batch = [await self._queue.get()]
+            # Let a burst of spans (one tool call makes several) settle into one document
+            await asyncio.sleep(EXPORT_INTERVAL)
+            while len(batch) < EXPORT_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            # Shielded: cancelling the exporter must not lose track of a write already under way
+            self._writing = asyncio.ensure_future(asyncio.to_thread(self._write, self._document(batch)))
+            try:
+                await asyncio.shield(self._writing)
+            except Exception as e:
+                self.dropped += len(batch)
+                log.warning("⚠️  Failed to export %d span(s): %s", len(batch), e)
+            self._batch, self._writing = [], None
+
+    def start(self):
+        if self.enabled and self._exporter is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._exporter = asyncio.create_task(self._drain())
+            log.info("🧵 Tracing to %s", " and ".join(filter(None, (self.path, self.endpoint))))
+
+    async def stop(self):
+        if self._exporter is None:
+            return
+        self._exporter.cancel()
+        try:
+            await self._exporter
+        except asyncio.CancelledError:
+            pass
+        self._exporter = None
+        # Export whatever is still queued, including a batch cut off mid-export unless
+        # that export completed after all
+        remaining, self._batch = self._batch, []
+        if self._writing is not None:
+            try:
+                await self._writing
+                remaining = []
+            except Exception:
+                pass
+            self._writing = None
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        self._queue = None
+        if remaining:
+            try:
+                await asyncio.to_thread(self._write, self._document(remaining))
+            except Exception as e:
+                log.warning("⚠️  Failed to export %d span(s): %s", len(remaining), e)